@@ -0,0 +1,75 @@
+# Repository and handler benchmarks on seeded synthetic data. Prints a
+# table, optionally writes the results as JSON, and exits with 1 when a
+# threshold from benchmarks/thresholds.json is exceeded.
+#
+#   cd src && python -m benchmarks --scale large --output results.json
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+from .dataset import SCALES, seed
+from .suite import check_thresholds, run_suite
+
+THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks")
+parser.add_argument("--scale", choices=SCALES, default="small")
+parser.add_argument("--iterations", type=int, default=200)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--only", nargs="*", help="case names to run")
+parser.add_argument("--output", help="write the results to this json file")
+parser.add_argument("--thresholds", default=THRESHOLDS)
+parser.add_argument("--no-thresholds", action="store_true")
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as directory:
+    sqlite_file = os.path.join(directory, "data.db")
+    dataset = seed(sqlite_file, SCALES[args.scale], args.seed)
+    print(
+        f"seeded {args.scale}: {len(dataset.chat_ids)} users, "
+        f"{SCALES[args.scale].timelogs} timelogs in {dataset.seed_time:.1f}s",
+        file=sys.stderr,
+    )
+    results = run_suite(sqlite_file, dataset, args.iterations, args.seed, args.only)
+
+print(
+    f"{'case':<40}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    f"{'ops/s':>12}",
+)
+for r in results:
+    print(
+        f"{r.name:<40}{r.mean_ms:>10.3f}{r.p50_ms:>10.3f}{r.p95_ms:>10.3f}"
+        f"{r.p99_ms:>10.3f}{r.ops_per_second:>12.0f}",
+    )
+
+failures = []
+if not args.no_thresholds:
+    with open(args.thresholds) as file:
+        failures = check_thresholds(results, json.load(file).get(args.scale, {}))
+
+if args.output:
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "scale": args.scale,
+                "seed": args.seed,
+                "iterations": args.iterations,
+                "time": int(time.time()),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "results": [asdict(r) for r in results],
+                "failures": failures,
+            },
+            file,
+            indent=2,
+        )
+
+for failure in failures:
+    print(f"threshold exceeded: {failure}", file=sys.stderr)
+sys.exit(1 if failures else 0)
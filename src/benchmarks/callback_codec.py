@@ -0,0 +1,86 @@
+# Encode and decode cost of callback_data, compact codec against the old
+# JSON encoding. "cold" cases bypass the memoization, as for a button seen
+# for the first time.
+#
+#   cd src && python -m benchmarks.callback_codec
+import argparse
+import json
+import timeit
+from typing import Any, Dict, List
+
+import callback_consts
+
+CHAT_ID = -1001234567890
+METADATA = {"task_id": 123456, "task_name": "نوشتن گزارش"}
+
+
+def legacy_encode() -> str:
+    return json.dumps(
+        {"action": callback_consts.START_TASK_TIMER.name, "chat_id": CHAT_ID}
+        | METADATA,
+    )
+
+
+def compact_encode() -> str:
+    return callback_consts.encode_callback_data(
+        callback_consts.START_TASK_TIMER.name,
+        CHAT_ID,
+        METADATA,
+    )
+
+
+def compact_encode_cold() -> str:
+    payload = callback_consts.encode_payload.__wrapped__(
+        callback_consts.START_TASK_TIMER.name,
+        CHAT_ID,
+        tuple(METADATA.items()),
+    )
+    return callback_consts.COMPACT_PREFIX + callback_consts.b64encode(payload)
+
+
+def compact_decode_cold(data: str) -> Dict[str, Any]:
+    prefix = len(callback_consts.COMPACT_PREFIX)
+    return callback_consts.decode_payload(callback_consts.b64decode(data[prefix:]))
+
+
+def measure(number: int) -> List[Dict[str, Any]]:
+    legacy = legacy_encode()
+    compact = compact_encode()
+    cases = [
+        ("json encode", legacy_encode, legacy),
+        ("compact encode", compact_encode, compact),
+        ("compact encode cold", compact_encode_cold, compact),
+        ("json decode", lambda: json.loads(legacy), legacy),
+        (
+            "compact decode",
+            lambda: callback_consts.decode_callback_data(compact),
+            compact,
+        ),
+        ("compact decode cold", lambda: compact_decode_cold(compact), compact),
+    ]
+    results = []
+    for name, func, data in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        results.append(
+            {
+                "case": name,
+                "ns_per_op": seconds / number * 1e9,
+                "bytes": len(data.encode()),
+            },
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    results = measure(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':<22}{'ns/op':>10}{'bytes':>8}")
+        for r in results:
+            print(f"{r['case']:<22}{r['ns_per_op']:>10.0f}{r['bytes']:>8}")
@@ -0,0 +1,73 @@
+# Throughput of TimarBot against the number of active chats, handling
+# updates one at a time (python-telegram-bot's default) and concurrently
+# across chats with PerChatUpdateProcessor. Every Bot API call takes
+# --min-latency to --max-latency seconds, so one at a time the bot is bound
+# by round trips however many chats are waiting.
+#
+#   cd src && python -m benchmarks.chat_scaling --chats 1 10 100 500
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+from typing import Any, Dict, List
+
+from .load_test import measure, parser
+
+
+def run(options: List[str]) -> Dict[str, Any]:
+    args = parser().parse_args(options)
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(measure(args, f"{directory}/data.db"))
+
+
+if __name__ == "__main__":
+    scaling = argparse.ArgumentParser()
+    scaling.add_argument("--chats", type=int, nargs="+", default=[1, 10, 50, 200])
+    scaling.add_argument("--duration", type=float, default=10)
+    scaling.add_argument("--think-time", type=float, default=0.5)
+    # a virtual user sometimes sends input nobody asked for and gets no reply
+    scaling.add_argument("--reply-timeout", type=float, default=2.0)
+    scaling.add_argument("--min-latency", type=float, default=0.02)
+    scaling.add_argument("--max-latency", type=float, default=0.05)
+    scaling.add_argument("--concurrent-updates", type=int, default=64)
+    scaling.add_argument("--output", help="write the results to this json file")
+    args = scaling.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    results = []
+    print(
+        f"{'chats':>6}{'mode':>12}{'replies/s':>12}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'unanswered':>12}",
+    )
+    for chats in args.chats:
+        for mode, concurrent_updates in (
+            ("sequential", 1),
+            ("per-chat", args.concurrent_updates),
+        ):
+            result = run(
+                [
+                    f"--users={chats}",
+                    f"--duration={args.duration}",
+                    f"--think-time={args.think_time}",
+                    f"--reply-timeout={args.reply_timeout}",
+                    f"--min-latency={args.min_latency}",
+                    f"--max-latency={args.max_latency}",
+                    f"--concurrent-updates={concurrent_updates}",
+                    # per chat limits are not what is measured here
+                    "--chat-rate=1000",
+                    "--chat-burst=1000",
+                ],
+            )
+            result.update(chats=chats, mode=mode)
+            results.append(result)
+            print(
+                f"{chats:>6}{mode:>12}{result['replies_per_second']:>12.1f}"
+                f"{result['p50_ms']:>10.0f}{result['p95_ms']:>10.0f}"
+                f"{result['unanswered']:>12}",
+                flush=True,
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
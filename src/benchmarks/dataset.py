@@ -0,0 +1,119 @@
+import random
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+from db.migrations import run_migrations
+from db.rollup import rebuild_daily_rollup
+
+DAY = 86400
+
+
+@dataclass
+class Scale:
+    users: int
+    timelogs: int
+    epics_per_user: int = 3
+    tasks_per_epic: int = 5
+    # share of users with a timer running
+    running: float = 0.1
+    # timelogs are spread over this many days before now
+    days: int = 90
+
+
+SCALES: Dict[str, Scale] = {
+    "small": Scale(users=100, timelogs=10_000),
+    "medium": Scale(users=1_000, timelogs=100_000),
+    "large": Scale(users=10_000, timelogs=1_000_000),
+}
+
+
+@dataclass
+class Dataset:
+    chat_ids: List[int]
+    task_ids: List[int]
+    running_timelogs: int
+    seed_time: float
+    # chat id -> its task ids
+    tasks_by_chat: Dict[int, List[int]] = field(default_factory=dict)
+
+
+# Fills an empty database with synthetic users, epics, tasks and timelogs.
+# The same scale and seed always give the same rows, relative to now.
+def seed(sqlite_file: str, scale: Scale, seed: int = 0) -> Dataset:
+    started_at = time.perf_counter()
+    rng = random.Random(seed)
+    now = int(time.time())
+    conn = sqlite3.connect(sqlite_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    run_migrations(conn)
+
+    chat_ids = [100_000 + user for user in range(scale.users)]
+    conn.executemany(
+        "INSERT INTO epic (id, chat_id, name, description) VALUES (?, ?, ?, '')",
+        (
+            (user * scale.epics_per_user + i + 1, chat_id, f"epic {i}")
+            for user, chat_id in enumerate(chat_ids)
+            for i in range(scale.epics_per_user)
+        ),
+    )
+    epics = scale.users * scale.epics_per_user
+    conn.executemany(
+        "INSERT INTO task (id, name, description, epic_id, done) VALUES (?, ?, '', ?, ?)",
+        (
+            (
+                epic * scale.tasks_per_epic + i + 1,
+                f"task {i}",
+                epic + 1,
+                rng.random() < 0.3,
+            )
+            for epic in range(epics)
+            for i in range(scale.tasks_per_epic)
+        ),
+    )
+    tasks_per_user = scale.epics_per_user * scale.tasks_per_epic
+    task_ids = list(range(1, epics * scale.tasks_per_epic + 1))
+
+    def timelogs() -> Iterator[Tuple[int, int, int, str]]:
+        for _ in range(scale.timelogs):
+            start = now - rng.randrange(scale.days * DAY)
+            end = min(now, start + rng.randrange(60, 3 * 3600))
+            yield rng.choice(task_ids), start, end, "DONE"
+
+    conn.executemany(
+        "INSERT INTO timelog (task_id, start, end, status) VALUES (?, ?, ?, ?)",
+        timelogs(),
+    )
+    running_users = rng.sample(range(scale.users), int(scale.users * scale.running))
+    conn.executemany(
+        """
+        INSERT INTO timelog (task_id, start, status, chat_id, message_id)
+        VALUES (?, ?, 'IN_PROGRESS', ?, ?)
+        """,
+        (
+            (
+                user * tasks_per_user + rng.randrange(tasks_per_user) + 1,
+                now - rng.randrange(5 * 3600),
+                chat_ids[user],
+                rng.randrange(1, 1 << 30),
+            )
+            for user in running_users
+        ),
+    )
+    rebuild_daily_rollup(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    return Dataset(
+        chat_ids=chat_ids,
+        task_ids=task_ids,
+        running_timelogs=len(running_users),
+        seed_time=time.perf_counter() - started_at,
+        tasks_by_chat={
+            chat_id: task_ids[user * tasks_per_user : (user + 1) * tasks_per_user]
+            for user, chat_id in enumerate(chat_ids)
+        },
+    )
@@ -0,0 +1,122 @@
+# End-to-end throughput and tail latency of TimarBot on the real Application
+# stack, polling a local fake Bot API driven by virtual users. Latency is
+# from an update being queued on the fake API to the bot's first reply in
+# that chat, so it includes getUpdates, dispatch, the database and the
+# outbound scheduler.
+#
+#   cd src && python -m benchmarks.load_test --users 1000 --duration 30
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from typing import Any, Dict
+
+from telegram.ext import Application
+
+import db
+from bot import TimarBot
+from fake_bot_api import FakeBotAPI, run_users
+from outbound import OutboundScheduler
+from update_processor import PerChatUpdateProcessor
+
+TOKEN = "1:loadtest"
+
+
+async def measure(args: argparse.Namespace, sqlite_file: str) -> Dict[str, Any]:
+    api = FakeBotAPI(
+        latency=(args.min_latency, args.max_latency),
+        rate_limit_probability=args.rate_limit_probability,
+        chat_rate_limit=args.chat_rate_limit,
+        seed=args.seed,
+    )
+    await api.start()
+
+    db.initialize_repos(sqlite_file, do_migration=True)
+    processor: Any = args.concurrent_updates
+    if args.concurrent_updates > 1 and not args.unordered:
+        processor = PerChatUpdateProcessor(args.concurrent_updates)
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(api.base_url)
+        .concurrent_updates(processor)
+        .connection_pool_size(args.outbound_concurrency)
+        .build()
+    )
+    TimarBot(
+        application,
+        admin_id=1,
+        outbound=OutboundScheduler(
+            global_rate=args.global_rate,
+            chat_rate=args.chat_rate,
+            chat_burst=args.chat_burst,
+            concurrency=args.outbound_concurrency,
+        ),
+    )
+    await application.initialize()
+    await application.start()
+    assert application.updater is not None
+    await application.updater.start_polling(poll_interval=0)
+
+    started_at = time.perf_counter()
+    cpu_before = time.process_time()
+    users = await run_users(
+        api,
+        args.users,
+        args.duration,
+        think_time=args.think_time,
+        reply_timeout=args.reply_timeout,
+        seed=args.seed,
+    )
+    elapsed = time.perf_counter() - started_at
+    cpu = time.process_time() - cpu_before
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+    if db.executor is not None:
+        db.executor.shutdown()
+    if db.connection_manager is not None:
+        db.connection_manager.close()
+
+    summary = api.stats.summary(elapsed)
+    summary["actions"] = sum(user.actions for user in users)
+    summary["unanswered"] = sum(user.unanswered for user in users)
+    summary["cpu_percent"] = cpu / elapsed * 100
+    if isinstance(processor, PerChatUpdateProcessor):
+        summary["serialized"] = processor.serialized
+    return summary
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--think-time", type=float, default=2.0)
+    parser.add_argument("--reply-timeout", type=float, default=10.0)
+    parser.add_argument("--min-latency", type=float, default=0.01)
+    parser.add_argument("--max-latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--chat-rate-limit", type=float, default=None)
+    # 1 handles updates one at a time, like python-telegram-bot's default
+    parser.add_argument("--concurrent-updates", type=int, default=64)
+    # without per chat ordering, as python-telegram-bot does it
+    parser.add_argument("--unordered", action="store_true")
+    parser.add_argument("--global-rate", type=float, default=1000)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--outbound-concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = asyncio.run(measure(args, f"{directory}/data.db"))
+    print(json.dumps(result, indent=2))
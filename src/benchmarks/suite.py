@@ -0,0 +1,224 @@
+import asyncio
+import random
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from telegram import Chat, Message, Update
+from telegram.ext import Application
+
+import callback_consts
+import db
+from bot import TimarBot
+from outbound import OutboundScheduler
+
+from .dataset import Dataset
+
+
+@dataclass
+class Result:
+    name: str
+    iterations: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    ops_per_second: float
+
+
+def summarize(name: str, timings: List[float]) -> Result:
+    timings = sorted(timings)
+
+    def percentile(p: float) -> float:
+        return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+    total = sum(timings)
+    return Result(
+        name=name,
+        iterations=len(timings),
+        mean_ms=total / len(timings) * 1000,
+        p50_ms=statistics.median(timings) * 1000,
+        p95_ms=percentile(0.95),
+        p99_ms=percentile(0.99),
+        max_ms=timings[-1] * 1000,
+        ops_per_second=len(timings) / total if total else 0.0,
+    )
+
+
+class FakeBot:
+    # answers like the Bot API without the network
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def send_message(self, chat_id: int, **_: Any) -> Message:
+        self.calls += 1
+        return Message(self.calls, None, Chat(chat_id, Chat.PRIVATE))  # type: ignore
+
+    async def edit_message_text(self, chat_id: int, **_: Any) -> Message:
+        self.calls += 1
+        return Message(self.calls, None, Chat(chat_id, Chat.PRIVATE))  # type: ignore
+
+
+# Each case runs against a database seeded by dataset.seed and picks its
+# chat, task or timelog at random per iteration from a seeded generator.
+class Suite:
+    def __init__(
+        self,
+        sqlite_file: str,
+        dataset: Dataset,
+        iterations: int,
+        seed: int = 0,
+    ):
+        self.dataset = dataset
+        self.iterations = iterations
+        self.random = random.Random(seed)
+        db.initialize_repos(sqlite_file, do_migration=False, entity_cache=False)
+        self.cases: Dict[str, Callable[[], Awaitable[Result]]] = {
+            "task_repo.get_undone_by_chat_id": self.get_undone_by_chat_id,
+            "timelog_repo.get_in_progress_logs": self.get_in_progress_logs,
+            "report_repo.get_chat_report_by_days": self.get_chat_report_by_days,
+            "callback_button.aggregate": self.aggregate,
+            "bot.handle_callback": self.handle_callback,
+        }
+
+    def chat_id(self) -> int:
+        return self.random.choice(self.dataset.chat_ids)
+
+    def measure(self, name: str, func: Callable[[], Any], warmup: int = 5) -> Result:
+        for _ in range(warmup):
+            func()
+        timings = []
+        for _ in range(self.iterations):
+            started_at = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started_at)
+        return summarize(name, timings)
+
+    async def get_undone_by_chat_id(self) -> Result:
+        assert db.task_repo is not None
+        repo = db.task_repo
+        return self.measure(
+            "task_repo.get_undone_by_chat_id",
+            lambda: repo.get_undone_by_chat_id(self.chat_id()),
+        )
+
+    async def get_in_progress_logs(self) -> Result:
+        assert db.timelog_repo is not None
+        return self.measure(
+            "timelog_repo.get_in_progress_logs",
+            db.timelog_repo.get_in_progress_logs,
+        )
+
+    async def get_chat_report_by_days(self) -> Result:
+        assert db.report_repo is not None
+        repo = db.report_repo
+        return self.measure(
+            "report_repo.get_chat_report_by_days",
+            lambda: repo.get_chat_report_by_days(self.chat_id(), 30),
+        )
+
+    async def aggregate(self) -> Result:
+        def run() -> None:
+            chat_id = self.chat_id()
+            buttons = []
+            for task_id in self.dataset.tasks_by_chat[chat_id]:
+                button = callback_consts.SHOW_TASK_OPERATION_MENU.copy()
+                button.add_metadata({"task_id": task_id})
+                button.set_text(f"task {task_id}")
+                buttons.append(button)
+            callback_consts.CallbackButton.aggregate(buttons, chat_id)
+
+        return self.measure("callback_button.aggregate", run)
+
+    async def handle_callback(self) -> Result:
+        # decode, route, query the tasks and edit the message in place
+        application = Application.builder().token("1:benchmark").build()
+        bot = TimarBot(
+            application,
+            admin_id=1,
+            outbound=OutboundScheduler(
+                global_rate=1e9,
+                chat_rate=1e9,
+                chat_burst=1e9,
+            ),
+        )
+        context: Any = SimpleNamespace(bot=FakeBot())
+
+        def update(chat_id: int) -> Update:
+            data = callback_consts.TASK_MANAGEMENT.button(chat_id)["callback_data"]
+            return Update.de_json(
+                {
+                    "update_id": 1,
+                    "callback_query": {
+                        "id": "1",
+                        "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+                        "chat_instance": "1",
+                        "data": data,
+                        "message": {
+                            "message_id": 1,
+                            "date": 0,
+                            "chat": {"id": chat_id, "type": "private"},
+                            "text": "menu",
+                        },
+                    },
+                },
+                None,  # type: ignore[arg-type]
+            )
+
+        for _ in range(5):
+            await bot.handle_callback(update(self.chat_id()), context)
+        timings = []
+        for _ in range(self.iterations):
+            request = update(self.chat_id())
+            started_at = time.perf_counter()
+            await bot.handle_callback(request, context)
+            timings.append(time.perf_counter() - started_at)
+        await bot.outbound.stop()
+        return summarize("bot.handle_callback", timings)
+
+    async def run(self, only: Optional[List[str]] = None) -> List[Result]:
+        results = []
+        for name, case in self.cases.items():
+            if only and name not in only:
+                continue
+            results.append(await case())
+        return results
+
+    def close(self) -> None:
+        if db.executor is not None:
+            db.executor.shutdown()
+        if db.connection_manager is not None:
+            db.connection_manager.close()
+
+
+# thresholds: case name -> metric -> the highest acceptable value
+def check_thresholds(
+    results: List[Result],
+    thresholds: Dict[str, Dict[str, float]],
+) -> List[str]:
+    failures = []
+    for result in results:
+        values = asdict(result)
+        for metric, limit in thresholds.get(result.name, {}).items():
+            if values[metric] > limit:
+                failures.append(
+                    f"{result.name} {metric} {values[metric]:.3f} > {limit}",
+                )
+    return failures
+
+
+def run_suite(
+    sqlite_file: str,
+    dataset: Dataset,
+    iterations: int,
+    seed: int = 0,
+    only: Optional[List[str]] = None,
+) -> List[Result]:
+    suite = Suite(sqlite_file, dataset, iterations, seed)
+    try:
+        return asyncio.run(suite.run(only))
+    finally:
+        suite.close()
@@ -0,0 +1,157 @@
+# Compares update latency and idle CPU of polling and webhook mode against a
+# local stand-in for the Bot API. The stand-in runs in the same process, so
+# its CPU time is part of the idle numbers of both modes.
+#
+#   cd src && python -m benchmarks.webhook_vs_polling
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, ContextTypes, MessageHandler, filters
+
+from fake_bot_api import FakeBotAPI
+from webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+TOKEN = "1:benchmark"
+SECRET = "benchmark"
+
+
+def message_update(update_id: int) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "user"},
+            "text": "ping",
+        },
+    }
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.sent_at: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def handle(self, update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+        self.latencies.append(time.perf_counter() - self.sent_at[update.update_id])
+        if len(self.latencies) == self.expected:
+            self.done.set()
+
+
+async def measure(
+    mode: str,
+    updates: int,
+    gap: float,
+    idle: float,
+    poll_interval: float,
+) -> Dict[str, Any]:
+    api = FakeBotAPI(long_poll=mode == "polling (long poll)")
+    await api.start()
+    recorder = Recorder()
+    recorder.expected = updates
+
+    builder = Application.builder().token(TOKEN).base_url(api.base_url)
+    webhook: Optional[WebhookServer] = None
+    if mode == "webhook":
+        builder = builder.updater(None)
+    application = builder.build()
+    application.add_handler(MessageHandler(filters.ALL, recorder.handle))
+    await application.initialize()
+    await application.start()
+    if mode == "webhook":
+        webhook = WebhookServer(application, "127.0.0.1", 0, secret_token=SECRET)
+        await webhook.start()
+    else:
+        assert application.updater is not None
+        await application.updater.start_polling(poll_interval=poll_interval)
+
+    # let start up settle before measuring idle CPU
+    await asyncio.sleep(0.5)
+    calls_before = api.stats.calls["getUpdates"]
+    cpu_before = time.process_time()
+    await asyncio.sleep(idle)
+    idle_cpu = (time.process_time() - cpu_before) / idle
+    idle_polls = (api.stats.calls["getUpdates"] - calls_before) / idle
+
+    async with httpx.AsyncClient() as client:
+        for update_id in range(1, updates + 1):
+            update = message_update(update_id)
+            recorder.sent_at[update_id] = time.perf_counter()
+            if webhook is not None:
+                await client.post(
+                    f"http://127.0.0.1:{webhook.server.port}/webhook",
+                    content=json.dumps(update),
+                    headers={SECRET_TOKEN_HEADER: SECRET},
+                )
+            else:
+                api.push(update)
+            await asyncio.sleep(random.uniform(0, 2 * gap))
+        await asyncio.wait_for(recorder.done.wait(), timeout=60)
+
+    if webhook is not None:
+        await webhook.stop()
+    elif application.updater is not None:
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+
+    latencies = sorted(recorder.latencies)
+    return {
+        "mode": mode,
+        "updates": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "idle_cpu_percent": idle_cpu * 100,
+        "idle_requests_per_second": idle_polls,
+    }
+
+
+async def main(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    random.seed(args.seed)
+    results = []
+    for mode in ("polling (long poll)", "polling (short poll)", "webhook"):
+        results.append(
+            await measure(mode, args.updates, args.gap, args.idle, args.poll_interval),
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument(
+        "--gap", type=float, default=0.05, help="mean seconds between updates"
+    )
+    parser.add_argument(
+        "--idle", type=float, default=5, help="seconds of idle to measure"
+    )
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(
+            f"{'mode':<22}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+            f"{'idle cpu %':>12}{'idle req/s':>12}",
+        )
+        for r in results:
+            print(
+                f"{r['mode']:<22}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['max_ms']:>9.1f}"
+                f"{r['idle_cpu_percent']:>12.2f}{r['idle_requests_per_second']:>12.1f}",
+            )
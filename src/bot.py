@@ -1,11 +1,16 @@
 import asyncio
-import json
+import io
 import logging
+import tempfile
 import time
+from collections import Counter
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from types import CodeType
+from typing import Any, Awaitable, Dict, Optional, Tuple
 
 from telegram import Message, ReplyKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -16,19 +21,44 @@ from telegram.ext import (
 )
 
 import callback_consts
+import dispatch
+import export
 import job
+import log
 import message_consts
+import metrics
+import profiler
 from db import Epic, IEpicRepo, ITaskRepo, ITimelogRepo, IUserStateRepo, Task, UserState
+from db.cache import LRUCache
+from outbound import OutboundScheduler, Priority
+from webhook import WebhookServer
 
 logger = logging.getLogger(__name__)
 import db
 
+MAIN_MENU_KEYBOARD = {"keyboard": [["منوی اصلی"]], "is_persistent": True}
+
+callback_routes = dispatch.Router()
+command_routes = dispatch.Router()
+
+# the callback action or command being handled, for per handler counters
+current_handler: ContextVar[str] = ContextVar("current_handler", default="")
+
+
+def truncate(text: str) -> str:
+    if len(text) > log.MAX_MESSAGE_LENGTH:
+        return text[: log.MAX_MESSAGE_LENGTH - 1] + "…"
+    return text
+
 
 class TimarBot:
     def __init__(
         self,
         application: Application,
         admin_id: int,
+        outbound: Optional[OutboundScheduler] = None,
+        single_round_trip: bool = True,
+        keyboard_cache_size: int = 10000,
     ):
         self.application: Application = application
         self.application.add_handler(
@@ -38,6 +68,45 @@ class TimarBot:
             CallbackQueryHandler(self.handle_callback),
         )
         self.admin_id = admin_id
+        # every Bot API call goes through it, replies before timer edits
+        self.outbound = outbound or OutboundScheduler()
+        self.timer_refresher = job.TimerRefresher(self.outbound)
+        self.single_round_trip = single_round_trip
+        # chats that already have the persistent main menu keyboard; one
+        # evicted just gets it again
+        self.keyboard_chats: LRUCache[int, bool] = LRUCache(keyboard_cache_size)
+        self.api_calls: Counter[Tuple[str, str]] = Counter()
+        self.handler_stats: Dict[str, dispatch.HandlerStats] = {}
+        # text that isn't a command is input for the conversation state
+        self.state_route = dispatch.Route("handle_state", TimarBot.handle_state, ())
+        # started by the admin's /profile, off otherwise
+        self.profiler: Optional[profiler.SamplingProfiler] = None
+        self.profile_task: Optional[asyncio.Task] = None
+
+    def count_api_call(self, method: str) -> None:
+        self.api_calls[(current_handler.get(), method)] += 1
+
+    async def install_main_menu_keyboard(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+        chat_id: int,
+        text: str,
+    ) -> None:
+        # a message can carry only one keyboard, so the persistent reply
+        # keyboard rides on a message that is deleted right away
+        message = await self.outbound.call(
+            Priority.INTERACTIVE,
+            chat_id,
+            lambda: context.bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                reply_markup=MAIN_MENU_KEYBOARD,
+            ),
+        )
+        self.count_api_call("sendMessage")
+        await self.outbound.call(Priority.INTERACTIVE, chat_id, message.delete)
+        self.count_api_call("deleteMessage")
+        self.keyboard_chats.set(chat_id, True)
 
     async def send_message(
         self,
@@ -46,8 +115,8 @@ class TimarBot:
         chat_id: int,
         text: str,
         reply_markup: Optional[dict] = None,
+        update: Optional[Update] = None,
     ) -> Message:
-        default_markup = {"keyboard": [["منوی اصلی"]]}
         if reply_markup is None:
             reply_markup = {}
         if "inline_keyboard" not in reply_markup:
@@ -55,19 +124,56 @@ class TimarBot:
                 [callback_consts.RETURN_TO_MENU],
                 chat_id,
             )
+        # the payloads of the buttons must outlive this process
+        await callback_consts.payload_store.save()
 
-        message = await context.bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            reply_markup=default_markup,
-        )
-        await message.delete()
-        return await context.bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            reply_markup=reply_markup,
+        if not self.single_round_trip:
+            await self.install_main_menu_keyboard(context, chat_id, text)
+        elif (
+            update is not None
+            and update.callback_query is not None
+            and isinstance(update.callback_query.message, Message)
+            and update.callback_query.message.chat.id == chat_id
+        ):
+            # the button's message already sits under the main menu keyboard
+            try:
+                message_id = update.callback_query.message.message_id
+                edited = await self.outbound.call(
+                    Priority.INTERACTIVE,
+                    chat_id,
+                    lambda: context.bot.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        text=text,
+                        reply_markup=reply_markup,
+                    ),
+                    # supersedes a queued timer edit of the same message
+                    coalesce_key=(chat_id, message_id),
+                )
+                self.count_api_call("editMessageText")
+                if isinstance(edited, Message):
+                    return edited
+            except BadRequest as error:
+                # too old to edit, or nothing changed
+                self.count_api_call("editMessageText")
+                logger.debug(f"couldn't edit message in place: {error}")
+        elif self.keyboard_chats.get(chat_id) is None:
+            await self.install_main_menu_keyboard(context, chat_id, text)
+
+        message = await self.outbound.call(
+            Priority.INTERACTIVE,
+            chat_id,
+            lambda: context.bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                reply_markup=reply_markup,
+            ),
         )
+        self.count_api_call("sendMessage")
+        return message
 
+    @command_routes.route("/start", "منوی اصلی")
+    @callback_routes.route(callback_consts.RETURN_TO_MENU.action_id)
     async def handle_start_command(
         self,
         update: Update,
@@ -86,18 +192,20 @@ class TimarBot:
 
         await self.send_message(
             context,
+            update=update,
             chat_id=update.effective_chat.id,
             text="به تیمار خوش آمدید",
             reply_markup=reply_markup,
         )
 
+    @callback_routes.route(callback_consts.EPICS_MANAGEMENT.action_id)
     async def handle_epic_management(
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         chat_id = update.callback_query.message.chat.id
-        user_epics = db.epic_repo.get_by_chat_id(chat_id)
+        user_epics = await db.async_epic_repo.get_by_chat_id(chat_id)
 
         if user_epics:
             text = message_consts.MANAGE_EPIC_MESSAGE
@@ -121,11 +229,13 @@ class TimarBot:
 
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=text,
             reply_markup=reply_markup,
         )
 
+    @command_routes.route("/new_epic")
     async def handle_new_epic(
         self,
         update: Update,
@@ -133,25 +243,34 @@ class TimarBot:
     ) -> None:
         chat_id = update.message.chat.id
         text = message_consts.NEW_EPIC_MESSAGE
-        db.user_state_repo.set_state(chat_id, UserState.CREATE_EPIC)
+        await db.async_user_state_repo.set_state(chat_id, UserState.CREATE_EPIC)
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=text,
         )
 
+    @command_routes.route("/report")
     async def handle_report_initiate(
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         chat_id = update.effective_chat.id
-        db.user_state_repo.set_state(
+        # "/report 7" skips the question
+        _, _, days = (update.message.text or "").partition(" ")
+        if days.strip():
+            await self.send_report(update, context, days)
+            return
+
+        await db.async_user_state_repo.set_state(
             chat_id,
             UserState.REPORT_DURATION,
         )
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.REPORT_GET_DURATION,
         )
@@ -160,21 +279,152 @@ class TimarBot:
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
+    ) -> None:
+        if await self.send_report(update, context, update.message.text or ""):
+            await db.async_user_state_repo.set_state(
+                update.effective_chat.id,
+                UserState.NORMAL,
+            )
+
+    async def send_report(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        days_text: str,
+    ) -> bool:
+        chat_id = update.effective_chat.id
+        try:
+            days = float(days_text.strip())
+        except ValueError:
+            days = 0
+        if not 0 < days <= 3650:
+            await self.send_message(
+                context,
+                update=update,
+                chat_id=chat_id,
+                text=message_consts.REPORT_INVALID_DURATION,
+            )
+            return False
+
+        if days.is_integer():
+            # calendar days, read from the daily rollup
+            report = await db.async_report_repo.get_chat_report_by_days(
+                chat_id,
+                int(days),
+            )
+        else:
+            until = datetime.now()
+            report = await db.async_report_repo.get_chat_report(
+                chat_id,
+                since=until - timedelta(days=days),
+                until=until,
+            )
+        await self.send_message(
+            context,
+            update=update,
+            chat_id=chat_id,
+            text=self.format_report(report, days),
+        )
+        return True
+
+    def format_report(self, report: db.Report, days: float) -> str:
+        days_text = f"{days:g}"
+        if not report.epics:
+            return message_consts.REPORT_EMPTY.format(days=days_text)
+
+        lines = [
+            message_consts.REPORT_HEADER.format(
+                days=days_text,
+                duration=db.format_duration(report.seconds),
+            ),
+        ]
+        for epic in report.epics:
+            lines.append(
+                message_consts.REPORT_EPIC.format(
+                    name=epic.epic_name,
+                    duration=db.format_duration(epic.seconds),
+                ),
+            )
+            for task in epic.tasks:
+                template = (
+                    message_consts.REPORT_TASK_RUNNING
+                    if task.running
+                    else message_consts.REPORT_TASK
+                )
+                lines.append(
+                    template.format(
+                        name=task.task_name,
+                        duration=db.format_duration(task.seconds),
+                    ),
+                )
+        return "\n".join(lines)
+
+    @command_routes.route("/export")
+    async def handle_export(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         chat_id = update.effective_chat.id
-        db.user_state_repo.set_state(chat_id, UserState.NORMAL)
-        duration = timedelta(days=float(update.message.text))
+        try:
+            fmt, compress = export.parse_export_args(update.message.text or "")
+        except ValueError:
+            await self.send_message(
+                context,
+                update=update,
+                chat_id=chat_id,
+                text=message_consts.EXPORT_USAGE,
+            )
+            return
+
+        # rows are streamed into a file on disk rather than built in memory
+        with tempfile.TemporaryFile() as file:
+            count = await db.async_export_repo.export_chat_history(
+                chat_id,
+                lambda rows: export.write_export(
+                    rows,
+                    db.EXPORT_COLUMNS,
+                    file,
+                    fmt,
+                    compress,
+                ),
+            )
+            if count == 0:
+                await self.send_message(
+                    context,
+                    update=update,
+                    chat_id=chat_id,
+                    text=message_consts.EXPORT_EMPTY,
+                )
+                return
+
+            filename = export.export_filename(fmt, compress, datetime.now())
 
+            def send_document() -> Awaitable[Message]:
+                # rewind on every attempt, a retry reads the file again
+                file.seek(0)
+                return context.bot.send_document(
+                    chat_id=chat_id,
+                    document=file,
+                    filename=filename,
+                    caption=message_consts.EXPORT_CAPTION.format(count=count),
+                )
+
+            await self.outbound.call(Priority.INTERACTIVE, chat_id, send_document)
+            self.count_api_call("sendDocument")
+
+    @callback_routes.route(callback_consts.TASK_MANAGEMENT.action_id)
     async def handle_task_management(
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         chat_id = update.effective_chat.id
-        tasks = db.task_repo.get_undone_by_chat_id(chat_id)
+        tasks = await db.async_task_repo.get_undone_by_chat_id(chat_id)
         if not tasks:
             await self.send_message(
                 context,
+                update=update,
                 chat_id=chat_id,
                 text=message_consts.MANAGE_TASK_EMPTY_MESSAGE,
             )
@@ -189,6 +439,7 @@ class TimarBot:
         reply_markup = {"inline_keyboard": buttons}
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.MANAGE_TASK_MESSAGE,
             reply_markup=reply_markup,
@@ -208,16 +459,21 @@ class TimarBot:
             description = ""
         chat_id = update.message.chat.id
 
-        db.epic_repo.create(
-            Epic(name=title, description=description, chat_id=chat_id),
-        )
-        db.user_state_repo.set_state(chat_id, UserState.NORMAL)
+        def create_epic() -> None:
+            db.epic_repo.create(
+                Epic(name=title, description=description, chat_id=chat_id),
+            )
+            db.user_state_repo.set_state(chat_id, UserState.NORMAL)
+
+        await db.run_in_transaction(create_epic)
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.NEW_EPIC_CREATED.format(name=title),
         )
 
+    @command_routes.route("/new_task")
     async def handle_new_task(
         self,
         update: Update,
@@ -227,10 +483,11 @@ class TimarBot:
         text = update.message.text.split("\n")
         title = text[0].strip()
 
-        user_epics = db.epic_repo.get_by_chat_id(chat_id)
+        user_epics = await db.async_epic_repo.get_by_chat_id(chat_id)
         if not user_epics:
             await self.send_message(
                 context,
+                update=update,
                 chat_id=chat_id,
                 text=message_consts.NO_EPIC_MESSAGE,
             )
@@ -251,11 +508,16 @@ class TimarBot:
         }
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.SELECT_EPIC_FOR_NEW_TASK,
             reply_markup=reply_markup,
         )
 
+    @callback_routes.route(
+        callback_consts.SELECT_EPIC_FOR_TASK.action_id,
+        args=(dispatch.DATA,),
+    )
     async def handle_selected_epic_for_new_task(
         self,
         update: Update,
@@ -263,13 +525,14 @@ class TimarBot:
         callback_data: dict,
     ) -> None:
         # should go to set title and description
-        db.user_state_repo.set_state(
+        await db.async_user_state_repo.set_state(
             update.effective_chat.id,
             UserState.CREATE_TASK,
             metadata={"epic_id": callback_data["epic_id"]},
         )
         await self.send_message(
             context,
+            update=update,
             chat_id=update.effective_chat.id,
             text=message_consts.SEND_TASK_TITLE_AND_DESCRIPTION,
         )
@@ -281,22 +544,28 @@ class TimarBot:
     ) -> None:
         text = update.message.text.split("\n")
         chat_id = update.effective_chat.id
-        metadata = db.user_state_repo.get_state_and_metadata(chat_id)[1]
+        _, metadata = await db.async_user_state_repo.get_state_and_metadata(chat_id)
 
         title = text[0].strip()
         description = "\n".join(text[1:]).strip()
         chat_id = update.message.chat.id
         epic_id = metadata["epic_id"]
-        db.task_repo.create(
-            Task(name=title, description=description, epic_id=epic_id),
-        )
-        db.user_state_repo.set_state(chat_id, UserState.NORMAL)
+
+        def create_task() -> None:
+            db.task_repo.create(
+                Task(name=title, description=description, epic_id=epic_id),
+            )
+            db.user_state_repo.set_state(chat_id, UserState.NORMAL)
+
+        await db.run_in_transaction(create_task)
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.NEW_TASK_CREATED.format(name=title),
         )
 
+    @callback_routes.route(callback_consts.EPIC_MENU.action_id, args=(dispatch.DATA,))
     async def handle_epic_menu(
         self,
         update: Update,
@@ -305,7 +574,7 @@ class TimarBot:
     ) -> None:
         chat_id = update.effective_chat.id
         epic_id = callback_data["epic_id"]
-        epic = db.epic_repo.get_by_id(epic_id)
+        epic = await db.async_epic_repo.get_by_id(epic_id)
         text = message_consts.EDIT_EPIC.format(
             name=epic.name,
             description=epic.description,
@@ -329,11 +598,16 @@ class TimarBot:
         reply_markup = {"inline_keyboard": buttons}
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=text,
             reply_markup=reply_markup,
         )
 
+    @callback_routes.route(
+        callback_consts.SHOW_TASK_OPERATION_MENU.action_id,
+        args=(dispatch.DATA,),
+    )
     async def handle_task_operation_menu(
         self,
         update: Update,
@@ -342,7 +616,7 @@ class TimarBot:
     ) -> None:
         chat_id = update.effective_chat.id
         task_id = callback_data["task_id"]
-        task = db.task_repo.get_by_id(task_id)
+        task = await db.async_task_repo.get_by_id(task_id)
         text = message_consts.TASK_OPERATION_MENU.format(
             name=task.name,
             description=task.description,
@@ -370,30 +644,37 @@ class TimarBot:
         reply_markup = {"inline_keyboard": buttons}
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=text,
             reply_markup=reply_markup,
         )
 
+    @callback_routes.route(callback_consts.DELETE_EPIC.action_id, args=("epic_id",))
     async def handle_delete_epic(
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
         epic_id: int,
     ) -> None:
-        epic = db.epic_repo.get_by_id(epic_id)
+        epic = await db.async_epic_repo.get_by_id(epic_id)
         if epic.chat_id != update.effective_chat.id:
             logger.warning(
                 f"User {update.effective_chat.id} tried to delete epic {epic_id} which is not theirs",
             )
             return
-        db.epic_repo.delete(epic_id)
+        await db.async_epic_repo.delete(epic_id)
         await self.send_message(
             context,
+            update=update,
             chat_id=update.effective_chat.id,
             text=message_consts.EPIC_DELETED.format(name=epic.name),
         )
 
+    @callback_routes.route(
+        callback_consts.DELETE_TASK.action_id,
+        args=("task_id", "task_name"),
+    )
     async def handle_delete_task(
         self,
         update: Update,
@@ -402,24 +683,30 @@ class TimarBot:
         task_name: str,
     ) -> None:
         given_chat_id = update.effective_chat.id
-        task_chat_id = db.task_repo.get_owner_chat(task_id)
+        task_chat_id = await db.async_task_repo.get_owner_chat(task_id)
         if task_chat_id != task_chat_id:
             logger.warning(
                 f"User {given_chat_id} tried to delete task {task_id} that doesn't belong to them",
             )
             await self.send_message(
                 context,
+                update=update,
                 chat_id=given_chat_id,
                 text=message_consts.UNAUTHORIZED,
             )
 
-        db.task_repo.delete(task_id)
+        await db.async_task_repo.delete(task_id)
         await self.send_message(
             context,
+            update=update,
             chat_id=given_chat_id,
             text=message_consts.TASK_DELETED.format(name=task_name),
         )
 
+    @callback_routes.route(
+        callback_consts.EDIT_TASK.action_id,
+        args=("task_id", "column"),
+    )
     async def handle_edit_task(
         self,
         update: Update,
@@ -428,13 +715,14 @@ class TimarBot:
         column: str,
     ) -> None:
         chat_id = update.effective_chat.id
-        db.user_state_repo.set_state(
+        await db.async_user_state_repo.set_state(
             chat_id,
             UserState.EDIT_TASK,
             metadata={"column": column, "task_id": task_id},
         )
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.GET_INPUT_FOR_TASK_EDIT,
         )
@@ -445,34 +733,34 @@ class TimarBot:
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         value = update.message.text
-        _, metadata = db.user_state_repo.get_state_and_metadata(
+        _, metadata = await db.async_user_state_repo.get_state_and_metadata(
             update.effective_chat.id,
         )
         task_id = metadata["task_id"]
         column = metadata["column"]
 
-        db.task_repo.edit(task_id, column, value)
+        await db.async_task_repo.edit(task_id, column, value)
         await self.send_message(
             context,
+            update=update,
             chat_id=update.effective_chat.id,
             text=message_consts.TASK_EDITED,
         )
 
+    @callback_routes.route(
+        callback_consts.START_TASK_TIMER.action_id,
+        args=(dispatch.DATA,),
+    )
     async def handle_start_task_timer(
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
-        callback_data: Optional[Dict[str, Any]] = None,
+        callback_data: Dict[str, Any],
     ) -> None:
-        if callback_data is None:
-            if update.callback_query is None or update.callback_query.data is None:
-                raise ValueError("No callback data available")
-            callback_data = json.loads(update.callback_query.data)
-
         task_id = int(callback_data["task_id"])
         task_name = str(callback_data["task_name"])
         start_time = datetime.now()
-        timelog_id = db.timelog_repo.create(task_id, start_time)
+        timelog_id = await db.async_timelog_repo.create(task_id, start_time)
         buttons = [
             callback_consts.END_TASK_TIMER.copy().add_metadata(
                 {
@@ -495,6 +783,7 @@ class TimarBot:
         }
         res = await self.send_message(
             context,
+            update=update,
             chat_id=update.effective_chat.id,
             text=message_consts.TASK_TIMER_STARTED.format(
                 name=task_name,
@@ -503,12 +792,25 @@ class TimarBot:
             reply_markup=reply_markup,
         )
 
-        metadata = {"telegram_message": res.to_dict()}
-        db.timelog_repo.set_metadata(
+        await db.async_timelog_repo.set_message(
             timelog_id=timelog_id,
-            metadata=json.dumps(metadata),
+            chat_id=res.chat.id,
+            message_id=res.message_id,
+        )
+        self.timer_refresher.start(
+            job.RunningTimer(
+                timelog_id=timelog_id,
+                chat_id=res.chat.id,
+                message_id=res.message_id,
+                task_name=task_name,
+                start=start_time.timestamp(),
+            ),
         )
 
+    @callback_routes.route(
+        callback_consts.END_TASK_TIMER.action_id,
+        args=(dispatch.DATA,),
+    )
     async def handle_end_task_timer(
         self,
         update: Update,
@@ -516,10 +818,11 @@ class TimarBot:
         data: dict,
     ) -> None:
         end_time = datetime.now()
-        db.timelog_repo.set_end_if_not_exists(data["timelog_id"], end_time)
-        timelog = db.timelog_repo.get_by_id(data["timelog_id"])
-        task = db.task_repo.get_by_id(timelog.task_id)
-        chat_id = json.loads(timelog.metadata)["telegram_message"]["chat"]["id"]
+        self.timer_refresher.stop(data["timelog_id"])
+        await db.async_timelog_repo.set_end_if_not_exists(data["timelog_id"], end_time)
+        timelog = await db.async_timelog_repo.get_by_id(data["timelog_id"])
+        task = await db.async_task_repo.get_by_id(timelog.task_id)
+        chat_id = timelog.chat_id or update.effective_chat.id
 
         reply_markup = {
             "inline_keyboard": callback_consts.CallbackButton.aggregate(
@@ -529,6 +832,7 @@ class TimarBot:
         }
         res = await self.send_message(
             context,
+            update=update,
             chat_id=update.effective_chat.id,
             text=message_consts.TASK_TIMER_ENDED.format(
                 name=task.name,
@@ -537,21 +841,33 @@ class TimarBot:
             reply_markup=reply_markup,
         )
 
+    @callback_routes.route(
+        callback_consts.DELETE_TASK_TIMER.action_id,
+        args=(dispatch.CHAT_ID, "timelog_id"),
+    )
     async def handle_delete_task_timer(
         self,
+        update: Update,
         context: ContextTypes.DEFAULT_TYPE,
         chat_id: int,
         timelog_id: int,
     ) -> None:
-        db.timelog_repo.delete(timelog_id=timelog_id)
+        self.timer_refresher.stop(timelog_id)
+        await db.async_timelog_repo.delete(timelog_id=timelog_id)
         await self.send_message(
             context=context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.TIMELOG_DELETED,
         )
 
+    @callback_routes.route(
+        callback_consts.EDIT_EPIC.action_id,
+        args=(dispatch.CHAT_ID, "epic_id", "column"),
+    )
     async def handle_edit_epic_button(
         self,
+        update: Update,
         context: ContextTypes.DEFAULT_TYPE,
         chat_id: int,
         epic_id: int,
@@ -561,13 +877,14 @@ class TimarBot:
             "epic_id": epic_id,
             "column": column,
         }
-        db.user_state_repo.set_state(
+        await db.async_user_state_repo.set_state(
             chat_id,
             UserState.EDIT_EPIC,
             metadata=state_metadata,
         )
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.GET_INPUT_FOR_EPIC_EDIT,
         )
@@ -578,26 +895,34 @@ class TimarBot:
         chat_id: int,
         value: str,
     ) -> None:
-        user_state, metadata = db.user_state_repo.get_state_and_metadata(chat_id)
+        user_state, metadata = await db.async_user_state_repo.get_state_and_metadata(
+            chat_id
+        )
         epic_id = metadata["epic_id"]
         column = metadata["column"]
-        db.epic_repo.edit(epic_id, column, value)
+        await db.async_epic_repo.edit(epic_id, column, value)
         await self.send_message(
             context,
             chat_id=chat_id,
             text=message_consts.EPIC_EDITED,
         )
 
+    @callback_routes.route(
+        callback_consts.END_TASK.action_id,
+        args=(dispatch.CHAT_ID, "task_id"),
+    )
     async def handle_end_task(
         self,
+        update: Update,
         context: ContextTypes.DEFAULT_TYPE,
         chat_id: int,
         task_id: int,
     ) -> None:
 
-        db.task_repo.edit(task_id, "done", True)
+        await db.async_task_repo.edit(task_id, "done", True)
         await self.send_message(
             context,
+            update=update,
             chat_id=chat_id,
             text=message_consts.TASK_ENDED,
         )
@@ -607,7 +932,7 @@ class TimarBot:
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
-        user_state = db.user_state_repo.get_state(update.effective_chat.id)
+        user_state = await db.async_user_state_repo.get_state(update.effective_chat.id)
         match user_state:
             case UserState.CREATE_EPIC:
                 await self.handle_create_epic(update, context)
@@ -621,11 +946,160 @@ class TimarBot:
                     update.effective_chat.id,
                     update.message.text,
                 )
+            case UserState.REPORT_DURATION:
+                await self.handle_report_duration(update, context)
             case _:
                 logger.warning(
                     f"unknown message {update.message.text}, user state: {user_state}",
                 )
 
+    @command_routes.route("/shutdown")
+    async def handle_shutdown_command(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+    ) -> None:
+        if update.effective_chat.id != self.admin_id:
+            logger.warning(f"unauthorized shutdown {update.effective_chat.id}")
+            return
+        await update.message.reply_text("در حال خاموش کردن بات")
+        self.application.stop_running()
+        await self.application.stop()
+        await self.application.shutdown()
+
+    @command_routes.route("/profile")
+    async def handle_profile_command(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+    ) -> None:
+        chat_id = update.effective_chat.id
+        if chat_id != self.admin_id:
+            logger.warning(f"unauthorized profile {chat_id}")
+            return
+        try:
+            seconds, top = profiler.parse_profile_args(update.message.text or "")
+        except ValueError:
+            await self.send_message(
+                context,
+                update=update,
+                chat_id=chat_id,
+                text=message_consts.PROFILE_USAGE,
+            )
+            return
+        if self.profiler is not None and self.profiler.running:
+            await self.send_message(
+                context,
+                update=update,
+                chat_id=chat_id,
+                text=message_consts.PROFILE_RUNNING,
+            )
+            return
+
+        self.profiler = profiler.SamplingProfiler(self.handler_codes())
+        self.profiler.start()
+        await self.send_message(
+            context,
+            update=update,
+            chat_id=chat_id,
+            text=message_consts.PROFILE_STARTED.format(seconds=seconds),
+        )
+        # updates keep being handled meanwhile, that's what is profiled
+        self.profile_task = asyncio.create_task(
+            self.send_profile(context, chat_id, seconds, top),
+        )
+
+    @command_routes.route("/sql")
+    async def handle_sql_command(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+    ) -> None:
+        chat_id = update.effective_chat.id
+        if chat_id != self.admin_id:
+            logger.warning(f"unauthorized sql report {chat_id}")
+            return
+        tracer = db.connection_manager.tracer if db.connection_manager else None
+        args = (update.message.text or "").split()[1:]
+        if tracer is None:
+            text = message_consts.SQL_TRACE_DISABLED
+        elif args == ["reset"]:
+            tracer.reset()
+            text = message_consts.SQL_TRACE_RESET
+        elif len(args) <= 1 and all(arg.isdigit() and int(arg) > 0 for arg in args):
+            text = truncate(tracer.report(int(args[0]) if args else 10))
+        else:
+            text = message_consts.SQL_USAGE
+        await self.send_message(context, update=update, chat_id=chat_id, text=text)
+
+    def handler_codes(self) -> Dict[CodeType, str]:
+        routes = [self.state_route]
+        for router in (callback_routes, command_routes):
+            routes.extend(router.routes.values())
+        return {route.func.__code__: route.name for route in routes}
+
+    async def send_profile(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+        chat_id: int,
+        seconds: float,
+        top: int,
+    ) -> None:
+        assert self.profiler is not None
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            # a thread stopping in a few milliseconds, no need for the executor
+            profile = self.profiler.stop()
+
+        await self.send_message(
+            context,
+            chat_id=chat_id,
+            text=truncate(profile.summary(top)),
+        )
+        if not profile.busy:
+            return
+
+        file = io.BytesIO(profile.collapsed())
+        filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt"
+
+        def send_document() -> Awaitable[Message]:
+            file.seek(0)
+            return context.bot.send_document(
+                chat_id=chat_id,
+                document=file,
+                filename=filename,
+                caption=message_consts.PROFILE_CAPTION.format(samples=profile.busy),
+            )
+
+        await self.outbound.call(Priority.INTERACTIVE, chat_id, send_document)
+        self.count_api_call("sendDocument")
+
+    async def dispatch(
+        self,
+        route: dispatch.Route,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        data: Optional[Dict[str, Any]] = None,
+        kind: str = "callback",
+    ) -> None:
+        current_handler.set(route.name)
+        args = route.extract(update.effective_chat.id, data or {})
+        stats = self.handler_stats.get(route.name)
+        if stats is None:
+            stats = self.handler_stats[route.name] = dispatch.HandlerStats()
+        started_at = time.perf_counter()
+        failed = True
+        try:
+            await route.func(self, update, context, *args)
+            failed = False
+        finally:
+            elapsed = time.perf_counter() - started_at
+            stats.observe(elapsed, failed)
+            metrics.HANDLER_DURATION.labels(kind, route.name).observe(elapsed)
+            if failed:
+                metrics.HANDLER_ERRORS.labels(kind, route.name).inc()
+
     async def handle_messages(
         self,
         update: Update,
@@ -633,24 +1107,16 @@ class TimarBot:
     ) -> None:
         if update.message is None:
             raise ValueError("Handle message called on an update without text")
-        match update.message.text:
-            case "/start" | "منوی اصلی":
-                await self.handle_start_command(update, context)
-            case "/new_epic":
-                await self.handle_new_epic(update, context)
-            case "/new_task":
-                await self.handle_new_task(update, context)
-            case "/shutdown":
-                if update.effective_chat.id != self.admin_id:
-                    logger.warning(f"unauthorized shutdown {update.effective_chat.id}")
-                    return
-                await update.message.reply_text("در حال خاموش کردن بات")
-                self.application.stop_running()
-                await self.application.stop()
-                await self.application.shutdown()
-            case _:
-                await self.handle_state(update, context)
-                return
+        text = update.message.text or ""
+        command = text
+        if text.startswith("/"):
+            # "/report 7" and "/start@timar_bot" route on "/report" and "/start"
+            command = text.split(maxsplit=1)[0].split("@", 1)[0]
+        route = command_routes.get(command)
+        if route is None:
+            await self.dispatch(self.state_route, update, context, kind="state")
+        else:
+            await self.dispatch(route, update, context, kind="command")
 
     async def handle_callback(
         self,
@@ -663,82 +1129,54 @@ class TimarBot:
             raise ValueError("Callback query is None")
 
         try:
-            data = json.loads(query.data)
+            data = await callback_consts.load_callback_data(query.data)
+        except callback_consts.CallbackDataExpired as error:
+            logger.info(f"expired callback data: {error}")
+            await self.send_message(
+                context,
+                update=update,
+                chat_id=update.effective_chat.id,
+                text=message_consts.BUTTON_EXPIRED,
+            )
+            return
         except Exception as error:
             logger.error(f"Error parsing callback data: {error =}, {query.data}")
             return
-        match data["action"]:
-            case callback_consts.EPICS_MANAGEMENT:
-                await self.handle_epic_management(update, context)
-            case callback_consts.TASK_MANAGEMENT:
-                await self.handle_task_management(update, context)
-            case callback_consts.SELECT_EPIC_FOR_TASK:
-                await self.handle_selected_epic_for_new_task(update, context, data)
-            case callback_consts.EPIC_MENU:
-                await self.handle_epic_menu(update, context, data)
-            case callback_consts.EDIT_EPIC:
-                await self.handle_edit_epic_button(
-                    context,
-                    update.effective_chat.id,
-                    data["epic_id"],
-                    data["column"],
-                )
-            case callback_consts.SHOW_TASK_OPERATION_MENU:
-                await self.handle_task_operation_menu(update, context, data)
-            case callback_consts.DELETE_TASK:
-                await self.handle_delete_task(
-                    update,
-                    context,
-                    data["task_id"],
-                    data["task_name"],
-                )
-            case callback_consts.EDIT_TASK:
-                await self.handle_edit_task(
-                    update,
-                    context,
-                    data["task_id"],
-                    data["column"],
-                )
 
-            case callback_consts.RETURN_TO_MENU:
-                await self.handle_start_command(update, context)
-            case callback_consts.DELETE_EPIC:
-                epic_id = data["epic_id"]
-                await self.handle_delete_epic(update, context, epic_id)
-            case callback_consts.START_TASK_TIMER:
-                await self.handle_start_task_timer(update, context, data)
-
-            case callback_consts.END_TASK_TIMER:
-                await self.handle_end_task_timer(update, context, data)
-            case callback_consts.DELETE_TASK_TIMER:
-                await self.handle_delete_task_timer(
-                    context,
-                    update.effective_chat.id,
-                    data["timelog_id "],
-                )
-            case callback_consts.EDIT_EPIC:
-                await self.handle_edit_epic_button(
-                    context,
-                    update.effective_chat.id,
-                    data["epic_id"],
-                    data["column"],
-                )
-            case callback_consts.END_TASK:
-                await self.handle_end_task(
-                    context,
-                    update.effective_chat.id,
-                    data["task_id"],
-                )
-            case _:
-                logger.warning(f"Unknown action {data['action']}")
+        route = callback_routes.get(callback_consts.ACTION_IDS.get(data["action"]))
+        if route is None:
+            logger.warning(f"Unknown action {data['action']}")
+            return
+        await self.dispatch(route, update, context, data)
 
-    def run(self, poll_interval: float) -> None:
+    async def delete_expired_callback_payloads(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+    ) -> None:
+        count = await callback_consts.payload_store.delete_expired()
+        logger.debug(f"deleted {count} expired callback payloads")
+
+    def run(
+        self,
+        poll_interval: float,
+        webhook: Optional[WebhookServer] = None,
+    ) -> None:
 
         if self.application.job_queue is None:
             raise ValueError("Job queue is None")
+        self.application.job_queue.run_once(self.timer_refresher.load, when=0)
+        # cheap when nothing is due, it only peeks at the heap
         self.application.job_queue.run_repeating(
-            job.update_in_progress_time_logs,
-            interval=10,
-            first=0,
+            self.timer_refresher.refresh,
+            interval=1,
+            first=1,
         )
-        self.application.run_polling(poll_interval=poll_interval)
+        self.application.job_queue.run_repeating(
+            self.delete_expired_callback_payloads,
+            interval=3600,
+            first=60,
+        )
+        if webhook is not None:
+            webhook.run()
+        else:
+            self.application.run_polling(poll_interval=poll_interval)
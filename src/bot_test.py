@@ -0,0 +1,244 @@
+import asyncio
+import gzip
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, List, Tuple
+
+import pytest
+from telegram import Chat, Message
+from telegram.ext import Application
+
+import callback_consts
+import db
+import dispatch
+from bot import TimarBot
+from outbound import OutboundScheduler
+
+
+class FakeMessage:
+    def __init__(self, bot: "FakeBot", chat_id: int, message_id: int) -> None:
+        self.bot = bot
+        self.chat = SimpleNamespace(id=chat_id)
+        self.message_id = message_id
+
+    async def delete(self) -> None:
+        self.bot.calls.append(("deleteMessage", self.chat.id))
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, int]] = []
+        self.documents: List[bytes] = []
+
+    async def send_message(self, chat_id: int, **_: Any) -> FakeMessage:
+        self.calls.append(("sendMessage", chat_id))
+        return FakeMessage(self, chat_id, len(self.calls))
+
+    async def edit_message_text(self, chat_id: int, **_: Any) -> Message:
+        self.calls.append(("editMessageText", chat_id))
+        return Message(1, None, Chat(chat_id, Chat.PRIVATE))  # type: ignore[arg-type]
+
+    async def send_document(self, chat_id: int, document: Any, **_: Any) -> None:
+        self.calls.append(("sendDocument", chat_id))
+        self.documents.append(document.read())
+
+
+def new_bot(single_round_trip: bool) -> TimarBot:
+    application = Application.builder().token("1:token").build()
+    return TimarBot(
+        application,
+        admin_id=1,
+        outbound=OutboundScheduler(chat_rate=100, chat_burst=100),
+        single_round_trip=single_round_trip,
+    )
+
+
+def reply_twice(bot: TimarBot, fake: FakeBot) -> None:
+    context: Any = SimpleNamespace(bot=fake)
+
+    async def reply() -> None:
+        await bot.send_message(context, chat_id=1, text="a")
+        await bot.send_message(context, chat_id=1, text="b")
+
+    asyncio.run(reply())
+
+
+def test_legacy_reply_takes_three_calls() -> None:
+    fake = FakeBot()
+    reply_twice(new_bot(single_round_trip=False), fake)
+    assert len(fake.calls) == 6
+
+
+def test_keyboard_is_installed_once_per_chat() -> None:
+    fake = FakeBot()
+    bot = new_bot(single_round_trip=True)
+    reply_twice(bot, fake)
+    assert [call for call, _ in fake.calls] == [
+        "sendMessage",
+        "deleteMessage",
+        "sendMessage",
+        "sendMessage",
+    ]
+    assert bot.api_calls[("", "sendMessage")] == 3
+
+
+def test_callback_reply_edits_in_place() -> None:
+    fake = FakeBot()
+    bot = new_bot(single_round_trip=True)
+    message = Message(5, None, Chat(1, Chat.PRIVATE))  # type: ignore[arg-type]
+    update: Any = SimpleNamespace(callback_query=SimpleNamespace(message=message))
+    context: Any = SimpleNamespace(bot=fake)
+
+    asyncio.run(bot.send_message(context, chat_id=1, text="a", update=update))
+    assert fake.calls == [("editMessageText", 1)]
+
+
+def test_dispatch_routes_commands_and_callbacks() -> None:
+    db.initialize_repos(":memory:", do_migration=True)
+    bot = new_bot(single_round_trip=True)
+    context: Any = SimpleNamespace(bot=FakeBot())
+    chat = SimpleNamespace(id=1)
+    button = callback_consts.RETURN_TO_MENU.button(chat_id=1)
+
+    async def run() -> None:
+        for text in ("/start", "/start@timar_bot", "منوی اصلی"):
+            message = SimpleNamespace(text=text)
+            update: Any = SimpleNamespace(
+                message=message,
+                effective_chat=chat,
+                callback_query=None,
+            )
+            await bot.handle_messages(update, context)
+        query = SimpleNamespace(data=button["callback_data"], message=None)
+        update = SimpleNamespace(callback_query=query, effective_chat=chat)
+        await bot.handle_callback(update, context)
+
+    asyncio.run(run())
+    assert bot.handler_stats["handle_start_command"].calls == 4
+    assert bot.handler_stats["handle_start_command"].errors == 0
+
+
+def test_routes_are_unique() -> None:
+    router = dispatch.Router()
+
+    @router.route("/a")
+    async def first() -> None:
+        pass
+
+    with pytest.raises(ValueError):
+
+        @router.route("/a")
+        async def second() -> None:
+            pass
+
+
+def test_format_report() -> None:
+    bot = new_bot(single_round_trip=True)
+    report = db.Report(
+        chat_id=1,
+        since=datetime(2025, 1, 1),
+        until=datetime(2025, 1, 8),
+        epics=[
+            db.EpicTotal(
+                1,
+                "work",
+                5400,
+                [
+                    db.TaskTotal(1, "coding", 3600),
+                    db.TaskTotal(2, "review", 1800, True),
+                ],
+            ),
+        ],
+    )
+    text = bot.format_report(report, 7)
+    assert text.splitlines()[0] == "گزارش 7 روز اخیر"
+    assert "1 ساعت 30 دقیقه" in text
+    assert "review: 30 دقیقه  (در حال اجرا)" in text
+    assert bot.format_report(db.Report(1, report.since, report.until), 7).startswith(
+        "در 7 روز",
+    )
+
+
+def test_export_sends_document(tmp_path: Any) -> None:
+    db.initialize_repos(str(tmp_path / "data.db"), do_migration=True)
+    epic_id = db.epic_repo.create(db.Epic(name="work", description="", chat_id=7))
+    db.task_repo.create(db.Task(name="coding", description="", epic_id=epic_id))
+    bot = new_bot(single_round_trip=True)
+    fake = FakeBot()
+    context: Any = SimpleNamespace(bot=fake)
+
+    def update(text: str) -> Any:
+        return SimpleNamespace(
+            effective_chat=SimpleNamespace(id=7),
+            message=SimpleNamespace(text=text),
+            callback_query=None,
+        )
+
+    async def run() -> None:
+        await bot.handle_export(update("/export gz"), context)
+        await bot.handle_export(update("/export xml"), context)
+
+    asyncio.run(run())
+    assert fake.calls[0] == ("sendDocument", 7)
+    assert fake.calls[-1] == ("sendMessage", 7)
+    header, row = gzip.decompress(fake.documents[0]).decode().splitlines()
+    assert header.startswith("epic_id,epic_name")
+    assert ",work,,,1,coding," in row
+
+
+def test_profile_is_admin_only() -> None:
+    bot = new_bot(single_round_trip=True)
+    fake = FakeBot()
+    context: Any = SimpleNamespace(bot=fake)
+
+    def update(chat_id: int, text: str) -> Any:
+        return SimpleNamespace(
+            effective_chat=SimpleNamespace(id=chat_id),
+            message=SimpleNamespace(text=text),
+            callback_query=None,
+        )
+
+    async def run() -> None:
+        await bot.handle_profile_command(update(2, "/profile 0.1"), context)
+        assert bot.profiler is None and fake.calls == []
+        await bot.handle_profile_command(update(1, "/profile x"), context)
+        await bot.handle_profile_command(update(1, "/profile 0.1 5"), context)
+        await bot.handle_profile_command(update(1, "/profile 0.1"), context)
+        assert bot.profiler is not None and bot.profiler.running
+        until = time.perf_counter() + 0.1
+        while time.perf_counter() < until:
+            pass
+        assert bot.profile_task is not None
+        await bot.profile_task
+
+    asyncio.run(run())
+    assert bot.profiler is not None and not bot.profiler.running
+    assert fake.calls[-1] == ("sendDocument", 1)
+    assert fake.documents[0].startswith(b"MainThread;")
+
+
+def test_sql_report_is_admin_only(tmp_path: Any) -> None:
+    tracer = db.QueryTracer()
+    db.initialize_repos(str(tmp_path / "data.db"), do_migration=True, tracer=tracer)
+    bot = new_bot(single_round_trip=True)
+    fake = FakeBot()
+    context: Any = SimpleNamespace(bot=fake)
+
+    def update(chat_id: int, text: str) -> Any:
+        return SimpleNamespace(
+            effective_chat=SimpleNamespace(id=chat_id),
+            message=SimpleNamespace(text=text),
+            callback_query=None,
+        )
+
+    async def run() -> None:
+        await bot.handle_sql_command(update(2, "/sql"), context)
+        assert fake.calls == []
+        await bot.handle_sql_command(update(1, "/sql 5"), context)
+        await bot.handle_sql_command(update(1, "/sql reset"), context)
+
+    assert tracer.by_total_time()
+    asyncio.run(run())
+    assert tracer.by_total_time() == []
+    assert fake.calls[-1] == ("sendMessage", 1)
@@ -1,13 +1,260 @@
+import binascii
+import functools
 import json
-from typing import Any, List, Optional
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+from db import IAsyncCallbackPayloadRepo
+from db.cache import LRUCache
+
+# Bot API limit for callback_data, in bytes
+MAX_CALLBACK_DATA = 64
+COMPACT_PREFIX = "~"
+STORED_PREFIX = "*"
+STORED_KEY_SIZE = 6
+# seconds a stored payload is kept, so its buttons work for this long
+STORED_PAYLOAD_TTL = 7 * 24 * 3600
+
+# action id -> action name; ids end up in buttons already sent, never reuse one
+ACTIONS: Dict[int, str] = {}
+ACTION_IDS: Dict[str, int] = {}
+
+# metadata key -> (field id, type); same rule as action ids
+FIELDS: Dict[str, Tuple[int, type]] = {
+    "epic_id": (1, int),
+    "task_id": (2, int),
+    "timelog_id": (3, int),
+    "task_name": (4, str),
+    "column": (5, str),
+}
+FIELDS_BY_ID = {field_id: (key, kind) for key, (field_id, kind) in FIELDS.items()}
+
+
+class CallbackDataExpired(ValueError):
+    pass
+
+
+# Payloads too large for callback_data, by the key put in their place. With a
+# repo, new payloads wait in pending until save() writes them, which the bot
+# does before sending their buttons, so the buttons survive a restart; the
+# recent ones are kept in memory too so most presses skip the database.
+class PayloadStore:
+    def __init__(
+        self,
+        max_size: int = 100000,
+        ttl: int = STORED_PAYLOAD_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl = ttl
+        self.clock = clock
+        self.cache: LRUCache[bytes, bytes] = LRUCache(max_size, ttl=ttl, clock=clock)
+        self.pending: Dict[bytes, bytes] = {}
+        self.repo: Optional[IAsyncCallbackPayloadRepo] = None
+
+    def set(self, key: bytes, payload: bytes) -> None:
+        self.cache.set(key, payload)
+        if self.repo is not None:
+            self.pending[key] = payload
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    async def save(self) -> None:
+        if self.repo is None or not self.pending:
+            return
+        payloads, self.pending = self.pending, {}
+        try:
+            await self.repo.set_many(payloads, int(self.clock()) + self.ttl)
+        except BaseException:
+            # tried again by the next save
+            self.pending = payloads | self.pending
+            raise
+
+    async def load(self, key: bytes) -> Optional[bytes]:
+        payload = self.cache.get(key)
+        if payload is None and self.repo is not None:
+            payload = await self.repo.get(key, int(self.clock()))
+            if payload is not None:
+                self.cache.set(key, payload)
+        return payload
+
+    async def delete_expired(self) -> int:
+        if self.repo is None:
+            return 0
+        return await self.repo.delete_expired(int(self.clock()))
+
+    def clear(self) -> None:
+        self.cache.clear()
+        self.pending.clear()
+
+
+payload_store = PayloadStore()
+
+
+def register_action(action_id: int, name: str) -> None:
+    if (
+        ACTIONS.get(action_id, name) != name
+        or ACTION_IDS.get(name, action_id) != action_id
+    ):
+        raise ValueError(f"action id {action_id} or name {name} is already registered")
+    ACTIONS[action_id] = name
+    ACTION_IDS[name] = action_id
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    # zigzag, so negative (group) chat ids stay short
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    byte = data[pos]
+    if byte < 0x80:
+        # most values fit in one byte
+        return (byte >> 1) ^ -(byte & 1), pos + 1
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos
+
+
+TO_URLSAFE = bytes.maketrans(b"+/", b"-_")
+FROM_URLSAFE = bytes.maketrans(b"-_", b"+/")
+
+
+def b64encode(data: bytes) -> str:
+    return (
+        binascii.b2a_base64(data, newline=False)
+        .translate(TO_URLSAFE)
+        .rstrip(b"=")
+        .decode()
+    )
+
+
+def b64decode(data: str) -> bytes:
+    raw = data.encode().translate(FROM_URLSAFE)
+    return binascii.a2b_base64(raw + b"=" * (-len(raw) % 4))
+
+
+# menus send the same buttons over and over, so encoded and decoded forms are
+# memoized; payloads that go to the store are not
+@functools.lru_cache(maxsize=4096)
+def encode_payload(
+    action: str, chat_id: int, fields: Tuple[Tuple[str, Any], ...]
+) -> bytes:
+    payload = bytearray()
+    write_varint(payload, ACTION_IDS[action])
+    write_varint(payload, chat_id)
+    for key, value in fields:
+        if key not in FIELDS:
+            raise ValueError(f"unknown callback metadata: {key}")
+        field_id, kind = FIELDS[key]
+        if not isinstance(value, kind):
+            raise ValueError(f"{key} must be {kind.__name__}, got {value!r}")
+        write_varint(payload, field_id)
+        if kind is int:
+            write_varint(payload, cast(int, value))
+        else:
+            raw = cast(str, value).encode()
+            write_varint(payload, len(raw))
+            payload += raw
+    return bytes(payload)
+
+
+@functools.lru_cache(maxsize=4096)
+def encode_compact(
+    action: str, chat_id: int, fields: Tuple[Tuple[str, Any], ...]
+) -> str:
+    return COMPACT_PREFIX + b64encode(encode_payload(action, chat_id, fields))
+
+
+def encode_callback_data(action: str, chat_id: int, metadata: dict) -> str:
+    fields = tuple(metadata.items())
+    data = encode_compact(action, chat_id, fields)
+    if len(data) <= MAX_CALLBACK_DATA:
+        return data
+
+    # the action id stays inline, so an expired button still names its action
+    reference = bytearray()
+    write_varint(reference, ACTION_IDS[action])
+    reference += os.urandom(STORED_KEY_SIZE)
+    payload_store.set(bytes(reference), encode_payload(action, chat_id, fields))
+    return STORED_PREFIX + b64encode(bytes(reference))
+
+
+def decode_payload(payload: bytes) -> Dict[str, Any]:
+    try:
+        action_id, pos = read_varint(payload, 0)
+        chat_id, pos = read_varint(payload, pos)
+        decoded: Dict[str, Any] = {"action": ACTIONS[action_id], "chat_id": chat_id}
+        while pos < len(payload):
+            field_id, pos = read_varint(payload, pos)
+            key, kind = FIELDS_BY_ID[field_id]
+            value, pos = read_varint(payload, pos)
+            if kind is str:
+                decoded[key] = payload[pos : pos + value].decode()
+                pos += value
+            else:
+                decoded[key] = value
+    except (IndexError, KeyError, UnicodeDecodeError) as error:
+        raise ValueError(f"malformed callback data: {payload!r}") from error
+    return decoded
+
+
+def decode_stored(reference: bytes, payload: Optional[bytes]) -> Dict[str, Any]:
+    if payload is None:
+        action_id, _ = read_varint(reference, 0)
+        raise CallbackDataExpired(f"payload of {ACTIONS.get(action_id)} expired")
+    return decode_payload(payload)
+
+
+@functools.lru_cache(maxsize=4096)
+def decode_compact(data: str) -> Dict[str, Any]:
+    return decode_payload(b64decode(data[len(COMPACT_PREFIX) :]))
+
+
+def decode_callback_data(data: str) -> Dict[str, Any]:
+    if data.startswith(COMPACT_PREFIX):
+        # a copy, the memoized dict is shared
+        return dict(decode_compact(data))
+
+    if data.startswith(STORED_PREFIX):
+        reference = b64decode(data[len(STORED_PREFIX) :])
+        return decode_stored(reference, payload_store.get(reference))
+
+    if data.startswith("{"):
+        # buttons sent before the compact encoding
+        return json.loads(data)
+    raise ValueError(f"unknown callback data format: {data!r}")
+
+
+async def load_callback_data(data: str) -> Dict[str, Any]:
+    # decode_callback_data, but stored payloads are read back from the
+    # database once they are out of memory
+    if data.startswith(STORED_PREFIX):
+        reference = b64decode(data[len(STORED_PREFIX) :])
+        return decode_stored(reference, await payload_store.load(reference))
+    return decode_callback_data(data)
 
 
 class CallbackButton:
 
-    def __init__(self, name: str, text: Optional[str] = None):
+    def __init__(self, name: str, action_id: int, text: Optional[str] = None):
         if text is None:
             text = name
+        register_action(action_id, name)
         self.__name = name
+        self.__action_id = action_id
         self.__metadata: dict = {}
         self.__text = text
 
@@ -27,14 +274,12 @@ class CallbackButton:
     def text(self) -> str:
         return self.__text
 
+    @property
+    def action_id(self) -> int:
+        return self.__action_id
+
     def __get_callback_data(self, chat_id: int) -> str:
-        return json.dumps(
-            {
-                "action": self.name,
-                "chat_id": chat_id,
-            }
-            | self.__metadata,
-        )
+        return encode_callback_data(self.__name, chat_id, self.__metadata)
 
     def button(self, chat_id: int) -> dict:
         return {
@@ -52,7 +297,7 @@ class CallbackButton:
         raise NotImplementedError
 
     def copy(self) -> "CallbackButton":
-        new_button = CallbackButton(self.__name)
+        new_button = CallbackButton(self.__name, self.__action_id)
         if self.__metadata:
             new_button.add_metadata(self.__metadata.copy())
         if self.__text != self.__name:
@@ -83,25 +328,25 @@ class CallbackButton:
         return inline_buttons
 
 
-TASK_MANAGEMENT = CallbackButton("مدیریت تسک ها")
-EPICS_MANAGEMENT = CallbackButton("مدیریت اپیک ها")
+TASK_MANAGEMENT = CallbackButton("مدیریت تسک ها", 1)
+EPICS_MANAGEMENT = CallbackButton("مدیریت اپیک ها", 2)
 
-EPIC_MENU = CallbackButton("ویرایش و یا حذف اپیک")
-EDIT_EPIC = CallbackButton("ویرایش اپیک")
+EPIC_MENU = CallbackButton("ویرایش و یا حذف اپیک", 3)
+EDIT_EPIC = CallbackButton("ویرایش اپیک", 4)
 
-DELETE_EPIC = CallbackButton("حذف اپیک", text="حذف")
+DELETE_EPIC = CallbackButton("حذف اپیک", 5, text="حذف")
 
-SELECT_EPIC_FOR_TASK = CallbackButton("انتخاب اپیک برای تسک")
+SELECT_EPIC_FOR_TASK = CallbackButton("انتخاب اپیک برای تسک", 6)
 
 
-RETURN_TO_MENU = CallbackButton("بازگشت به منوی اصلی")
-SHOW_TASK_OPERATION_MENU = CallbackButton("ویرایش و یا حذف تسک")
+RETURN_TO_MENU = CallbackButton("بازگشت به منوی اصلی", 7)
+SHOW_TASK_OPERATION_MENU = CallbackButton("ویرایش و یا حذف تسک", 8)
 
-EDIT_TASK = CallbackButton("ویرایش تسک")
+EDIT_TASK = CallbackButton("ویرایش تسک", 9)
 
-DELETE_TASK = CallbackButton("حذف")
-START_TASK_TIMER = CallbackButton("شروع تایمر")
-END_TASK_TIMER = CallbackButton("پایان تایمر")
-DELETE_TASK_TIMER = CallbackButton("حذف تایمر", text="حذف")
+DELETE_TASK = CallbackButton("حذف", 10)
+START_TASK_TIMER = CallbackButton("شروع تایمر", 11)
+END_TASK_TIMER = CallbackButton("پایان تایمر", 12)
+DELETE_TASK_TIMER = CallbackButton("حذف تایمر", 13, text="حذف")
 
-END_TASK = CallbackButton("اتمام تسک", text="اتمام")
+END_TASK = CallbackButton("اتمام تسک", 14, text="اتمام")
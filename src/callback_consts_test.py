@@ -0,0 +1,102 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+import callback_consts
+from callback_consts import (
+    MAX_CALLBACK_DATA,
+    CallbackButton,
+    CallbackDataExpired,
+    PayloadStore,
+    decode_callback_data,
+    load_callback_data,
+)
+from db import AsyncCallbackPayloadRepo, CallbackPayloadRepo, DBExecutor
+
+
+def callback_data(button: CallbackButton, chat_id: int) -> str:
+    return button.button(chat_id)["callback_data"]
+
+
+def test_round_trip() -> None:
+    button = callback_consts.END_TASK_TIMER.copy().add_metadata(
+        {"timelog_id": 123456, "task_id": 7},
+    )
+    data = callback_data(button, chat_id=-1001234567890)
+    assert len(data.encode()) <= MAX_CALLBACK_DATA
+    assert decode_callback_data(data) == {
+        "action": callback_consts.END_TASK_TIMER.name,
+        "chat_id": -1001234567890,
+        "timelog_id": 123456,
+        "task_id": 7,
+    }
+
+
+def test_large_payload_is_stored() -> None:
+    task_name = "یک تسک با نام خیلی خیلی طولانی که در شصت و چهار بایت جا نمی شود"
+    button = callback_consts.START_TASK_TIMER.copy().add_metadata(
+        {"task_id": 1, "task_name": task_name},
+    )
+    data = callback_data(button, chat_id=1)
+    assert len(data.encode()) <= MAX_CALLBACK_DATA
+    assert decode_callback_data(data)["task_name"] == task_name
+
+    callback_consts.payload_store.clear()
+    with pytest.raises(CallbackDataExpired):
+        decode_callback_data(data)
+
+
+def test_stored_payload_survives_a_restart(monkeypatch: pytest.MonkeyPatch) -> None:
+    sqlitedb = sqlite3.connect(":memory:", check_same_thread=False)
+    executor = DBExecutor(max_workers=1)
+    repo = AsyncCallbackPayloadRepo(
+        CallbackPayloadRepo(sqlitedb=sqlitedb, do_migrate=True),
+        executor,
+    )
+    now = [1000.0]
+    store = PayloadStore(ttl=60, clock=lambda: now[0])
+    store.repo = repo
+    monkeypatch.setattr(callback_consts, "payload_store", store)
+
+    task_name = "a task with a name far too long to fit in sixty four bytes of data"
+    button = callback_consts.DELETE_TASK.copy().add_metadata(
+        {"task_id": 1, "task_name": task_name},
+    )
+    data = callback_data(button, chat_id=1)
+
+    async def run() -> None:
+        await store.save()
+        assert not store.pending
+        # a new process only has the database
+        store.cache.clear()
+        assert (await load_callback_data(data))["task_name"] == task_name
+
+        now[0] += 61
+        store.cache.clear()
+        with pytest.raises(CallbackDataExpired):
+            await load_callback_data(data)
+        assert await store.delete_expired() == 1
+
+    asyncio.run(run())
+    executor.shutdown()
+
+
+def test_legacy_json_is_decoded() -> None:
+    data = json.dumps({"action": callback_consts.EPIC_MENU.name, "chat_id": 1})
+    assert decode_callback_data(data)["action"] == callback_consts.EPIC_MENU.name
+
+
+def test_invalid_data() -> None:
+    with pytest.raises(ValueError):
+        decode_callback_data("~")
+    with pytest.raises(ValueError):
+        decode_callback_data("garbage")
+    with pytest.raises(ValueError):
+        callback_data(callback_consts.EPIC_MENU.copy().add_metadata({"x": 1}), 1)
+
+
+def test_action_ids_are_unique() -> None:
+    with pytest.raises(ValueError):
+        CallbackButton("action that reuses an id", callback_consts.EPIC_MENU.action_id)
@@ -36,6 +36,42 @@ class ServiceConfig:
     TOKEN: str = env("BOT_TOKEN")
     BOT_BASE_URL: str = env("BOT_BASE_URL")
     SQLITE_FILE: str = env("SQLITE", default="data.db")
+    SQLITE_READERS: int = env("SQLITE_READERS", default=4)
+    SQLITE_SYNCHRONOUS: str = env("SQLITE_SYNCHRONOUS", default="NORMAL")
+    SQLITE_CACHE_SIZE_KIB: int = env("SQLITE_CACHE_SIZE_KIB", default=8192)
+    # 0 commits every write on its own
+    SQLITE_GROUP_COMMIT_MS: int = env("SQLITE_GROUP_COMMIT_MS", default=0)
+    USER_STATE_CACHE_SIZE: int = env("USER_STATE_CACHE_SIZE", default=10000)
+    # seconds; conversations idle for longer are read back from the database
+    USER_STATE_CACHE_TTL: float = env("USER_STATE_CACHE_TTL", default=3600.0)
+    ENTITY_CACHE: bool = env("ENTITY_CACHE", default=True)
+    ENTITY_CACHE_SIZE: int = env("ENTITY_CACHE_SIZE", default=10000)
     MIGRATION: bool = env("MIGRATION", default=True)
+    # "polling" or "webhook"
+    UPDATE_MODE: str = env("UPDATE_MODE", default="polling")
     POLL_INTERVAL: float = env("POLL_INTERVAL", default=0.2)
+    # updates of different chats handled at once; a chat's own run in order
+    CONCURRENT_UPDATES: int = env("CONCURRENT_UPDATES", default=64)
+    WEBHOOK_LISTEN: str = env("WEBHOOK_LISTEN", default="0.0.0.0")
+    WEBHOOK_PORT: int = env("WEBHOOK_PORT", default=8080)
+    WEBHOOK_PATH: str = env("WEBHOOK_PATH", default="/webhook")
+    # public url of WEBHOOK_PATH; empty to leave the registered webhook as is
+    WEBHOOK_URL: str = env("WEBHOOK_URL", default="")
+    # required unless WEBHOOK_URL is set, then a random one is registered
+    WEBHOOK_SECRET: str = env("WEBHOOK_SECRET", default="")
     ADMIN_ID: int = env("ADMIN_ID", default=1239963443)
+    OUTBOUND_GLOBAL_RATE: float = env("OUTBOUND_GLOBAL_RATE", default=30.0)
+    OUTBOUND_CHAT_RATE: float = env("OUTBOUND_CHAT_RATE", default=1.0)
+    OUTBOUND_CHAT_BURST: float = env("OUTBOUND_CHAT_BURST", default=3.0)
+    OUTBOUND_CONCURRENCY: int = env("OUTBOUND_CONCURRENCY", default=8)
+    SINGLE_ROUND_TRIP_REPLY: bool = env("SINGLE_ROUND_TRIP_REPLY", default=True)
+    # chats remembered to have the main menu keyboard
+    KEYBOARD_CACHE_SIZE: int = env("KEYBOARD_CACHE_SIZE", default=10000)
+    # times every statement and samples query plans; for finding slow queries
+    SQL_TRACE: bool = env("SQL_TRACE", default=False)
+    SQL_SLOW_QUERY_MS: int = env("SQL_SLOW_QUERY_MS", default=100)
+    # checks a statement's plan for full scans every this many executions
+    SQL_EXPLAIN_EVERY: int = env("SQL_EXPLAIN_EVERY", default=1000)
+    # serves GET /metrics in the Prometheus text format; 0 disables it
+    METRICS_PORT: int = env("METRICS_PORT", default=0)
+    METRICS_LISTEN: str = env("METRICS_LISTEN", default="127.0.0.1")
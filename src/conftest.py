@@ -0,0 +1,5 @@
+import os
+import sys
+
+# top level modules import each other as `import db`, like main.py does
+sys.path.insert(0, os.path.dirname(__file__))
@@ -1,24 +1,187 @@
-import sqlite3
+import functools
+from typing import Callable, Optional, TypeVar
 
-from .epic_repo import Epic, EpicRepo, IEpicRepo
-from .task_repo import ITaskRepo, Task, TaskRepo
-from .timelog_repo import ITimelogRepo, Timelog, TimelogRepo, TimelogStatus
-from .user_state_repo import IUserStateRepo, UserState, UserStateRepo
+from .callback_payload_repo import (
+    AsyncCallbackPayloadRepo,
+    CallbackPayloadRepo,
+    IAsyncCallbackPayloadRepo,
+    ICallbackPayloadRepo,
+)
+from .connection import ConnectionManager
+from .epic_repo import (
+    AsyncEpicRepo,
+    CachedEpicRepo,
+    Epic,
+    EpicRepo,
+    IAsyncEpicRepo,
+    IEpicRepo,
+)
+from .executor import DBExecutor, QueryObserver
+from .export_repo import (
+    EXPORT_COLUMNS,
+    AsyncExportRepo,
+    ExportRepo,
+    ExportRow,
+    IAsyncExportRepo,
+    IExportRepo,
+)
+from .migrations import run_migrations
+from .report_repo import (
+    AsyncReportRepo,
+    EpicTotal,
+    IAsyncReportRepo,
+    IReportRepo,
+    Report,
+    ReportRepo,
+    TaskTotal,
+)
+from .task_repo import (
+    AsyncTaskRepo,
+    CachedTaskRepo,
+    IAsyncTaskRepo,
+    ITaskRepo,
+    Task,
+    TaskRepo,
+)
+from .timelog_repo import (
+    AsyncTimelogRepo,
+    IAsyncTimelogRepo,
+    ITimelogRepo,
+    Timelog,
+    TimelogRepo,
+    TimelogStatus,
+    format_duration,
+)
+from .tracing import QueryTracer, SlowQuery, StatementStats
+from .user_state_repo import (
+    AsyncUserStateRepo,
+    CachedUserStateRepo,
+    IAsyncUserStateRepo,
+    IUserStateRepo,
+    UserState,
+    UserStateRepo,
+)
 
-task_repo = None
-epic_repo = None
-user_state_repo = None
-timelog_repo = None
+T = TypeVar("T")
 
+task_repo: Optional[ITaskRepo] = None
+epic_repo: Optional[IEpicRepo] = None
+user_state_repo: Optional[IUserStateRepo] = None
+timelog_repo: Optional[ITimelogRepo] = None
+report_repo: Optional[IReportRepo] = None
+export_repo: Optional[IExportRepo] = None
+callback_payload_repo: Optional[ICallbackPayloadRepo] = None
 
-def initialize_repos(sqlite_file: str, do_migration: bool) -> None:
-    global task_repo, epic_repo, user_state_repo, timelog_repo
+connection_manager: Optional[ConnectionManager] = None
+executor: Optional[DBExecutor] = None
+async_task_repo: Optional[IAsyncTaskRepo] = None
+async_epic_repo: Optional[IAsyncEpicRepo] = None
+async_user_state_repo: Optional[IAsyncUserStateRepo] = None
+async_timelog_repo: Optional[IAsyncTimelogRepo] = None
+async_report_repo: Optional[IAsyncReportRepo] = None
+async_export_repo: Optional[IAsyncExportRepo] = None
+async_callback_payload_repo: Optional[IAsyncCallbackPayloadRepo] = None
 
-    sqlitedb = sqlite3.connect(sqlite_file, timeout=1)
-    task_repo = TaskRepo(sqlitedb=sqlitedb, do_migrate=do_migration)
-    epic_repo = EpicRepo(sqlitedb=sqlitedb, do_migrate=do_migration)
-    user_state_repo = UserStateRepo(sqlitedb=sqlitedb, do_migrate=do_migration)
-    timelog_repo = TimelogRepo(sqlitedb=sqlitedb, do_migrate=do_migration)
 
+def initialize_repos(
+    sqlite_file: str,
+    do_migration: bool,
+    readers: int = 4,
+    synchronous: str = "NORMAL",
+    cache_size_kib: int = 8192,
+    group_commit_window: float = 0,
+    user_state_cache_size: int = 10000,
+    user_state_cache_ttl: float = 3600,
+    entity_cache: bool = True,
+    entity_cache_size: int = 10000,
+    observer: Optional[QueryObserver] = None,
+    tracer: Optional[QueryTracer] = None,
+) -> None:
+    global task_repo, epic_repo, user_state_repo, timelog_repo, report_repo
+    global export_repo, connection_manager, executor, async_task_repo
+    global async_epic_repo, async_user_state_repo, async_timelog_repo
+    global async_report_repo, async_export_repo, callback_payload_repo
+    global async_callback_payload_repo
 
-__all__ = ["task_repo", "epic_repo", "user_state_repo", "timelog_repo"]
+    sqlitedb = connection_manager = ConnectionManager.open(
+        sqlite_file,
+        readers=readers,
+        synchronous=synchronous,
+        cache_size_kib=cache_size_kib,
+        group_commit_window=group_commit_window,
+        tracer=tracer,
+    )
+    if do_migration:
+        run_migrations(sqlitedb)
+    task_repo = TaskRepo(sqlitedb=sqlitedb, do_migrate=False)
+    epic_repo = EpicRepo(sqlitedb=sqlitedb, do_migrate=False)
+    if entity_cache:
+        cached_task_repo = CachedTaskRepo(
+            task_repo,
+            sqlitedb,
+            max_size=entity_cache_size,
+        )
+        # undone task lists only include tasks of active epics
+        epic_repo = CachedEpicRepo(
+            epic_repo,
+            sqlitedb,
+            max_size=entity_cache_size,
+            on_delete=cached_task_repo.invalidate_chat,
+        )
+        task_repo = cached_task_repo
+    user_state_repo = CachedUserStateRepo(
+        UserStateRepo(sqlitedb=sqlitedb, do_migrate=False),
+        sqlitedb,
+        max_size=user_state_cache_size,
+        ttl=user_state_cache_ttl,
+    )
+    timelog_repo = TimelogRepo(sqlitedb=sqlitedb, do_migrate=False)
+    report_repo = ReportRepo(sqlitedb=sqlitedb, do_migrate=False)
+    export_repo = ExportRepo(sqlitedb=sqlitedb, do_migrate=False)
+    callback_payload_repo = CallbackPayloadRepo(sqlitedb=sqlitedb, do_migrate=False)
+
+    # one thread per reader connection plus one for the writer; writers
+    # waiting for a group commit park their thread, so leave room for them
+    max_workers = sqlitedb.max_readers + 1
+    if group_commit_window > 0:
+        max_workers *= 2
+    executor = DBExecutor(max_workers=max_workers, observer=observer)
+    async_task_repo = AsyncTaskRepo(task_repo, executor)
+    async_epic_repo = AsyncEpicRepo(epic_repo, executor)
+    async_user_state_repo = AsyncUserStateRepo(user_state_repo, executor)
+    async_timelog_repo = AsyncTimelogRepo(timelog_repo, executor)
+    async_report_repo = AsyncReportRepo(report_repo, executor)
+    async_export_repo = AsyncExportRepo(export_repo)
+    async_callback_payload_repo = AsyncCallbackPayloadRepo(
+        callback_payload_repo,
+        executor,
+    )
+
+
+async def run_in_transaction(func: Callable[[], T]) -> T:
+    if connection_manager is None or executor is None:
+        raise ValueError("repos are not initialized")
+    manager = connection_manager
+
+    @functools.wraps(func)
+    def run() -> T:
+        with manager.transaction():
+            return func()
+
+    return await executor.run(run)
+
+
+__all__ = [
+    "task_repo",
+    "epic_repo",
+    "user_state_repo",
+    "timelog_repo",
+    "report_repo",
+    "callback_payload_repo",
+    "async_task_repo",
+    "async_epic_repo",
+    "async_user_state_repo",
+    "async_timelog_repo",
+    "async_report_repo",
+    "async_callback_payload_repo",
+]
@@ -0,0 +1,20 @@
+# One-time backfill of timelog_daily_rollup, also fine to rerun to repair it:
+#
+#   cd src && python -m db.backfill /etc/timar/data.db
+import argparse
+
+from .connection import ConnectionManager
+from .migrations import run_migrations
+from .rollup import rebuild_daily_rollup
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="rebuild timelog_daily_rollup")
+    parser.add_argument("sqlite_file")
+    args = parser.parse_args()
+
+    manager = ConnectionManager.open(args.sqlite_file, readers=0)
+    run_migrations(manager)
+    with manager.writer() as conn:
+        count = rebuild_daily_rollup(conn)
+    manager.close()
+    print(f"rebuilt timelog_daily_rollup with {count} rows")
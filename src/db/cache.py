@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_size < 1:
+            raise ValueError(f"max_size must be positive, got {max_size}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.data: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> stamp of its last pop; a reader that saw another generation
+        # before its database read must not cache what it read. The oldest
+        # stamps are forgotten, and a forgotten key is at stamp_floor.
+        self.stamps: OrderedDict[K, int] = OrderedDict()
+        self.last_stamp = 0
+        self.stamp_floor = 0
+
+    def get(self, key: K) -> Optional[V]:
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and self.clock() - stored_at > self.ttl:
+                del self.data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, key: K) -> int:
+        with self.lock:
+            return self.stamps.get(key, self.stamp_floor)
+
+    def set(self, key: K, value: V, generation: Optional[int] = None) -> None:
+        with self.lock:
+            if (
+                generation is not None
+                and self.stamps.get(key, self.stamp_floor) != generation
+            ):
+                # popped while the value was being read, it may be stale
+                return
+            self.data[key] = (self.clock(), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: K) -> None:
+        with self.lock:
+            self.data.pop(key, None)
+            self.last_stamp += 1
+            self.stamps[key] = self.last_stamp
+            self.stamps.move_to_end(key)
+            while len(self.stamps) > self.max_size:
+                _, self.stamp_floor = self.stamps.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            size=len(self.data),
+        )
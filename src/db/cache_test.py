@@ -0,0 +1,44 @@
+from .cache import LRUCache
+
+
+def test_lru_eviction() -> None:
+    cache: LRUCache[int, str] = LRUCache(max_size=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert cache.stats.evictions == 1
+
+
+def test_ttl_expiry() -> None:
+    now = [0.0]
+    cache: LRUCache[int, str] = LRUCache(max_size=10, ttl=5, clock=lambda: now[0])
+    cache.set(1, "a")
+    now[0] = 4
+    assert cache.get(1) == "a"
+    now[0] = 6
+    assert cache.get(1) is None
+
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.expirations, stats.size) == (1, 1, 1, 0)
+
+
+def test_set_skipped_after_pop_during_read() -> None:
+    cache: LRUCache[int, str] = LRUCache(max_size=1)
+    generation = cache.generation(1)
+    cache.pop(1)
+    cache.set(1, "stale", generation)
+    assert cache.get(1) is None
+
+    # forgotten stamps still count as a pop
+    generation = cache.generation(1)
+    cache.pop(1)
+    cache.pop(2)
+    cache.set(1, "stale", generation)
+    assert cache.get(1) is None
+    cache.set(1, "fresh", cache.generation(1))
+    assert cache.get(1) == "fresh"
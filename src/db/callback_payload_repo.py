@@ -0,0 +1,92 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from .connection import DB, ConnectionManager
+from .executor import DBExecutor
+from .migrations import run_migrations
+
+
+# Callback payloads too large for a button's callback_data, by the key the
+# button carries instead. Times are epoch seconds.
+class ICallbackPayloadRepo(ABC):
+    @abstractmethod
+    def set_many(self, payloads: Dict[bytes, bytes], expires_at: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, key: bytes, now: int) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_expired(self, now: int) -> int:
+        raise NotImplementedError
+
+
+class CallbackPayloadRepo(ICallbackPayloadRepo):
+    def __init__(self, sqlitedb: DB, do_migrate: bool):
+        self.db = ConnectionManager.wrap(sqlitedb)
+        if do_migrate:
+            self.migrate()
+
+    def migrate(self) -> None:
+        run_migrations(self.db)
+
+    def set_many(self, payloads: Dict[bytes, bytes], expires_at: int) -> None:
+        stmt = """
+        INSERT OR REPLACE INTO callback_payload(key, payload, expires_at)
+        VALUES (?, ?, ?)
+        """
+        with self.db.writer() as conn:
+            conn.executemany(
+                stmt,
+                [(key, payload, expires_at) for key, payload in payloads.items()],
+            )
+
+    def get(self, key: bytes, now: int) -> Optional[bytes]:
+        stmt = """
+        SELECT payload
+        FROM callback_payload
+        WHERE key = ? AND expires_at > ?
+        """
+        with self.db.reader() as conn:
+            row = conn.execute(stmt, (key, now)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def delete_expired(self, now: int) -> int:
+        with self.db.writer() as conn:
+            cursor = conn.execute(
+                "DELETE FROM callback_payload WHERE expires_at <= ?",
+                (now,),
+            )
+            return cursor.rowcount
+
+
+class IAsyncCallbackPayloadRepo(ABC):
+    @abstractmethod
+    async def set_many(self, payloads: Dict[bytes, bytes], expires_at: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, key: bytes, now: int) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_expired(self, now: int) -> int:
+        raise NotImplementedError
+
+
+class AsyncCallbackPayloadRepo(IAsyncCallbackPayloadRepo):
+    def __init__(self, repo: ICallbackPayloadRepo, executor: DBExecutor):
+        self.repo = repo
+        self.executor = executor
+
+    async def set_many(self, payloads: Dict[bytes, bytes], expires_at: int) -> None:
+        await self.executor.run(self.repo.set_many, payloads, expires_at)
+
+    async def get(self, key: bytes, now: int) -> Optional[bytes]:
+        return await self.executor.run(self.repo.get, key, now)
+
+    async def delete_expired(self, now: int) -> int:
+        return await self.executor.run(self.repo.delete_expired, now)
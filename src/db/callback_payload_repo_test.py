@@ -0,0 +1,18 @@
+import sqlite3
+
+from .callback_payload_repo import CallbackPayloadRepo
+
+
+def test_callback_payload_repo() -> None:
+    sqlitedb = sqlite3.connect(":memory:")
+    repo = CallbackPayloadRepo(sqlitedb=sqlitedb, do_migrate=True)
+
+    repo.set_many({b"a": b"payload a", b"b": b"payload b"}, expires_at=100)
+    repo.set_many({b"c": b"payload c"}, expires_at=200)
+    assert repo.get(b"a", now=99) == b"payload a"
+    assert repo.get(b"a", now=100) is None
+    assert repo.get(b"missing", now=0) is None
+
+    assert repo.delete_expired(now=150) == 2
+    assert repo.get(b"c", now=150) == b"payload c"
+    assert sqlitedb.execute("SELECT count(*) FROM callback_payload").fetchone() == (1,)
@@ -0,0 +1,275 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Iterator, List, Optional, Tuple, Union
+
+from .tracing import QueryTracer, TracingConnection
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def connect(
+    database: str,
+    timeout: float = 1,
+    synchronous: str = "NORMAL",
+    cache_size_kib: int = 8192,
+    read_only: bool = False,
+    tracer: Optional[QueryTracer] = None,
+) -> sqlite3.Connection:
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"invalid synchronous mode: {synchronous}")
+    factory = sqlite3.Connection if tracer is None else TracingConnection
+    if read_only:
+        conn = sqlite3.connect(
+            f"file:{database}?mode=ro",
+            uri=True,
+            timeout=timeout,
+            check_same_thread=False,
+            factory=factory,
+        )
+    else:
+        conn = sqlite3.connect(
+            database,
+            timeout=timeout,
+            check_same_thread=False,
+            factory=factory,
+        )
+    if tracer is not None:
+        conn.tracer = tracer  # type: ignore[attr-defined]
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute(f"PRAGMA cache_size=-{cache_size_kib}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+# One serialized writer connection plus a pool of read-only connections.
+# In-memory databases can't be shared between connections, so for them (and
+# for connections handed in directly) every query goes through the writer
+# connection under the writer lock.
+#
+# Every writer() block runs inside a savepoint, so blocks nest: the outermost
+# one is a unit of work and nothing is committed before it exits. With a
+# group commit window, the first finished unit of work waits until every
+# writer already queued for the lock has finished too (or the window passes)
+# and commits them all at once; writer() still returns only after its changes
+# are committed.
+class ConnectionManager:
+    def __init__(
+        self,
+        writer_conn: sqlite3.Connection,
+        sqlite_file: Optional[str] = None,
+        readers: int = 0,
+        timeout: float = 1,
+        synchronous: str = "NORMAL",
+        cache_size_kib: int = 8192,
+        group_commit_window: float = 0,
+        tracer: Optional[QueryTracer] = None,
+    ):
+        self.writer_conn = writer_conn
+        self.write_lock = threading.RLock()
+        self.sqlite_file = sqlite_file
+        self.timeout = timeout
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.tracer = tracer
+
+        self.shared = sqlite_file in (None, ":memory:") or readers < 1
+        self.max_readers = 0 if self.shared else readers
+        self.idle_readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self.all_readers: List[sqlite3.Connection] = []
+        self.readers_lock = threading.Lock()
+
+        self.depth = 0
+        self.owner: Optional[int] = None
+        self.commit_callbacks: List[Callable[[], None]] = []
+
+        self.group_commit_window = group_commit_window
+        self.pending_lock = threading.Lock()
+        self.pending_writers = 0
+        self.committed = threading.Condition(self.write_lock)
+        self.batch = 0
+        self.commit_scheduled = False
+        self.failed_batch: Optional[Tuple[int, BaseException]] = None
+        self.commits = 0
+
+    @classmethod
+    def open(
+        cls,
+        sqlite_file: str,
+        readers: int = 4,
+        timeout: float = 1,
+        synchronous: str = "NORMAL",
+        cache_size_kib: int = 8192,
+        group_commit_window: float = 0,
+        tracer: Optional[QueryTracer] = None,
+    ) -> "ConnectionManager":
+        writer_conn = connect(
+            sqlite_file,
+            timeout,
+            synchronous,
+            cache_size_kib,
+            tracer=tracer,
+        )
+        if sqlite_file != ":memory:":
+            mode = writer_conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                raise ValueError(f"couldn't enable WAL on {sqlite_file}: {mode}")
+        return cls(
+            writer_conn,
+            sqlite_file=sqlite_file,
+            readers=readers,
+            timeout=timeout,
+            synchronous=synchronous,
+            cache_size_kib=cache_size_kib,
+            group_commit_window=group_commit_window,
+            tracer=tracer,
+        )
+
+    @classmethod
+    def wrap(
+        cls,
+        sqlitedb: Union[sqlite3.Connection, "ConnectionManager"],
+    ) -> "ConnectionManager":
+        if isinstance(sqlitedb, ConnectionManager):
+            return sqlitedb
+        return cls(sqlitedb)
+
+    @property
+    def readers_count(self) -> int:
+        return len(self.all_readers)
+
+    def acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self.idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self.readers_lock:
+            if len(self.all_readers) < self.max_readers and self.sqlite_file:
+                conn = connect(
+                    self.sqlite_file,
+                    self.timeout,
+                    self.synchronous,
+                    self.cache_size_kib,
+                    read_only=True,
+                    tracer=self.tracer,
+                )
+                self.all_readers.append(conn)
+                return conn
+        return self.idle_readers.get()
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        # inside a unit of work reads must see its uncommitted writes
+        if self.shared or self.in_unit_of_work():
+            with self.write_lock:
+                yield self.writer_conn
+            return
+
+        conn = self.acquire_reader()
+        try:
+            yield conn
+        finally:
+            self.idle_readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        conn = self.writer_conn
+        if not self.in_unit_of_work():
+            with self.pending_lock:
+                self.pending_writers += 1
+        with self.write_lock:
+            savepoint = f"unit_of_work_{self.depth}"
+            callbacks_count = len(self.commit_callbacks)
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"SAVEPOINT {savepoint}")
+            self.depth += 1
+            self.owner = threading.get_ident()
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                del self.commit_callbacks[callbacks_count:]
+                self.release(savepoint)
+                if self.depth == 0 and not self.commit_scheduled:
+                    # nothing else is pending, don't keep the write lock
+                    self.commit()
+                raise
+            self.release(savepoint)
+
+            if self.depth > 0:
+                return
+            callbacks, self.commit_callbacks = self.commit_callbacks, []
+            if self.group_commit_window > 0:
+                self.wait_for_group_commit()
+            else:
+                try:
+                    self.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            for callback in callbacks:
+                callback()
+
+    def in_unit_of_work(self) -> bool:
+        return self.owner == threading.get_ident()
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        # inside a unit of work, wait for it to commit; drop it on rollback
+        if self.in_unit_of_work():
+            self.commit_callbacks.append(callback)
+        else:
+            callback()
+
+    def release(self, savepoint: str) -> None:
+        self.writer_conn.execute(f"RELEASE {savepoint}")
+        self.depth -= 1
+        if self.depth == 0:
+            self.owner = None
+            with self.pending_lock:
+                self.pending_writers -= 1
+
+    def transaction(self) -> ContextManager[sqlite3.Connection]:
+        return self.writer()
+
+    def commit(self) -> None:
+        self.writer_conn.commit()
+        self.commits += 1
+
+    def wait_for_group_commit(self) -> None:
+        # called with the write lock held; waiting releases it
+        batch = self.batch
+        if self.commit_scheduled:
+            self.committed.notify_all()
+            self.committed.wait_for(lambda: self.batch > batch)
+        else:
+            self.commit_scheduled = True
+            self.committed.wait_for(
+                lambda: self.pending_writers == 0,
+                timeout=self.group_commit_window,
+            )
+            try:
+                self.commit()
+            except BaseException as error:
+                self.writer_conn.rollback()
+                self.failed_batch = (batch, error)
+            self.batch += 1
+            self.commit_scheduled = False
+            self.committed.notify_all()
+
+        if self.failed_batch is not None and self.failed_batch[0] == batch:
+            raise sqlite3.OperationalError(
+                f"group commit failed: {self.failed_batch[1]}",
+            )
+
+    def close(self) -> None:
+        with self.readers_lock:
+            for conn in self.all_readers:
+                conn.close()
+            self.all_readers.clear()
+        with self.write_lock:
+            self.writer_conn.close()
+
+
+DB = Union[sqlite3.Connection, ConnectionManager]
@@ -0,0 +1,96 @@
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from .connection import ConnectionManager
+from .epic_repo import Epic, EpicRepo
+
+
+def test_wal_enabled(tmp_path: Path) -> None:
+    manager = ConnectionManager.open(str(tmp_path / "data.db"), readers=2)
+    mode = manager.writer_conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    manager.close()
+
+
+def test_reads_dont_wait_behind_writes(tmp_path: Path) -> None:
+    manager = ConnectionManager.open(str(tmp_path / "data.db"), readers=2)
+    repo = EpicRepo(manager, do_migrate=True)
+    repo.create(Epic(name="first", description="", chat_id=1))
+
+    names: List[str] = []
+
+    def read() -> None:
+        names.extend(epic.name for epic in repo.get_by_chat_id(1))
+
+    with manager.writer() as conn:
+        conn.execute(
+            "INSERT INTO epic (chat_id, name, description) VALUES (1, 'second', '')",
+        )
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+        # the uncommitted row is invisible to the reader
+        assert names == ["first"]
+
+    assert [epic.name for epic in repo.get_by_chat_id(1)] == ["first", "second"]
+    assert manager.readers_count == 1
+    manager.close()
+
+
+def test_wrapped_connection_is_shared() -> None:
+    repo = EpicRepo(ConnectionManager.open(":memory:"), do_migrate=True)
+    epic_id = repo.create(Epic(name="foo", description="bar", chat_id=1))
+    assert repo.get_by_id(epic_id).name == "foo"
+    assert repo.db.shared
+
+
+def test_unit_of_work_commits_once(tmp_path: Path) -> None:
+    manager = ConnectionManager.open(str(tmp_path / "data.db"), readers=2)
+    repo = EpicRepo(manager, do_migrate=True)
+    commits = manager.commits
+
+    with manager.transaction():
+        epic_id = repo.create(Epic(name="foo", description="", chat_id=1))
+        repo.edit(epic_id, "name", "bar")
+        # reads inside the unit of work see its own writes
+        assert repo.get_by_id(epic_id).name == "bar"
+    assert manager.commits == commits + 1
+
+    with pytest.raises(ValueError):
+        with manager.transaction():
+            repo.create(Epic(name="baz", description="", chat_id=1))
+            repo.delete(1000)
+    assert [epic.name for epic in repo.get_by_chat_id(1)] == ["bar"]
+    manager.close()
+
+
+def test_group_commit_batches_concurrent_writers(tmp_path: Path) -> None:
+    manager = ConnectionManager.open(
+        str(tmp_path / "data.db"),
+        readers=2,
+        group_commit_window=0.05,
+    )
+    repo = EpicRepo(manager, do_migrate=True)
+    commits = manager.commits
+
+    def write(i: int) -> None:
+        repo.create(Epic(name=str(i), description="", chat_id=1))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    # queue every writer behind the lock so they all land in one batch
+    with manager.write_lock:
+        for thread in threads:
+            thread.start()
+        while manager.pending_writers < len(threads):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    assert len(repo.get_by_chat_id(1)) == 8
+    assert manager.commits - commits == 1
+    manager.close()
@@ -1,9 +1,13 @@
-import sqlite3
-import zoneinfo
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
+
+from .cache import CacheStats, LRUCache
+from .connection import DB, ConnectionManager
+from .executor import DBExecutor
+from .migrations import run_migrations
+from .utils import to_timestamp
 
 
 @dataclass
@@ -37,35 +41,25 @@ class IEpicRepo(ABC):
 
 
 class EpicRepo(IEpicRepo):
-    def __init__(self, sqlitedb: sqlite3.Connection, do_migrate: bool):
-        self.sqlitedb = sqlitedb
+    def __init__(self, sqlitedb: DB, do_migrate: bool):
+        self.db = ConnectionManager.wrap(sqlitedb)
         if do_migrate:
             self.migrate()
 
     def migrate(self) -> None:
-        stmt = """
-        CREATE TABLE IF NOT EXISTS epic (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_id INTEGER,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL,
-            deleted_at TIMESTAMP DEFAULT NULL
-        );
-        """
-        self.sqlitedb.execute(stmt)
-        self.sqlitedb.commit()
+        run_migrations(self.db)
 
     def create(self, epic: Epic) -> int:
         stmt = """
         INSERT INTO epic (chat_id, name, description)
         VALUES (?, ?, ?)
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (epic.chat_id, epic.name, epic.description))
-        out = cursor.lastrowid
-        if out is None:
-            raise ValueError("couldn't get id of inserted row")
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (epic.chat_id, epic.name, epic.description))
+            out = cursor.lastrowid
+            if out is None:
+                raise ValueError("couldn't get id of inserted row")
         return out
 
     def get_by_chat_id(self, chat_id: int) -> List[Epic]:
@@ -74,11 +68,14 @@ class EpicRepo(IEpicRepo):
         FROM epic
         WHERE chat_id = ? AND deleted_at IS NULL
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (chat_id,))
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (chat_id,))
+            rows = cursor.fetchall()
+            cursor.close()
 
         epics = []
-        for row in cursor.fetchall():
+        for row in rows:
             epics.append(
                 Epic(
                     id=row[0],
@@ -87,7 +84,6 @@ class EpicRepo(IEpicRepo):
                     chat_id=chat_id,
                 ),
             )
-        cursor.close()
         return epics.copy()
 
     def get_by_id(self, epic_id: int) -> Epic:
@@ -96,9 +92,11 @@ class EpicRepo(IEpicRepo):
         FROM epic
         WHERE id = ? AND deleted_at IS NULL
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (epic_id,))
-        row = cursor.fetchone()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (epic_id,))
+            row = cursor.fetchone()
+            cursor.close()
         if row is None:
             raise ValueError(f"epic with id {epic_id} not found")
         return Epic(
@@ -114,14 +112,16 @@ class EpicRepo(IEpicRepo):
         SET deleted_at = ?
         WHERE id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(
-            stmt,
-            (datetime.now(zoneinfo.ZoneInfo("Asia/Tehran")).isoformat(), epic_id),
-        )
-        if cursor.rowcount == 0:
-            raise ValueError(f"epic with id {epic_id} not found or already deleted")
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                stmt,
+                (to_timestamp(datetime.now()), epic_id),
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(
+                    f"epic with id {epic_id} not found or already deleted",
+                )
 
     def edit(self, epic_id: int, column: str, value: str) -> None:
         assert column in ("name", "description"), column
@@ -131,8 +131,114 @@ class EpicRepo(IEpicRepo):
         SET {column} = ?
         WHERE id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (value, epic_id))
-        if cursor.rowcount == 0:
-            raise ValueError(f"epic with id {epic_id} not found")
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (value, epic_id))
+            if cursor.rowcount == 0:
+                raise ValueError(f"epic with id {epic_id} not found")
+
+
+class CachedEpicRepo(IEpicRepo):
+    def __init__(
+        self,
+        repo: IEpicRepo,
+        sqlitedb: DB,
+        max_size: int,
+        on_delete: Optional[Callable[[int], None]] = None,
+    ):
+        self.repo = repo
+        self.db = ConnectionManager.wrap(sqlitedb)
+        self.by_id: LRUCache[int, Epic] = LRUCache(max_size)
+        self.by_chat_id: LRUCache[int, List[Epic]] = LRUCache(max_size)
+        # called with the chat id of a deleted epic
+        self.on_delete = on_delete
+
+    @property
+    def stats(self) -> Dict[str, CacheStats]:
+        return {"epic": self.by_id.stats, "epic_list": self.by_chat_id.stats}
+
+    def invalidate(self, chat_id: int, epic_id: Optional[int] = None) -> None:
+        def pop() -> None:
+            self.by_chat_id.pop(chat_id)
+            if epic_id is not None:
+                self.by_id.pop(epic_id)
+
+        # readers may cache the old rows until the write commits
+        pop()
+        self.db.after_commit(pop)
+
+    def create(self, epic: Epic) -> int:
+        self.invalidate(epic.chat_id)
+        return self.repo.create(epic)
+
+    def get_by_id(self, epic_id: int) -> Epic:
+        epic = self.by_id.get(epic_id)
+        if epic is None:
+            generation = self.by_id.generation(epic_id)
+            epic = self.repo.get_by_id(epic_id)
+            if not self.db.in_unit_of_work():
+                self.by_id.set(epic_id, epic, generation)
+        return replace(epic)
+
+    def get_by_chat_id(self, chat_id: int) -> List[Epic]:
+        epics = self.by_chat_id.get(chat_id)
+        if epics is None:
+            generation = self.by_chat_id.generation(chat_id)
+            epics = self.repo.get_by_chat_id(chat_id)
+            if not self.db.in_unit_of_work():
+                self.by_chat_id.set(chat_id, epics, generation)
+        return [replace(epic) for epic in epics]
+
+    def delete(self, epic_id: int) -> None:
+        chat_id = self.get_by_id(epic_id).chat_id
+        self.invalidate(chat_id, epic_id)
+        self.repo.delete(epic_id)
+        if self.on_delete is not None:
+            self.on_delete(chat_id)
+
+    def edit(self, epic_id: int, column: str, value: str) -> None:
+        self.invalidate(self.get_by_id(epic_id).chat_id, epic_id)
+        self.repo.edit(epic_id, column, value)
+
+
+class IAsyncEpicRepo(ABC):
+    @abstractmethod
+    async def create(self, e: Epic) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_id(self, epic_id: int) -> Epic:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_chat_id(self, chat_id: int) -> List[Epic]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, epic_id: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def edit(self, epic_id: int, column: str, value: str) -> None:
+        raise NotImplementedError
+
+
+class AsyncEpicRepo(IAsyncEpicRepo):
+    def __init__(self, repo: IEpicRepo, executor: DBExecutor):
+        self.repo = repo
+        self.executor = executor
+
+    async def create(self, epic: Epic) -> int:
+        return await self.executor.run(self.repo.create, epic)
+
+    async def get_by_id(self, epic_id: int) -> Epic:
+        return await self.executor.run(self.repo.get_by_id, epic_id)
+
+    async def get_by_chat_id(self, chat_id: int) -> List[Epic]:
+        return await self.executor.run(self.repo.get_by_chat_id, chat_id)
+
+    async def delete(self, epic_id: int) -> None:
+        await self.executor.run(self.repo.delete, epic_id)
+
+    async def edit(self, epic_id: int, column: str, value: str) -> None:
+        await self.executor.run(self.repo.edit, epic_id, column, value)
@@ -0,0 +1,58 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# called on the database thread with the method name, the seconds the call
+# waited for the thread and the seconds it ran
+QueryObserver = Callable[[str, float, float], None]
+
+
+def method_name(func: Callable) -> str:
+    # "CachedTaskRepo.get_by_id", or "TimarBot.handle_new_task.create_task"
+    return getattr(func, "__qualname__", repr(func)).replace(".<locals>", "")
+
+
+class DBExecutor:
+    def __init__(self, max_workers: int = 1, observer: Optional[QueryObserver] = None):
+        self.max_workers = max_workers
+        self.observer = observer
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="db",
+        )
+
+    async def run(self, func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        if self.observer is not None:
+            call = functools.partial(self.observed, func, call, time.perf_counter())
+        return await loop.run_in_executor(self.pool, call)
+
+    def observed(
+        self,
+        func: Callable,
+        call: Callable[[], T],
+        submitted_at: float,
+    ) -> T:
+        assert self.observer is not None
+        started_at = time.perf_counter()
+        try:
+            return call()
+        finally:
+            try:
+                self.observer(
+                    method_name(func),
+                    started_at - submitted_at,
+                    time.perf_counter() - started_at,
+                )
+            except Exception:
+                # metrics must never fail the query itself
+                pass
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,105 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Generator, Iterator, Tuple, TypeVar
+
+from .connection import DB, ConnectionManager
+from .migrations import run_migrations
+
+T = TypeVar("T")
+
+ExportRow = Tuple[Any, ...]
+
+# one row per timelog, with its task and epic; tasks without timelogs and
+# epics without tasks get a row with the missing columns empty. Times are
+# ISO 8601 in UTC.
+EXPORT_COLUMNS = (
+    "epic_id",
+    "epic_name",
+    "epic_description",
+    "epic_deleted_at",
+    "task_id",
+    "task_name",
+    "task_description",
+    "task_done",
+    "timelog_id",
+    "timelog_start",
+    "timelog_end",
+    "timelog_status",
+)
+
+
+class IExportRepo(ABC):
+    @abstractmethod
+    def iter_chat_history(self, chat_id: int) -> Generator[ExportRow, None, None]:
+        raise NotImplementedError
+
+
+class ExportRepo(IExportRepo):
+    def __init__(self, sqlitedb: DB, do_migrate: bool, batch_size: int = 500):
+        self.db = ConnectionManager.wrap(sqlitedb)
+        self.batch_size = batch_size
+        if do_migrate:
+            self.migrate()
+
+    def migrate(self) -> None:
+        run_migrations(self.db)
+
+    def iter_chat_history(self, chat_id: int) -> Generator[ExportRow, None, None]:
+        # sqlite steps the statement as rows are fetched, so only one batch
+        # is in memory at a time; the reader connection is held (and sees
+        # one snapshot) until the generator is exhausted or closed. Only
+        # epic.id is sorted on: anything finer needs a temp b-tree, while the
+        # joins already walk each epic's tasks and timelogs through indexes
+        stmt = """
+        SELECT epic.id, epic.name, epic.description,
+            strftime('%Y-%m-%dT%H:%M:%SZ', epic.deleted_at, 'unixepoch'),
+            task.id, task.name, task.description, task.done, timelog.id,
+            strftime('%Y-%m-%dT%H:%M:%SZ', timelog.start, 'unixepoch'),
+            strftime('%Y-%m-%dT%H:%M:%SZ', timelog.end, 'unixepoch'),
+            timelog.status
+        FROM epic
+        LEFT JOIN task ON task.epic_id = epic.id
+        LEFT JOIN timelog ON timelog.task_id = task.id
+        WHERE epic.chat_id = ?
+        ORDER BY epic.id
+        """
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = self.batch_size
+            try:
+                cursor.execute(stmt, (chat_id,))
+                while rows := cursor.fetchmany():
+                    yield from rows
+            finally:
+                cursor.close()
+
+
+class IAsyncExportRepo(ABC):
+    @abstractmethod
+    async def export_chat_history(
+        self,
+        chat_id: int,
+        consume: Callable[[Iterator[ExportRow]], T],
+    ) -> T:
+        raise NotImplementedError
+
+
+class AsyncExportRepo(IAsyncExportRepo):
+    def __init__(self, repo: IExportRepo):
+        self.repo = repo
+
+    async def export_chat_history(
+        self,
+        chat_id: int,
+        consume: Callable[[Iterator[ExportRow]], T],
+    ) -> T:
+        # consume runs in the same thread as the query; a long export gets
+        # its own thread instead of tying up one of the DBExecutor workers
+        def run() -> T:
+            rows = self.repo.iter_chat_history(chat_id)
+            try:
+                return consume(rows)
+            finally:
+                rows.close()
+
+        return await asyncio.to_thread(run)
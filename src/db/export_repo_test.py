@@ -0,0 +1,68 @@
+import sqlite3
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from .epic_repo import Epic, EpicRepo
+from .export_repo import EXPORT_COLUMNS, ExportRepo
+from .migrations import run_migrations
+from .task_repo import Task, TaskRepo
+from .timelog_repo import TimelogRepo
+
+
+def test_iter_chat_history() -> None:
+    conn = sqlite3.connect(":memory:")
+    run_migrations(conn)
+    epic_repo = EpicRepo(conn, do_migrate=False)
+    task_repo = TaskRepo(conn, do_migrate=False)
+    timelog_repo = TimelogRepo(conn, do_migrate=False)
+    export_repo = ExportRepo(conn, do_migrate=False, batch_size=2)
+
+    work = epic_repo.create(Epic(name="work", description="", chat_id=1))
+    epic_repo.create(Epic(name="empty", description="", chat_id=1))
+    other = epic_repo.create(Epic(name="other", description="", chat_id=2))
+    coding = task_repo.create(Task(name="coding", description="", epic_id=work))
+    task_repo.create(Task(name="idle", description="", epic_id=work))
+    task_repo.create(Task(name="x", description="", epic_id=other))
+    start = datetime(2025, 3, 10, 9)
+    for hour in range(3):
+        timelog_repo.create(coding, start + timedelta(hours=hour))
+
+    rows = [dict(zip(EXPORT_COLUMNS, row)) for row in export_repo.iter_chat_history(1)]
+    assert [(row["epic_name"], row["task_name"]) for row in rows] == [
+        ("work", "coding"),
+        ("work", "coding"),
+        ("work", "coding"),
+        ("work", "idle"),
+        ("empty", None),
+    ]
+    assert (
+        rows[0]["timelog_start"]
+        == f"{start.astimezone(timezone.utc):%Y-%m-%dT%H:%M:%SZ}"
+    )
+    assert rows[3]["timelog_id"] is None
+
+
+def test_iter_chat_history_memory_is_flat() -> None:
+    conn = sqlite3.connect(":memory:")
+    run_migrations(conn)
+    epic_id = EpicRepo(conn, do_migrate=False).create(
+        Epic(name="work", description="", chat_id=1),
+    )
+    task_id = TaskRepo(conn, do_migrate=False).create(
+        Task(name="coding", description="", epic_id=epic_id),
+    )
+    conn.executemany(
+        "INSERT INTO timelog (task_id, start, status) VALUES (?, ?, 'DONE')",
+        ((task_id, 1741597200 + i) for i in range(20000)),
+    )
+    export_repo = ExportRepo(conn, do_migrate=False, batch_size=100)
+
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in export_repo.iter_chat_history(1))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 20000
+    # the rows themselves would take several megabytes
+    assert peak < 512 * 1024
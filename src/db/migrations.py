@@ -0,0 +1,247 @@
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from .connection import DB, ConnectionManager
+from .rollup import rebuild_daily_rollup
+from .utils import add_column_if_not_exists, to_timestamp
+
+logger = logging.getLogger(__name__)
+
+# a migration returning False isn't done yet: what it did so far is
+# committed and it's called again, so big tables are converted in batches
+# without one long write transaction
+Migration = Callable[[sqlite3.Connection], Optional[bool]]
+
+TIMESTAMP_BATCH_SIZE = 5000
+
+
+def create_tables(conn: sqlite3.Connection) -> None:
+    # databases created before versioning already have some of these
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS epic (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            deleted_at TIMESTAMP DEFAULT NULL
+        );
+        """,
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS task (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            epic_id INTEGER NOT NULL,
+            FOREIGN KEY(epic_id) REFERENCES epics(id)
+        );
+        """,
+    )
+    add_column_if_not_exists(
+        sqlite_conn=conn,
+        table_name="task",
+        col_name="done",
+        col_type="BOOL",
+        default=False,
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timelog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start TIMESTAMP NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            task_id INTEGER NOT NULL,
+            end TIMESTAMP,
+            metadata TEXT DEFAULT NULL,
+            FOREIGN KEY (task_id) REFERENCES task(id)
+        );
+        """,
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_state (
+            user_id INTEGER PRIMARY KEY,
+            state INTEGER NOT NULL,
+            metadata TEXT DEFAULT NULL
+        );
+        """,
+    )
+
+
+def add_hot_path_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS epic_chat_id_idx
+        ON epic(chat_id) WHERE deleted_at IS NULL
+        """,
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS task_epic_id_done_idx ON task(epic_id, done)",
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS timelog_in_progress_idx
+        ON timelog(task_id) WHERE status = 'IN_PROGRESS'
+        """,
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS timelog_start_idx ON timelog(start)")
+
+
+def add_report_indexes(conn: sqlite3.Connection) -> None:
+    # reports walk chat -> epics -> tasks -> timelogs of each task by start
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS timelog_task_id_start_idx
+        ON timelog(task_id, start)
+        """,
+    )
+
+
+def create_daily_rollup(conn: sqlite3.Connection) -> None:
+    # recreated and backfilled by daily_rollup_by_epoch_day
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timelog_daily_rollup (
+            chat_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            epic_id INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (chat_id, day, epic_id, task_id)
+        ) WITHOUT ROWID
+        """,
+    )
+
+
+def add_timelog_message_columns(conn: sqlite3.Connection) -> None:
+    # the timer message used to be kept as the whole Message JSON in metadata
+    add_column_if_not_exists(conn, "timelog", "chat_id", "INTEGER")
+    add_column_if_not_exists(conn, "timelog", "message_id", "INTEGER")
+    cursor = conn.execute(
+        """
+        UPDATE timelog SET
+            chat_id = json_extract(metadata, '$.telegram_message.chat.id'),
+            message_id = json_extract(metadata, '$.telegram_message.message_id'),
+            metadata = NULL
+        WHERE metadata IS NOT NULL AND json_valid(metadata)
+        """,
+    )
+    logger.info(f"moved the message of {cursor.rowcount} timelogs out of metadata")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS timelog_chat_id_message_id_idx
+        ON timelog(chat_id, message_id)
+        """,
+    )
+
+
+def iso_to_timestamp(value: Optional[str]) -> Optional[int]:
+    return None if value is None else to_timestamp(datetime.fromisoformat(value))
+
+
+def convert_timestamps_to_epoch(conn: sqlite3.Connection) -> bool:
+    # timelogs were naive local time ISO strings and epic.deleted_at an ISO
+    # string with the Asia/Tehran offset. Numbers sort before text, so the
+    # rows still holding text are found through timelog_start_idx.
+    rows = conn.execute(
+        """
+        SELECT id, start, end FROM timelog WHERE start >= '' LIMIT ?
+        """,
+        (TIMESTAMP_BATCH_SIZE,),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE timelog SET start = ?, end = ? WHERE id = ?",
+        [
+            (iso_to_timestamp(start), iso_to_timestamp(end), timelog_id)
+            for timelog_id, start, end in rows
+        ],
+    )
+    if len(rows) == TIMESTAMP_BATCH_SIZE:
+        logger.info(f"converted timestamps up to timelog {rows[-1][0]}")
+        return False
+
+    epics = conn.execute(
+        "SELECT id, deleted_at FROM epic WHERE typeof(deleted_at) = 'text'",
+    ).fetchall()
+    conn.executemany(
+        "UPDATE epic SET deleted_at = ? WHERE id = ?",
+        [(iso_to_timestamp(deleted_at), epic_id) for epic_id, deleted_at in epics],
+    )
+    return True
+
+
+def daily_rollup_by_epoch_day(conn: sqlite3.Connection) -> None:
+    conn.execute("DROP TABLE IF EXISTS timelog_daily_rollup")
+    conn.execute(
+        """
+        CREATE TABLE timelog_daily_rollup (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            epic_id INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (chat_id, day, epic_id, task_id)
+        ) WITHOUT ROWID
+        """,
+    )
+    count = rebuild_daily_rollup(conn)
+    logger.info(f"backfilled timelog_daily_rollup with {count} rows")
+
+
+def create_callback_payload(conn: sqlite3.Connection) -> None:
+    # buttons whose payload doesn't fit in callback_data carry its key
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS callback_payload (
+            key BLOB PRIMARY KEY,
+            payload BLOB NOT NULL,
+            expires_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS callback_payload_expires_at_idx
+        ON callback_payload(expires_at)
+        """,
+    )
+
+
+# append only, the schema version is the number of applied migrations
+MIGRATIONS: List[Migration] = [
+    create_tables,
+    add_hot_path_indexes,
+    add_report_indexes,
+    create_daily_rollup,
+    add_timelog_message_columns,
+    convert_timestamps_to_epoch,
+    daily_rollup_by_epoch_day,
+    create_callback_payload,
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(sqlitedb: DB) -> int:
+    db = ConnectionManager.wrap(sqlitedb)
+    with db.reader() as conn:
+        if schema_version(conn) >= len(MIGRATIONS):
+            return len(MIGRATIONS)
+
+    while True:
+        # each migration is committed on its own, together with its version
+        with db.writer() as conn:
+            version = schema_version(conn)
+            if version >= len(MIGRATIONS):
+                return version
+            migration = MIGRATIONS[version]
+            logger.info(f"applying migration {version + 1}: {migration.__name__}")
+            if migration(conn) is False:
+                continue
+            conn.execute(f"PRAGMA user_version = {version + 1}")
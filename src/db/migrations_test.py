@@ -0,0 +1,159 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Generator, List
+
+import pytest
+
+from . import migrations
+from .migrations import (
+    MIGRATIONS,
+    add_timelog_message_columns,
+    convert_timestamps_to_epoch,
+    run_migrations,
+    schema_version,
+)
+from .utils import to_timestamp
+
+
+@pytest.fixture
+def conn() -> Generator[sqlite3.Connection, None, None]:
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+def query_plan(conn: sqlite3.Connection, stmt: str) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {stmt}").fetchall()
+    return "\n".join(row[3] for row in rows)
+
+
+def test_applies_all_migrations_once(conn: sqlite3.Connection) -> None:
+    assert run_migrations(conn) == len(MIGRATIONS)
+    assert schema_version(conn) == len(MIGRATIONS)
+
+    statements: List[str] = []
+    conn.set_trace_callback(statements.append)
+    assert run_migrations(conn) == len(MIGRATIONS)
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_upgrades_unversioned_database(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE task (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            epic_id INTEGER NOT NULL
+        )
+        """,
+    )
+    conn.execute("INSERT INTO task (name, description, epic_id) VALUES ('a', '', 1)")
+    conn.commit()
+
+    run_migrations(conn)
+    assert conn.execute("SELECT name, done FROM task").fetchall() == [("a", 0)]
+
+
+def test_moves_timer_message_out_of_metadata(conn: sqlite3.Connection) -> None:
+    version = MIGRATIONS.index(add_timelog_message_columns)
+    for migration in MIGRATIONS[:version]:
+        migration(conn)
+    conn.execute(f"PRAGMA user_version = {version}")
+    message = {"chat": {"id": 5}, "message_id": 42, "reply_markup": {}}
+    conn.executemany(
+        "INSERT INTO timelog (task_id, start, status, metadata) VALUES (?, ?, ?, ?)",
+        [
+            (
+                1,
+                "2025-01-01T10:00:00",
+                "DONE",
+                json.dumps({"telegram_message": message}),
+            ),
+            (1, "2025-01-01T11:00:00", "IN_PROGRESS", None),
+        ],
+    )
+    conn.commit()
+
+    run_migrations(conn)
+    rows = conn.execute(
+        "SELECT chat_id, message_id, metadata FROM timelog ORDER BY id",
+    ).fetchall()
+    assert rows == [(5, 42, None), (None, None, None)]
+
+
+def test_converts_timestamps_in_batches(
+    conn: sqlite3.Connection,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    version = MIGRATIONS.index(convert_timestamps_to_epoch)
+    for migration in MIGRATIONS[:version]:
+        migration(conn)
+    conn.execute(f"PRAGMA user_version = {version}")
+    start = datetime(2025, 1, 1, 23, 30)
+    conn.executemany(
+        "INSERT INTO timelog (task_id, start, end, status) VALUES (1, ?, ?, 'DONE')",
+        [
+            (
+                (start + timedelta(hours=i)).isoformat(),
+                (start + timedelta(hours=i, minutes=30)).isoformat(),
+            )
+            for i in range(5)
+        ],
+    )
+    conn.execute(
+        "INSERT INTO epic (chat_id, name, description, deleted_at) VALUES (1, '', '', ?)",
+        ("2025-01-01T10:00:00+03:30",),
+    )
+    conn.commit()
+
+    batches = []
+    conn.set_trace_callback(
+        lambda stmt: batches.append(stmt) if "start >= ''" in stmt else None,
+    )
+    monkeypatch.setattr(migrations, "TIMESTAMP_BATCH_SIZE", 2)
+    run_migrations(conn)
+    conn.set_trace_callback(None)
+
+    assert len(batches) == 3
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert conn.execute("SELECT start, end FROM timelog WHERE id = 1").fetchone() == (
+        to_timestamp(start),
+        to_timestamp(start) + 1800,
+    )
+    assert conn.execute("SELECT deleted_at FROM epic").fetchone() == (1735713000,)
+    assert conn.execute(
+        "SELECT count(*) FROM timelog WHERE start >= ''"
+    ).fetchone() == (0,)
+
+
+@pytest.mark.parametrize(
+    "stmt, index",
+    [
+        (
+            "SELECT id FROM epic WHERE chat_id = 1 AND deleted_at IS NULL",
+            "epic_chat_id_idx",
+        ),
+        (
+            "SELECT id FROM task WHERE epic_id IN (1, 2) AND done = false",
+            "task_epic_id_done_idx",
+        ),
+        (
+            "SELECT id FROM timelog WHERE status = 'IN_PROGRESS'",
+            "timelog_in_progress_idx",
+        ),
+        ("SELECT id FROM timelog WHERE start > 1735689600", "timelog_start_idx"),
+        (
+            "SELECT id FROM timelog WHERE task_id = 1 AND start < 1735689600",
+            "timelog_task_id_start_idx",
+        ),
+        (
+            "SELECT id FROM timelog WHERE chat_id = 1 AND message_id = 2",
+            "timelog_chat_id_message_id_idx",
+        ),
+    ],
+)
+def test_hot_paths_use_indexes(conn: sqlite3.Connection, stmt: str, index: str) -> None:
+    run_migrations(conn)
+    assert index in query_plan(conn, stmt)
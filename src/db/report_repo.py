@@ -0,0 +1,217 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+from .connection import DB, ConnectionManager
+from .executor import DBExecutor
+from .migrations import run_migrations
+from .utils import day_timestamp, to_timestamp
+
+
+@dataclass
+class TaskTotal:
+    task_id: int
+    task_name: str
+    seconds: float
+    running: bool = False
+
+
+@dataclass
+class EpicTotal:
+    epic_id: int
+    epic_name: str
+    seconds: float
+    tasks: List[TaskTotal] = field(default_factory=list)
+
+
+@dataclass
+class Report:
+    chat_id: int
+    since: datetime
+    until: datetime
+    # longest first, and tasks in each epic too
+    epics: List[EpicTotal] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return sum(epic.seconds for epic in self.epics)
+
+
+class IReportRepo(ABC):
+    @abstractmethod
+    def get_chat_report(
+        self,
+        chat_id: int,
+        since: datetime,
+        until: Optional[datetime] = None,
+    ) -> Report:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_chat_report_by_days(
+        self,
+        chat_id: int,
+        days: int,
+        now: Optional[datetime] = None,
+    ) -> Report:
+        raise NotImplementedError
+
+
+class ReportRepo(IReportRepo):
+    def __init__(self, sqlitedb: DB, do_migrate: bool):
+        self.db = ConnectionManager.wrap(sqlitedb)
+        if do_migrate:
+            self.migrate()
+
+    def migrate(self) -> None:
+        run_migrations(self.db)
+
+    def get_chat_report(
+        self,
+        chat_id: int,
+        since: datetime,
+        until: Optional[datetime] = None,
+    ) -> Report:
+        # timelogs are clipped to [since, until]; running ones end at until
+        stmt = """
+        SELECT epic.id, epic.name, task.id, task.name,
+            SUM(
+                MAX(
+                    0,
+                    MIN(COALESCE(timelog.end, :until), :until)
+                    - MAX(timelog.start, :since)
+                )
+            ) AS seconds,
+            MAX(timelog.status = 'IN_PROGRESS') AS running
+        FROM epic
+        JOIN task ON task.epic_id = epic.id
+        JOIN timelog ON timelog.task_id = task.id
+        WHERE epic.chat_id = :chat_id
+            AND epic.deleted_at IS NULL
+            AND timelog.start < :until
+            AND (timelog.end IS NULL OR timelog.end > :since)
+        GROUP BY task.id
+        ORDER BY SUM(seconds) OVER (PARTITION BY epic.id) DESC, epic.id, seconds DESC
+        """
+        until = until or datetime.now()
+        params = {
+            "chat_id": chat_id,
+            "since": to_timestamp(since),
+            "until": to_timestamp(until),
+        }
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, params)
+            rows = cursor.fetchall()
+
+        return self.build_report(chat_id, since, until, rows)
+
+    def get_chat_report_by_days(
+        self,
+        chat_id: int,
+        days: int,
+        now: Optional[datetime] = None,
+    ) -> Report:
+        # today and the days-1 days before it; closed timelogs come from the
+        # daily rollup, running ones from the few in progress timelogs
+        stmt = """
+        WITH totals AS (
+            SELECT task_id, SUM(seconds) AS seconds, 0 AS running
+            FROM timelog_daily_rollup
+            WHERE chat_id = :chat_id AND day >= :since
+            GROUP BY task_id
+            UNION ALL
+            SELECT timelog.task_id, MAX(0, :now - MAX(timelog.start, :since)), 1
+            FROM timelog
+            JOIN task ON task.id = timelog.task_id
+            JOIN epic ON epic.id = task.epic_id
+            WHERE timelog.status = 'IN_PROGRESS' AND epic.chat_id = :chat_id
+        )
+        SELECT epic.id, epic.name, task.id, task.name,
+            SUM(totals.seconds) AS seconds,
+            MAX(totals.running) AS running
+        FROM totals
+        JOIN task ON task.id = totals.task_id
+        JOIN epic ON epic.id = task.epic_id
+        WHERE epic.deleted_at IS NULL
+        GROUP BY task.id
+        ORDER BY SUM(seconds) OVER (PARTITION BY epic.id) DESC, epic.id, seconds DESC
+        """
+        if days < 1:
+            raise ValueError(f"days must be positive, got {days}")
+        now = now or datetime.now()
+        since = datetime.combine(now.date() - timedelta(days=days - 1), time())
+        params = {
+            "chat_id": chat_id,
+            "since": day_timestamp(since.date()),
+            "now": to_timestamp(now),
+        }
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, params)
+            rows = cursor.fetchall()
+        return self.build_report(chat_id, since, now, rows)
+
+    def build_report(
+        self,
+        chat_id: int,
+        since: datetime,
+        until: datetime,
+        rows: List[Tuple[int, str, int, str, float, int]],
+    ) -> Report:
+        report = Report(chat_id=chat_id, since=since, until=until)
+        for epic_id, epic_name, task_id, task_name, seconds, running in rows:
+            if not report.epics or report.epics[-1].epic_id != epic_id:
+                report.epics.append(EpicTotal(epic_id, epic_name, 0))
+            epic = report.epics[-1]
+            epic.seconds += seconds
+            epic.tasks.append(TaskTotal(task_id, task_name, seconds, bool(running)))
+        return report
+
+
+class IAsyncReportRepo(ABC):
+    @abstractmethod
+    async def get_chat_report(
+        self,
+        chat_id: int,
+        since: datetime,
+        until: Optional[datetime] = None,
+    ) -> Report:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_chat_report_by_days(
+        self,
+        chat_id: int,
+        days: int,
+        now: Optional[datetime] = None,
+    ) -> Report:
+        raise NotImplementedError
+
+
+class AsyncReportRepo(IAsyncReportRepo):
+    def __init__(self, repo: IReportRepo, executor: DBExecutor):
+        self.repo = repo
+        self.executor = executor
+
+    async def get_chat_report(
+        self,
+        chat_id: int,
+        since: datetime,
+        until: Optional[datetime] = None,
+    ) -> Report:
+        return await self.executor.run(self.repo.get_chat_report, chat_id, since, until)
+
+    async def get_chat_report_by_days(
+        self,
+        chat_id: int,
+        days: int,
+        now: Optional[datetime] = None,
+    ) -> Report:
+        return await self.executor.run(
+            self.repo.get_chat_report_by_days,
+            chat_id,
+            days,
+            now,
+        )
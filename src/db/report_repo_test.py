@@ -0,0 +1,116 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from .epic_repo import Epic, EpicRepo
+from .migrations import run_migrations
+from .report_repo import ReportRepo
+from .rollup import rebuild_daily_rollup, split_by_day
+from .task_repo import Task, TaskRepo
+from .timelog_repo import TimelogRepo
+from .utils import day_timestamp
+
+NOW = datetime(2025, 3, 10, 12, 0, 0)
+
+
+@pytest.fixture
+def repos() -> tuple:
+    conn = sqlite3.connect(":memory:")
+    run_migrations(conn)
+    return (
+        EpicRepo(conn, do_migrate=False),
+        TaskRepo(conn, do_migrate=False),
+        TimelogRepo(conn, do_migrate=False),
+        ReportRepo(conn, do_migrate=False),
+    )
+
+
+def test_chat_report(repos: tuple) -> None:
+    epic_repo, task_repo, timelog_repo, report_repo = repos
+    work = epic_repo.create(Epic(name="work", description="", chat_id=1))
+    home = epic_repo.create(Epic(name="home", description="", chat_id=1))
+    other = epic_repo.create(Epic(name="other", description="", chat_id=2))
+    coding = task_repo.create(Task(name="coding", description="", epic_id=work))
+    review = task_repo.create(Task(name="review", description="", epic_id=work))
+    cooking = task_repo.create(Task(name="cooking", description="", epic_id=home))
+    elsewhere = task_repo.create(Task(name="x", description="", epic_id=other))
+
+    def log(task_id: int, start: timedelta, end: timedelta | None) -> None:
+        timelog_id = timelog_repo.create(task_id, NOW - start)
+        if end is not None:
+            timelog_repo.set_end_if_not_exists(timelog_id, NOW - end)
+
+    log(coding, timedelta(hours=3), timedelta(hours=1))
+    # started before the report window, only the last hour counts
+    log(coding, timedelta(hours=25), timedelta(hours=23))
+    # still running, clipped to now
+    log(review, timedelta(minutes=30), None)
+    log(cooking, timedelta(hours=1), timedelta(minutes=30))
+    # outside the window
+    log(cooking, timedelta(days=3), timedelta(days=2, hours=23))
+    log(elsewhere, timedelta(hours=1), timedelta(minutes=1))
+
+    report = report_repo.get_chat_report(1, since=NOW - timedelta(days=1), until=NOW)
+    assert [epic.epic_name for epic in report.epics] == ["work", "home"]
+    work_total, home_total = report.epics
+    assert [task.task_name for task in work_total.tasks] == ["coding", "review"]
+    assert work_total.tasks[0].seconds == pytest.approx(3 * 3600, abs=1)
+    assert work_total.tasks[1].running
+    assert work_total.seconds == pytest.approx(3.5 * 3600, abs=1)
+    assert home_total.seconds == pytest.approx(1800, abs=1)
+    assert report.seconds == pytest.approx(4 * 3600, abs=1)
+
+    assert report_repo.get_chat_report(3, since=NOW - timedelta(days=1)).epics == []
+
+
+def test_daily_rollup_matches_timelogs(repos: tuple) -> None:
+    epic_repo, task_repo, timelog_repo, report_repo = repos
+    epic_id = epic_repo.create(Epic(name="work", description="", chat_id=1))
+    task_id = task_repo.create(Task(name="coding", description="", epic_id=epic_id))
+
+    def log(start: datetime, end: datetime) -> int:
+        timelog_id = timelog_repo.create(task_id, start)
+        timelog_repo.set_end_if_not_exists(timelog_id, end)
+        return timelog_id
+
+    # crosses midnight into the report's first day
+    log(datetime(2025, 3, 7, 23, 0), datetime(2025, 3, 8, 1, 0))
+    deleted = log(datetime(2025, 3, 9, 10, 0), datetime(2025, 3, 9, 11, 0))
+    log(datetime(2025, 3, 10, 9, 0), datetime(2025, 3, 10, 10, 0))
+    # already closed, must not count twice
+    timelog_repo.set_end_if_not_exists(deleted, datetime(2025, 3, 9, 12, 0))
+    timelog_repo.delete(deleted)
+    # running since 11:00
+    timelog_repo.create(task_id, datetime(2025, 3, 10, 11, 0))
+
+    conn = report_repo.db.writer_conn
+    rows = conn.execute(
+        "SELECT day, seconds FROM timelog_daily_rollup ORDER BY day",
+    ).fetchall()
+    days = [day_timestamp(date(2025, 3, day)) for day in (7, 8, 10)]
+    assert rows == [(day, 3600) for day in days]
+    assert rebuild_daily_rollup(conn) == 3
+    assert (
+        conn.execute(
+            "SELECT day, seconds FROM timelog_daily_rollup ORDER BY day",
+        ).fetchall()
+        == rows
+    )
+
+    report = report_repo.get_chat_report_by_days(1, days=3, now=NOW)
+    assert report.since == datetime(2025, 3, 8)
+    # an hour on the 8th, an hour this morning and the running hour
+    assert report.seconds == pytest.approx(3 * 3600, abs=1)
+    assert report.epics[0].tasks[0].running
+    raw = report_repo.get_chat_report(1, since=report.since, until=NOW)
+    assert raw.seconds == pytest.approx(report.seconds, abs=1)
+
+
+def test_split_by_day() -> None:
+    assert split_by_day(datetime(2025, 1, 1, 23), datetime(2025, 1, 3, 1)) == [
+        (date(2025, 1, 1), 3600),
+        (date(2025, 1, 2), 86400),
+        (date(2025, 1, 3), 3600),
+    ]
+    assert split_by_day(datetime(2025, 1, 2), datetime(2025, 1, 1)) == []
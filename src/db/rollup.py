@@ -0,0 +1,90 @@
+import logging
+import sqlite3
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from .utils import day_timestamp, from_timestamp
+
+logger = logging.getLogger(__name__)
+
+RollupKey = Tuple[int, int, int, int]
+
+
+# Closed timelogs summed per (chat, day, epic, task), so reports over whole
+# days read one row per task and day instead of every timelog. A day is the
+# epoch timestamp of the local midnight it starts at.
+def split_by_day(start: datetime, end: datetime) -> List[Tuple[date, float]]:
+    parts = []
+    while start < end:
+        midnight = datetime.combine(start.date() + timedelta(days=1), time())
+        part_end = min(end, midnight)
+        parts.append((start.date(), (part_end - start).total_seconds()))
+        start = part_end
+    return parts
+
+
+def add_timelog(conn: sqlite3.Connection, timelog_id: int, sign: int = 1) -> None:
+    # sign -1 takes a closed timelog out again; call before deleting it
+    row = conn.execute(
+        """
+        SELECT epic.chat_id, task.epic_id, timelog.task_id, timelog.start, timelog.end
+        FROM timelog
+        JOIN task ON task.id = timelog.task_id
+        JOIN epic ON epic.id = task.epic_id
+        WHERE timelog.id = ? AND timelog.end IS NOT NULL
+        """,
+        (timelog_id,),
+    ).fetchone()
+    if row is None:
+        return
+    chat_id, epic_id, task_id, start, end = row
+
+    parts = split_by_day(from_timestamp(start), from_timestamp(end))
+    conn.executemany(
+        """
+        INSERT INTO timelog_daily_rollup (chat_id, day, epic_id, task_id, seconds)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (chat_id, day, epic_id, task_id)
+        DO UPDATE SET seconds = seconds + excluded.seconds
+        """,
+        [
+            (chat_id, day_timestamp(day), epic_id, task_id, sign * seconds)
+            for day, seconds in parts
+        ],
+    )
+    if sign < 0:
+        conn.execute(
+            """
+            DELETE FROM timelog_daily_rollup
+            WHERE chat_id = ? AND epic_id = ? AND task_id = ? AND seconds < 0.001
+            """,
+            (chat_id, epic_id, task_id),
+        )
+
+
+def rebuild_daily_rollup(conn: sqlite3.Connection) -> int:
+    totals: Dict[RollupKey, float] = defaultdict(float)
+    rows = conn.execute(
+        """
+        SELECT epic.chat_id, task.epic_id, timelog.task_id, timelog.start, timelog.end
+        FROM timelog
+        JOIN task ON task.id = timelog.task_id
+        JOIN epic ON epic.id = task.epic_id
+        WHERE timelog.end IS NOT NULL
+        """,
+    )
+    for chat_id, epic_id, task_id, start, end in rows:
+        parts = split_by_day(from_timestamp(start), from_timestamp(end))
+        for day, seconds in parts:
+            totals[(chat_id, day_timestamp(day), epic_id, task_id)] += seconds
+
+    conn.execute("DELETE FROM timelog_daily_rollup")
+    conn.executemany(
+        """
+        INSERT INTO timelog_daily_rollup (chat_id, day, epic_id, task_id, seconds)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [(*key, seconds) for key, seconds in totals.items()],
+    )
+    return len(totals)
@@ -1,9 +1,11 @@
-import sqlite3
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
 
-from .utils import add_column_if_not_exists
+from .cache import CacheStats, LRUCache
+from .connection import DB, ConnectionManager
+from .executor import DBExecutor
+from .migrations import run_migrations
 
 
 @dataclass
@@ -42,44 +44,25 @@ class ITaskRepo(ABC):
 
 
 class TaskRepo(ITaskRepo):
-    def __init__(self, sqlitedb: sqlite3.Connection, do_migrate: bool):
-        self.sqlitedb = sqlitedb
+    def __init__(self, sqlitedb: DB, do_migrate: bool):
+        self.db = ConnectionManager.wrap(sqlitedb)
         if do_migrate:
             self.migrate()
 
     def migrate(self) -> None:
-        stmt = """
-        CREATE TABLE IF NOT EXISTS task (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL,
-            epic_id INTEGER NOT NULL,
-            FOREIGN KEY(epic_id) REFERENCES epics(id)
-        );
-        """
-
-        self.sqlitedb.execute(stmt)
-        self.sqlitedb.commit()
-
-        add_column_if_not_exists(
-            sqlite_conn=self.sqlitedb,
-            table_name="task",
-            col_name="done",
-            col_type="BOOL",
-            default=False,
-        )
+        run_migrations(self.db)
 
     def create(self, task: Task) -> int:
         stmt = """
         INSERT INTO task (name, description, epic_id)
         VALUES (?, ?, ?)
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (task.name, task.description, task.epic_id))
-        out = cursor.lastrowid
-        if out is None:
-            raise ValueError("couldn't get id of inserted row")
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (task.name, task.description, task.epic_id))
+            out = cursor.lastrowid
+            if out is None:
+                raise ValueError("couldn't get id of inserted row")
         return out
 
     def get_undone_by_chat_id(self, chat_id: int) -> List[Task]:
@@ -87,15 +70,17 @@ class TaskRepo(ITaskRepo):
         SELECT id, name, description, epic_id
         FROM task
         WHERE epic_id IN
-        (SELECT id FROM epic WHERE chat_id = ?)
+        (SELECT id FROM epic WHERE chat_id = ? AND deleted_at IS NULL)
         AND
         done = false
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (chat_id,))
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (chat_id,))
+            rows = cursor.fetchall()
         return [
             Task(id=row[0], name=row[1], description=row[2], epic_id=row[3])
-            for row in cursor.fetchall()
+            for row in rows
         ]
 
     def get_by_id(self, task_id: int) -> Task:
@@ -104,9 +89,11 @@ class TaskRepo(ITaskRepo):
         FROM task
         WHERE id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (task_id,))
-        row = cursor.fetchone()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (task_id,))
+            row = cursor.fetchone()
+            cursor.close()
         if row is None:
             raise ValueError("task not found")
         return Task(id=row[0], name=row[1], description=row[2], epic_id=row[3])
@@ -121,9 +108,11 @@ class TaskRepo(ITaskRepo):
             WHERE id = ?
         )
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (task_id,))
-        row = cursor.fetchone()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (task_id,))
+            row = cursor.fetchone()
+            cursor.close()
         if row is None:
             raise ValueError("task not found")
         return row[0]
@@ -132,12 +121,145 @@ class TaskRepo(ITaskRepo):
         stmt = """
 DELETE FROM task WHERE id = ?
 """
-        self.sqlitedb.execute(stmt, (task_id,))
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            conn.execute(stmt, (task_id,))
 
     def edit(self, id: int, col: str, value: str) -> None:
         if col not in ("name", "description", "done"):
             raise ValueError(f"invalid column: {col}")
         stmt = f"UPDATE task SET {col} = ? WHERE id = ?"
-        self.sqlitedb.execute(stmt, (value, id))
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            conn.execute(stmt, (value, id))
+
+
+class CachedTaskRepo(ITaskRepo):
+    def __init__(self, repo: ITaskRepo, sqlitedb: DB, max_size: int):
+        self.repo = repo
+        self.db = ConnectionManager.wrap(sqlitedb)
+        self.by_id: LRUCache[int, Task] = LRUCache(max_size)
+        self.undone_by_chat_id: LRUCache[int, List[Task]] = LRUCache(max_size)
+        # a task never moves to another epic, and an epic to another chat
+        self.owner_chat: LRUCache[int, int] = LRUCache(max_size)
+
+    @property
+    def stats(self) -> Dict[str, CacheStats]:
+        return {
+            "task": self.by_id.stats,
+            "undone_task_list": self.undone_by_chat_id.stats,
+            "task_owner_chat": self.owner_chat.stats,
+        }
+
+    def invalidate(
+        self,
+        chat_id: Optional[int],
+        task_id: Optional[int] = None,
+    ) -> None:
+        def pop() -> None:
+            if chat_id is not None:
+                self.undone_by_chat_id.pop(chat_id)
+            if task_id is not None:
+                self.by_id.pop(task_id)
+
+        # readers may cache the old rows until the write commits
+        pop()
+        self.db.after_commit(pop)
+
+    def invalidate_chat(self, chat_id: int) -> None:
+        self.invalidate(chat_id)
+
+    def create(self, task: Task) -> int:
+        task_id = self.repo.create(task)
+        self.invalidate(self.find_owner_chat(task_id))
+        return task_id
+
+    def get_undone_by_chat_id(self, chat_id: int) -> List[Task]:
+        tasks = self.undone_by_chat_id.get(chat_id)
+        if tasks is None:
+            generation = self.undone_by_chat_id.generation(chat_id)
+            tasks = self.repo.get_undone_by_chat_id(chat_id)
+            if not self.db.in_unit_of_work():
+                self.undone_by_chat_id.set(chat_id, tasks, generation)
+        return [replace(task) for task in tasks]
+
+    def get_by_id(self, task_id: int) -> Task:
+        task = self.by_id.get(task_id)
+        if task is None:
+            generation = self.by_id.generation(task_id)
+            task = self.repo.get_by_id(task_id)
+            if not self.db.in_unit_of_work():
+                self.by_id.set(task_id, task, generation)
+        return replace(task)
+
+    def get_owner_chat(self, task_id: int) -> int:
+        chat_id = self.owner_chat.get(task_id)
+        if chat_id is None:
+            generation = self.owner_chat.generation(task_id)
+            chat_id = self.repo.get_owner_chat(task_id)
+            if not self.db.in_unit_of_work():
+                self.owner_chat.set(task_id, chat_id, generation)
+        return chat_id
+
+    def find_owner_chat(self, task_id: int) -> Optional[int]:
+        try:
+            return self.get_owner_chat(task_id)
+        except ValueError:
+            return None
+
+    def delete(self, task_id: int) -> None:
+        self.invalidate(self.find_owner_chat(task_id), task_id)
+        self.owner_chat.pop(task_id)
+        self.repo.delete(task_id)
+
+    def edit(self, id: int, col: str, value: str) -> None:
+        self.invalidate(self.find_owner_chat(id), id)
+        self.repo.edit(id, col, value)
+
+
+class IAsyncTaskRepo(ABC):
+    @abstractmethod
+    async def create(self, task: Task) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_undone_by_chat_id(self, chat_id: int) -> List[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_id(self, task_id: int) -> Task:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_owner_chat(self, task_id: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, task_id: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def edit(self, id: int, col: str, value: str) -> None:
+        raise NotImplementedError
+
+
+class AsyncTaskRepo(IAsyncTaskRepo):
+    def __init__(self, repo: ITaskRepo, executor: DBExecutor):
+        self.repo = repo
+        self.executor = executor
+
+    async def create(self, task: Task) -> int:
+        return await self.executor.run(self.repo.create, task)
+
+    async def get_undone_by_chat_id(self, chat_id: int) -> List[Task]:
+        return await self.executor.run(self.repo.get_undone_by_chat_id, chat_id)
+
+    async def get_by_id(self, task_id: int) -> Task:
+        return await self.executor.run(self.repo.get_by_id, task_id)
+
+    async def get_owner_chat(self, task_id: int) -> int:
+        return await self.executor.run(self.repo.get_owner_chat, task_id)
+
+    async def delete(self, task_id: int) -> None:
+        await self.executor.run(self.repo.delete, task_id)
+
+    async def edit(self, id: int, col: str, value: str) -> None:
+        await self.executor.run(self.repo.edit, id, col, value)
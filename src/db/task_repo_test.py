@@ -1,7 +1,8 @@
 import sqlite3
+from typing import List
 
-from .epic_repo import Epic, EpicRepo
-from .task_repo import Task, TaskRepo
+from .epic_repo import CachedEpicRepo, Epic, EpicRepo
+from .task_repo import CachedTaskRepo, Task, TaskRepo
 
 
 def test_task_repo() -> None:
@@ -23,3 +24,76 @@ def test_task_repo() -> None:
     assert tasks[0].name == "test"
     assert tasks[0].description == "test"
     assert tasks[0].epic_id == epic_id
+
+
+def test_cached_repos_invalidate_on_writes() -> None:
+    sqlitedb = sqlite3.connect(":memory:")
+    task_repo = CachedTaskRepo(
+        TaskRepo(sqlitedb=sqlitedb, do_migrate=True),
+        sqlitedb,
+        max_size=100,
+    )
+    epic_repo = CachedEpicRepo(
+        EpicRepo(sqlitedb=sqlitedb, do_migrate=True),
+        sqlitedb,
+        max_size=100,
+        on_delete=task_repo.invalidate_chat,
+    )
+
+    epic_id = epic_repo.create(Epic(name="e", description="", chat_id=1))
+    assert [e.id for e in epic_repo.get_by_chat_id(1)] == [epic_id]
+    task_id = task_repo.create(Task(name="t", description="", epic_id=epic_id))
+    assert [t.id for t in task_repo.get_undone_by_chat_id(1)] == [task_id]
+
+    assert task_repo.get_by_id(task_id).name == "t"
+    assert task_repo.get_by_id(task_id).name == "t"
+    assert task_repo.by_id.stats.hits == 1
+
+    task_repo.edit(task_id, "name", "renamed")
+    assert task_repo.get_by_id(task_id).name == "renamed"
+    task_repo.edit(task_id, "done", True)  # type: ignore[arg-type]
+    assert task_repo.get_undone_by_chat_id(1) == []
+
+    other_task_id = task_repo.create(Task(name="o", description="", epic_id=epic_id))
+    assert [t.id for t in task_repo.get_undone_by_chat_id(1)] == [other_task_id]
+
+    epic_repo.edit(epic_id, "name", "renamed")
+    assert epic_repo.get_by_id(epic_id).name == "renamed"
+    assert epic_repo.get_by_chat_id(1)[0].name == "renamed"
+
+    epic_repo.delete(epic_id)
+    assert epic_repo.get_by_chat_id(1) == []
+    assert task_repo.get_undone_by_chat_id(1) == []
+
+
+def test_read_that_races_a_commit_is_not_cached() -> None:
+    sqlitedb = sqlite3.connect(":memory:")
+    epic_id = EpicRepo(sqlitedb=sqlitedb, do_migrate=True).create(
+        Epic(name="e", description="", chat_id=1),
+    )
+
+    class RacingTaskRepo(TaskRepo):
+        def get_undone_by_chat_id(self, chat_id: int) -> List[Task]:
+            tasks = super().get_undone_by_chat_id(chat_id)
+            if tasks and tasks[0].name == "t" and tasks[0].id is not None:
+                # committed, and the cache invalidated, after the read
+                task_repo.edit(tasks[0].id, "name", "renamed")
+            return tasks
+
+        def get_by_id(self, task_id: int) -> Task:
+            task = super().get_by_id(task_id)
+            if task.name == "renamed":
+                task_repo.edit(task_id, "name", "final")
+            return task
+
+    task_repo = CachedTaskRepo(
+        RacingTaskRepo(sqlitedb=sqlitedb, do_migrate=False),
+        sqlitedb,
+        max_size=100,
+    )
+    task_id = task_repo.create(Task(name="t", description="", epic_id=epic_id))
+
+    assert [t.name for t in task_repo.get_undone_by_chat_id(1)] == ["t"]
+    assert [t.name for t in task_repo.get_undone_by_chat_id(1)] == ["renamed"]
+    assert task_repo.get_by_id(task_id).name == "renamed"
+    assert task_repo.get_by_id(task_id).name == "final"
@@ -1,10 +1,14 @@
-import sqlite3
-import zoneinfo
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+from . import rollup
+from .connection import DB, ConnectionManager
+from .executor import DBExecutor
+from .migrations import run_migrations
+from .utils import from_timestamp, to_timestamp
 
 
 class TimelogStatus(Enum):
@@ -13,6 +17,20 @@ class TimelogStatus(Enum):
     CANCELLED = 3
 
 
+def format_duration(seconds: float) -> str:
+    duration = ""
+    if hour := int(seconds // 3600):
+        duration += f"{hour} ساعت "
+    seconds = seconds % 3600
+    if minute := int(seconds // 60):
+        duration += f"{minute} دقیقه "
+    seconds = seconds % 60
+    if int(seconds):
+        duration += f"{int(seconds)} ثانیه "
+
+    return duration
+
+
 @dataclass
 class Timelog:
     id: int
@@ -20,24 +38,14 @@ class Timelog:
     start: datetime
     status: TimelogStatus
     end: Optional[datetime] = None
-    metadata: Optional[str] = None
+    # the timer message, set once it's sent
+    chat_id: Optional[int] = None
+    message_id: Optional[int] = None
 
     @property
     def eclapsed_time(self) -> str:
         end = self.end or datetime.now()
-        eclapsed = (end - self.start).total_seconds()
-
-        eclapsed_str = ""
-        if hour := int(eclapsed // 3600):
-            eclapsed_str += f"{hour} ساعت "
-        eclapsed = eclapsed % 3600
-        if minute := int(eclapsed // 60):
-            eclapsed_str += f"{minute} دقیقه "
-        eclapsed = eclapsed % 60
-        if seconds := int(eclapsed):
-            eclapsed_str += f"{seconds} ثانیه "
-
-        return eclapsed_str
+        return format_duration((end - self.start).total_seconds())
 
 
 class ITimelogRepo(ABC):
@@ -46,13 +54,17 @@ class ITimelogRepo(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def set_metadata(self, timelog_id: int, metadata: str) -> None:
+    def set_message(self, timelog_id: int, chat_id: int, message_id: int) -> None:
         raise NotImplementedError
 
     @abstractmethod
     def get_in_progress_logs(self) -> List[Timelog]:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_in_progress_logs_with_task_names(self) -> List[Tuple[Timelog, str]]:
+        raise NotImplementedError
+
     @abstractmethod
     def get_by_id(self, timelog_id: int) -> Timelog:
         raise NotImplementedError
@@ -75,126 +87,151 @@ class ITimelogRepo(ABC):
 
 
 class TimelogRepo(ITimelogRepo):
-    def __init__(self, sqlitedb: sqlite3.Connection, do_migrate: bool):
-        self.sqlitedb = sqlitedb
+    def __init__(self, sqlitedb: DB, do_migrate: bool):
+        self.db = ConnectionManager.wrap(sqlitedb)
         if do_migrate:
             self.migrate()
 
     def migrate(self) -> None:
-        stmt = """
-        CREATE TABLE IF NOT EXISTS timelog (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            start TIMESTAMP NOT NULL,
-            status VARCHAR(255) NOT NULL,
-            task_id INTEGER NOT NULL,
-            end TIMESTAMP,
-            metadata TEXT DEFAULT NULL,
-            FOREIGN KEY (task_id) REFERENCES task(id)
-        );
-        """
-        self.sqlitedb.execute(stmt)
-        self.sqlitedb.commit()
+        run_migrations(self.db)
 
     def create(self, task_id: int, start: datetime) -> int:
         stmt = """
         INSERT INTO timelog (task_id, start, status)
         VALUES (?, ?, ?)
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(
-            stmt,
-            (task_id, start.isoformat(), TimelogStatus.IN_PROGRESS.name),
-        )
-        self.sqlitedb.commit()
-        res = cursor.lastrowid
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                stmt,
+                (task_id, to_timestamp(start), TimelogStatus.IN_PROGRESS.name),
+            )
+            res = cursor.lastrowid
         if res is None:
             raise ValueError("return value is none")
         return res
 
-    def set_metadata(self, timelog_id: int, metadata: str) -> None:
+    def set_message(self, timelog_id: int, chat_id: int, message_id: int) -> None:
         stmt = """
-        UPDATE timelog SET metadata = ? WHERE id = ?
+        UPDATE timelog SET chat_id = ?, message_id = ? WHERE id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (metadata, timelog_id))
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (chat_id, message_id, timelog_id))
 
     def get_in_progress_logs(self) -> List[Timelog]:
         stmt = """
-        SELECT id, task_id, start, status, metadata
+        SELECT id, task_id, start, status, chat_id, message_id
         FROM timelog
-        WHERE status = ?
+        WHERE status = 'IN_PROGRESS'
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (TimelogStatus.IN_PROGRESS.name,))
-        rows = cursor.fetchall()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt)
+            rows = cursor.fetchall()
         ans = []
         for row in rows:
-            start = datetime.fromisoformat(row[2])
+            start = from_timestamp(row[2])
             ans.append(
                 Timelog(
                     id=row[0],
                     task_id=row[1],
                     start=start,
                     status=row[3],
-                    metadata=row[4],
+                    chat_id=row[4],
+                    message_id=row[5],
                 ),
             )
         return ans
 
+    def get_in_progress_logs_with_task_names(self) -> List[Tuple[Timelog, str]]:
+        stmt = """
+        SELECT timelog.id, timelog.task_id, timelog.start, timelog.status,
+            timelog.chat_id, timelog.message_id, task.name
+        FROM timelog
+        JOIN task ON task.id = timelog.task_id
+        WHERE timelog.status = 'IN_PROGRESS'
+        """
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt)
+            rows = cursor.fetchall()
+        ans = []
+        for row in rows:
+            timelog = Timelog(
+                id=row[0],
+                task_id=row[1],
+                start=from_timestamp(row[2]),
+                status=TimelogStatus[row[3]],
+                chat_id=row[4],
+                message_id=row[5],
+            )
+            ans.append((timelog, row[6]))
+        return ans
+
     def get_by_id(self, timelog_id: int) -> Timelog:
         stmt = """
-        SELECT id, task_id, start, status, metadata, end
+        SELECT id, task_id, start, status, end, chat_id, message_id
         FROM timelog
         WHERE id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (timelog_id,))
-        row = cursor.fetchall()[0]
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (timelog_id,))
+            row = cursor.fetchall()[0]
 
         return Timelog(
             id=row[0],
             task_id=row[1],
-            start=datetime.fromisoformat(row[2]),
+            start=from_timestamp(row[2]),
             status=row[3],
-            metadata=row[4],
-            end=datetime.fromisoformat(row[5]) if row[5] else None,
+            end=from_timestamp(row[4]) if row[4] is not None else None,
+            chat_id=row[5],
+            message_id=row[6],
         )
 
     def set_end_if_not_exists(self, timelog_id: int, end: datetime) -> None:
         stmt = """
-        UPDATE timelog SET end = ?, status = ? WHERE id = ?
+        UPDATE timelog SET end = ?, status = ? WHERE id = ? AND end IS NULL
         """
-        self.sqlitedb.execute(
-            stmt,
-            (end.isoformat(), TimelogStatus.DONE.name, timelog_id),
-        )
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            cursor = conn.execute(
+                stmt,
+                (to_timestamp(end), TimelogStatus.DONE.name, timelog_id),
+            )
+            if cursor.rowcount:
+                rollup.add_timelog(conn, timelog_id)
 
     def get_by_user_id_and_time(
         self,
         user_id: int,
         duration: timedelta,
     ) -> List[Timelog]:
+        # user_id is the chat the epics belong to
         stmt = """
-        SELECT timelog.id, timelog.task_id, timelog.start, timelog.status, timelog.metadata, timelog.end
+        SELECT timelog.id, timelog.task_id, timelog.start, timelog.status,
+            timelog.end, timelog.chat_id, timelog.message_id
         FROM timelog
-        WHERE start > ?
+        JOIN task ON task.id = timelog.task_id
+        JOIN epic ON epic.id = task.epic_id
+        WHERE epic.chat_id = ? AND timelog.start > ?
         """
         start_time = datetime.now() - duration
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (start_time.isoformat(),))
-        rows = cursor.fetchall()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (user_id, to_timestamp(start_time)))
+            rows = cursor.fetchall()
         ans = []
         for row in rows:
             ans.append(
                 Timelog(
                     id=row[0],
                     task_id=row[1],
-                    start=datetime.fromisoformat(row[2]),
+                    start=from_timestamp(row[2]),
                     status=TimelogStatus[row[3]],
-                    metadata=row[4],
-                    end=datetime.fromisoformat(row[5]) if row[5] else None,
+                    end=from_timestamp(row[4]) if row[4] is not None else None,
+                    chat_id=row[5],
+                    message_id=row[6],
                 ),
             )
         return ans
@@ -203,6 +240,98 @@ class TimelogRepo(ITimelogRepo):
         stmt = """
         DELETE FROM timelog WHERE id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (timelog_id,))
-        self.sqlitedb.commit()
+        with self.db.writer() as conn:
+            rollup.add_timelog(conn, timelog_id, sign=-1)
+            cursor = conn.cursor()
+            cursor.execute(stmt, (timelog_id,))
+
+
+class IAsyncTimelogRepo(ABC):
+    @abstractmethod
+    async def create(self, task_id: int, start_time: datetime) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_message(
+        self,
+        timelog_id: int,
+        chat_id: int,
+        message_id: int,
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_in_progress_logs(self) -> List[Timelog]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_in_progress_logs_with_task_names(self) -> List[Tuple[Timelog, str]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_id(self, timelog_id: int) -> Timelog:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_end_if_not_exists(self, timelog_id: int, end: datetime) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_user_id_and_time(
+        self,
+        user_id: int,
+        duration: timedelta,
+    ) -> List[Timelog]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, timelog_id: int) -> None:
+        raise NotImplementedError
+
+
+class AsyncTimelogRepo(IAsyncTimelogRepo):
+    def __init__(self, repo: ITimelogRepo, executor: DBExecutor):
+        self.repo = repo
+        self.executor = executor
+
+    async def create(self, task_id: int, start_time: datetime) -> int:
+        return await self.executor.run(self.repo.create, task_id, start_time)
+
+    async def set_message(
+        self,
+        timelog_id: int,
+        chat_id: int,
+        message_id: int,
+    ) -> None:
+        await self.executor.run(
+            self.repo.set_message,
+            timelog_id,
+            chat_id,
+            message_id,
+        )
+
+    async def get_in_progress_logs(self) -> List[Timelog]:
+        return await self.executor.run(self.repo.get_in_progress_logs)
+
+    async def get_in_progress_logs_with_task_names(self) -> List[Tuple[Timelog, str]]:
+        return await self.executor.run(self.repo.get_in_progress_logs_with_task_names)
+
+    async def get_by_id(self, timelog_id: int) -> Timelog:
+        return await self.executor.run(self.repo.get_by_id, timelog_id)
+
+    async def set_end_if_not_exists(self, timelog_id: int, end: datetime) -> None:
+        await self.executor.run(self.repo.set_end_if_not_exists, timelog_id, end)
+
+    async def get_by_user_id_and_time(
+        self,
+        user_id: int,
+        duration: timedelta,
+    ) -> List[Timelog]:
+        return await self.executor.run(
+            self.repo.get_by_user_id_and_time,
+            user_id,
+            duration,
+        )
+
+    async def delete(self, timelog_id: int) -> None:
+        await self.executor.run(self.repo.delete, timelog_id)
@@ -9,8 +9,13 @@ from .timelog_repo import ITimelogRepo, TimelogRepo, TimelogStatus
 
 
 @pytest.fixture
-def timelog_repo() -> Generator[ITimelogRepo, None, None]:
+def repos() -> None:
+    # one database for every repo fixture of a test
     initialize_repos(":memory:", do_migration=True)
+
+
+@pytest.fixture
+def timelog_repo(repos: None) -> Generator[ITimelogRepo, None, None]:
     from . import timelog_repo
 
     if timelog_repo is None:
@@ -19,8 +24,7 @@ def timelog_repo() -> Generator[ITimelogRepo, None, None]:
 
 
 @pytest.fixture
-def task_repo() -> Generator[ITaskRepo, None, None]:
-    initialize_repos(":memory:", do_migration=True)
+def task_repo(repos: None) -> Generator[ITaskRepo, None, None]:
     from . import task_repo
 
     if task_repo is None:
@@ -30,8 +34,7 @@ def task_repo() -> Generator[ITaskRepo, None, None]:
 
 
 @pytest.fixture
-def epic_repo() -> Generator[IEpicRepo, None, None]:
-    initialize_repos(":memory:", do_migration=True)
+def epic_repo(repos: None) -> Generator[IEpicRepo, None, None]:
     from . import epic_repo
 
     if epic_repo is None:
@@ -42,7 +45,7 @@ def epic_repo() -> Generator[IEpicRepo, None, None]:
 
 def test_create_timelog(timelog_repo: ITimelogRepo) -> None:
     task_id = 1
-    start_time = datetime.now()
+    start_time = datetime.now().replace(microsecond=0)
     timelog_id = timelog_repo.create(task_id, start_time)
     assert timelog_id > 0
 
@@ -52,21 +55,21 @@ def test_create_timelog(timelog_repo: ITimelogRepo) -> None:
     assert timelog.status == TimelogStatus.IN_PROGRESS.name
 
 
-def test_set_metadata(timelog_repo: ITimelogRepo) -> None:
+def test_set_message(timelog_repo: ITimelogRepo) -> None:
     task_id = 1
-    start_time = datetime.now()
+    start_time = datetime.now().replace(microsecond=0)
     timelog_id = timelog_repo.create(task_id, start_time)
+    assert timelog_repo.get_by_id(timelog_id).message_id is None
 
-    metadata = "Test metadata"
-    timelog_repo.set_metadata(timelog_id, metadata)
+    timelog_repo.set_message(timelog_id, chat_id=5, message_id=42)
 
     timelog = timelog_repo.get_by_id(timelog_id)
-    assert timelog.metadata == metadata
+    assert (timelog.chat_id, timelog.message_id) == (5, 42)
 
 
 def test_get_in_progress_logs(timelog_repo: ITimelogRepo) -> None:
     task_id = 1
-    start_time = datetime.now()
+    start_time = datetime.now().replace(microsecond=0)
     timelog_repo.create(task_id, start_time)
 
     in_progress_logs = timelog_repo.get_in_progress_logs()
@@ -77,10 +80,10 @@ def test_get_in_progress_logs(timelog_repo: ITimelogRepo) -> None:
 
 def test_set_end_if_not_exists(timelog_repo: ITimelogRepo) -> None:
     task_id = 1
-    start_time = datetime.now()
+    start_time = datetime.now().replace(microsecond=0)
     timelog_id = timelog_repo.create(task_id, start_time)
 
-    end_time = datetime.now()
+    end_time = datetime.now().replace(microsecond=0)
     timelog_repo.set_end_if_not_exists(timelog_id, end_time)
 
     timelog = timelog_repo.get_by_id(timelog_id)
@@ -94,7 +97,7 @@ def test_get_by_user_id_and_time(
     task_repo: ITaskRepo,
 ) -> None:
     user_id = 1
-    start_time = datetime.now()
+    start_time = datetime.now().replace(microsecond=0)
     duration = timedelta(days=1)
 
     epic_id = epic_repo.create(Epic(name="foo", description="foo2", chat_id=user_id))
@@ -106,3 +109,5 @@ def test_get_by_user_id_and_time(
     assert len(timelogs) == 1
     assert timelogs[0].task_id == task_id
     assert timelogs[0].start == start_time
+
+    assert timelog_repo.get_by_user_id_and_time(user_id + 1, duration) == []
@@ -0,0 +1,310 @@
+import functools
+import heapq
+import itertools
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# statements EXPLAIN QUERY PLAN can say something about
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+
+
+# repos run a handful of fixed strings, so each is normalized once
+@functools.lru_cache(maxsize=1024)
+def normalize(sql: str) -> str:
+    # one line, literals replaced, so "LIMIT 10" and "LIMIT 20" are one entry
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def is_full_scan(detail: str) -> bool:
+    # "SCAN task" reads the whole table, "SCAN task USING INDEX ..." the
+    # whole index; "SEARCH ..." uses an index to find its rows
+    return detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+
+
+@dataclass
+class StatementStats:
+    statement: str
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    rows: int = 0
+    # EXPLAIN QUERY PLAN details, one per line, of the last sampled plan
+    plan: str = ""
+    full_scan: bool = False
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+@dataclass(order=True)
+class SlowQuery:
+    duration: float
+    statement: str = field(compare=False)
+    rows: int = field(compare=False)
+    # epoch seconds
+    at: float = field(compare=False)
+
+
+# Collects what TracingConnection reports: totals per normalized statement,
+# the top_k slowest executions, and whether the plan of a statement scans a
+# whole table. The plan is checked the first time a statement is seen and
+# then every explain_every executions. Statements slower than slow_threshold
+# seconds are logged as warnings with the details in extra; newly found full
+# scans only at INFO, since migrations, exports and rollup rebuilds scan on
+# purpose and warnings reach the admin chat.
+class QueryTracer:
+    def __init__(
+        self,
+        top_k: int = 20,
+        slow_threshold: float = 0.1,
+        explain_every: int = 1000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.top_k = top_k
+        self.slow_threshold = slow_threshold
+        self.explain_every = explain_every
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.statements: Dict[str, StatementStats] = {}
+        # min-heap, the fastest of the slowest on top
+        self.slowest: List[SlowQuery] = []
+
+    def should_explain(self, statement: str) -> bool:
+        stats = self.statements.get(statement)
+        if stats is None or stats.calls % self.explain_every == 0:
+            return statement.lstrip("( ").upper().startswith(EXPLAINABLE)
+        return False
+
+    def explain(
+        self, conn: sqlite3.Connection, statement: str, sql: str, params: Any
+    ) -> None:
+        try:
+            cursor = sqlite3.Connection.cursor(conn)
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as error:
+            logger.debug(f"couldn't explain {statement}: {error}")
+            return
+        details = [row[3] for row in rows]
+        full_scan = any(is_full_scan(detail) for detail in details)
+        with self.lock:
+            stats = self.statements.setdefault(statement, StatementStats(statement))
+            newly_flagged = full_scan and not stats.full_scan
+            stats.plan = "\n".join(details)
+            stats.full_scan = full_scan
+        if newly_flagged:
+            logger.info(
+                f"full scan: {statement} ({'; '.join(details)})",
+                extra={"sql": {"statement": statement, "plan": details}},
+            )
+
+    def record(self, statement: str, duration: float, rows: int) -> None:
+        with self.lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                stats = self.statements[statement] = StatementStats(statement)
+            stats.calls += 1
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+            stats.rows += rows
+            if len(self.slowest) < self.top_k:
+                heapq.heappush(
+                    self.slowest,
+                    SlowQuery(duration, statement, rows, self.clock()),
+                )
+            elif duration > self.slowest[0].duration:
+                heapq.heapreplace(
+                    self.slowest,
+                    SlowQuery(duration, statement, rows, self.clock()),
+                )
+        if duration >= self.slow_threshold:
+            logger.warning(
+                f"slow query {duration * 1000:.1f}ms, {rows} rows: {statement}",
+                extra={
+                    "sql": {
+                        "statement": statement,
+                        "duration_ms": duration * 1000,
+                        "rows": rows,
+                    },
+                },
+            )
+
+    def slowest_queries(self) -> List[SlowQuery]:
+        with self.lock:
+            return sorted(self.slowest, reverse=True)
+
+    def by_total_time(self) -> List[StatementStats]:
+        with self.lock:
+            return sorted(
+                self.statements.values(),
+                key=lambda stats: stats.total_time,
+                reverse=True,
+            )
+
+    def full_scans(self) -> List[StatementStats]:
+        with self.lock:
+            return [stats for stats in self.statements.values() if stats.full_scan]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.statements.clear()
+            self.slowest.clear()
+
+    def report(self, top: int = 10) -> str:
+        lines = ["slowest queries:"]
+        for query in self.slowest_queries()[:top]:
+            lines.append(
+                f"{query.duration * 1000:8.1f}ms {query.rows:6} rows  {query.statement}",
+            )
+        lines.append("")
+        lines.append("by total time (calls, mean, max):")
+        for stats in self.by_total_time()[:top]:
+            lines.append(
+                f"{stats.total_time * 1000:8.1f}ms {stats.calls:6} "
+                f"{stats.mean_time * 1000:.2f}ms {stats.max_time * 1000:.1f}ms  "
+                f"{stats.statement}",
+            )
+        full_scans = self.full_scans()
+        if full_scans:
+            lines.append("")
+            lines.append("full scans:")
+            for stats in full_scans:
+                plan = stats.plan.replace("\n", "; ")
+                lines.append(f"{stats.statement}  [{plan}]")
+        return "\n".join(lines)
+
+
+# Times every statement from execute to its last fetched row, so a SELECT
+# is charged for stepping through its rows too, and reports it to the
+# tracer once the rows are exhausted, the cursor is reused or closed.
+class TracingCursor(sqlite3.Cursor):
+    tracer: Optional[QueryTracer] = None
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        super().__init__(conn)
+        self.tracer = getattr(conn, "tracer", None)
+        self.statement: Optional[str] = None
+        self.elapsed = 0.0
+        self.rows = 0
+
+    def begin(self, sql: str, params: Any) -> None:
+        self.finish()
+        if self.tracer is None:
+            return
+        self.statement = normalize(sql)
+        self.elapsed = 0.0
+        self.rows = 0
+        if self.tracer.should_explain(self.statement):
+            self.tracer.explain(self.connection, self.statement, sql, params)
+
+    def finish(self) -> None:
+        if self.statement is None or self.tracer is None:
+            return
+        statement, self.statement = self.statement, None
+        self.tracer.record(statement, self.elapsed, self.rows)
+
+    def timed(self, func: Callable[[], Any]) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return func()
+        finally:
+            self.elapsed += time.perf_counter() - started_at
+
+    def execute(self, sql: str, parameters: Any = (), /) -> "TracingCursor":  # type: ignore[override]
+        self.begin(sql, parameters)
+        try:
+            self.timed(lambda: super(TracingCursor, self).execute(sql, parameters))
+        except BaseException:
+            self.statement = None
+            raise
+        if self.description is None:
+            # no result rows, the statement is done
+            self.rows = max(self.rowcount, 0)
+            self.finish()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any], /) -> "TracingCursor":  # type: ignore[override]
+        # the first parameters are needed for EXPLAIN, the rest may be a
+        # generator too large to hold in memory
+        parameters = iter(seq_of_parameters)
+        first = next(parameters, None)
+        self.begin(sql, () if first is None else first)
+        if first is not None:
+            parameters = itertools.chain([first], parameters)
+        try:
+            self.timed(
+                lambda: super(TracingCursor, self).executemany(sql, parameters),
+            )
+        except BaseException:
+            self.statement = None
+            raise
+        self.rows = max(self.rowcount, 0)
+        self.finish()
+        return self
+
+    def fetchone(self) -> Any:
+        row = self.timed(super().fetchone)
+        if row is None:
+            self.finish()
+        else:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, size: Optional[int] = 1) -> List[Any]:
+        if size is None or size < 0:
+            size = self.arraysize
+        rows = self.timed(lambda: super(TracingCursor, self).fetchmany(size))
+        self.rows += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        rows = self.timed(super().fetchall)
+        self.rows += len(rows)
+        self.finish()
+        return rows
+
+    def __next__(self) -> Any:
+        try:
+            row = self.timed(super().__next__)
+        except StopIteration:
+            self.finish()
+            raise
+        self.rows += 1
+        return row
+
+    def close(self) -> None:
+        self.finish()
+        super().close()
+
+    def __del__(self) -> None:
+        # a lookup that read only its first row
+        if getattr(self, "statement", None) is not None:
+            self.finish()
+
+
+class TracingConnection(sqlite3.Connection):
+    tracer: Optional[QueryTracer] = None
+
+    def cursor(self, factory: Any = TracingCursor) -> Any:  # type: ignore[override]
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = (), /) -> Any:  # type: ignore[override]
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Iterable[Any], /) -> Any:  # type: ignore[override]
+        return self.cursor().executemany(sql, parameters)
@@ -0,0 +1,94 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from .connection import ConnectionManager
+from .epic_repo import Epic, EpicRepo
+from .task_repo import Task, TaskRepo
+from .tracing import QueryTracer, is_full_scan, normalize
+
+
+def test_normalize() -> None:
+    assert (
+        normalize("SELECT *\n  FROM epic WHERE name = 'it''s' AND id > 10 LIMIT -5")
+        == "SELECT * FROM epic WHERE name = ? AND id > ? LIMIT ?"
+    )
+    assert normalize("SAVEPOINT unit_of_work_0") == "SAVEPOINT unit_of_work_0"
+    assert is_full_scan("SCAN task")
+    assert is_full_scan("SCAN epic USING COVERING INDEX epic_chat_id_idx")
+    assert not is_full_scan("SEARCH task USING INDEX task_epic_id_idx (epic_id=?)")
+    assert not is_full_scan("SCAN CONSTANT ROW")
+
+
+def test_statements_are_timed_with_their_rows(tmp_path: Path) -> None:
+    tracer = QueryTracer(top_k=3, slow_threshold=10)
+    manager = ConnectionManager.open(
+        str(tmp_path / "data.db"), readers=2, tracer=tracer
+    )
+    epic_repo = EpicRepo(manager, do_migrate=True)
+    tracer.reset()
+
+    for i in range(5):
+        epic_repo.create(Epic(name=f"e{i}", description="", chat_id=1))
+    assert len(epic_repo.get_by_chat_id(1)) == 5
+    with manager.reader() as conn:
+        assert (
+            sum(1 for _ in conn.execute("SELECT id FROM epic WHERE chat_id = 1")) == 5
+        )
+        cursor = conn.execute("SELECT id FROM epic")
+        assert cursor.fetchmany(2) and cursor.fetchmany(10)
+        assert cursor.fetchmany(None) == []
+        assert conn.execute("SELECT id FROM epic").fetchone() is not None
+    with manager.writer() as conn:
+        conn.executemany("UPDATE epic SET name = ? WHERE id = ?", [("x", 1), ("y", 2)])
+
+    stats = {stats.statement: stats for stats in tracer.by_total_time()}
+    insert = stats["INSERT INTO epic (chat_id, name, description) VALUES (?, ?, ?)"]
+    assert (insert.calls, insert.rows) == (5, 5)
+    assert stats["SELECT id FROM epic WHERE chat_id = ?"].rows == 5
+    # fetchmany until short, and a lookup that read one row when collected
+    assert stats["SELECT id FROM epic"].calls == 2
+    assert stats["SELECT id FROM epic"].rows == 6
+    assert stats["UPDATE epic SET name = ? WHERE id = ?"].rows == 2
+    slowest = tracer.slowest_queries()
+    assert len(slowest) == 3
+    assert slowest[0].duration >= slowest[1].duration >= slowest[2].duration
+    manager.close()
+
+
+def test_full_scans_are_flagged_and_logged(
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    tracer = QueryTracer(slow_threshold=0)
+    manager = ConnectionManager.open(
+        str(tmp_path / "data.db"), readers=0, tracer=tracer
+    )
+    task_repo = TaskRepo(manager, do_migrate=True)
+    epic_id = EpicRepo(manager, do_migrate=False).create(
+        Epic(name="e", description="", chat_id=1),
+    )
+    task_id = task_repo.create(Task(name="t", description="", epic_id=epic_id))
+
+    with caplog.at_level(logging.INFO):
+        task_repo.get_by_id(task_id)
+        with manager.reader() as conn:
+            conn.execute("SELECT count(*) FROM task WHERE name = ?", ("t",)).fetchall()
+
+    flagged = [stats.statement for stats in tracer.full_scans()]
+    assert "SELECT count(*) FROM task WHERE name = ?" in flagged
+    assert not any("WHERE id = ?" in statement for statement in flagged)
+    full_scan_logs = [
+        r for r in caplog.records if r.getMessage().startswith("full scan")
+    ]
+    assert full_scan_logs[-1].sql["plan"] == ["SCAN task"]  # type: ignore[attr-defined]
+    # kept out of the admin chat, which gets warnings
+    assert full_scan_logs[-1].levelno == logging.INFO
+    slow = [r for r in caplog.records if r.getMessage().startswith("slow query")]
+    assert slow and slow[0].sql["duration_ms"] >= 0  # type: ignore[attr-defined]
+
+    report = tracer.report()
+    assert "full scans:" in report
+    assert "SELECT count(*) FROM task WHERE name = ?  [SCAN task]" in report
+    manager.close()
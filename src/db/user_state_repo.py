@@ -1,10 +1,15 @@
+import copy
 import json
-import sqlite3
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
 from typing import List, Optional, Tuple
 
+from .cache import LRUCache
+from .connection import DB, ConnectionManager
+from .executor import DBExecutor
+from .migrations import run_migrations
+
 
 class UserState(Enum):
     NORMAL = 0
@@ -35,21 +40,13 @@ class IUserStateRepo(ABC):
 
 
 class UserStateRepo(IUserStateRepo):
-    def __init__(self, sqlitedb: sqlite3.Connection, do_migrate: bool):
-        self.sqlitedb = sqlitedb
+    def __init__(self, sqlitedb: DB, do_migrate: bool):
+        self.db = ConnectionManager.wrap(sqlitedb)
         if do_migrate:
             self.migrate()
 
     def migrate(self) -> None:
-        stmt = """
-        CREATE TABLE IF NOT EXISTS user_state (
-            user_id INTEGER PRIMARY KEY,
-            state INTEGER NOT NULL,
-            metadata TEXT DEFAULT NULL
-        );
-        """
-        self.sqlitedb.execute(stmt)
-        self.sqlitedb.commit()
+        run_migrations(self.db)
 
     def set_state(
         self,
@@ -63,9 +60,10 @@ class UserStateRepo(IUserStateRepo):
         ON CONFLICT(user_id)
         DO UPDATE SET state = excluded.state , metadata = excluded.metadata
         """
-        cursor = self.sqlitedb.cursor()
         metadata_str = json.dumps(metadata) if metadata else None
-        cursor.execute(stmt, (user_id, state.value, metadata_str))
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (user_id, state.value, metadata_str))
 
     def get_state(self, user_id: int) -> UserState:
         stmt = """
@@ -73,9 +71,11 @@ class UserStateRepo(IUserStateRepo):
         FROM user_state
         WHERE user_id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (user_id,))
-        row = cursor.fetchone()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (user_id,))
+            row = cursor.fetchone()
+            cursor.close()
         if row is None:
             return UserState.NORMAL
         return UserState(row[0])
@@ -86,11 +86,89 @@ class UserStateRepo(IUserStateRepo):
         FROM user_state
         WHERE user_id = ?
         """
-        cursor = self.sqlitedb.cursor()
-        cursor.execute(stmt, (user_id,))
-        row = cursor.fetchone()
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(stmt, (user_id,))
+            row = cursor.fetchone()
+            cursor.close()
         if row is None:
             return UserState.NORMAL, {}
         user_state = UserState(row[0])
         metadata = json.loads(row[1]) if row[1] else {}
         return user_state, metadata
+
+
+class CachedUserStateRepo(IUserStateRepo):
+    def __init__(
+        self,
+        repo: IUserStateRepo,
+        sqlitedb: DB,
+        max_size: int,
+        ttl: float,
+    ):
+        self.repo = repo
+        self.db = ConnectionManager.wrap(sqlitedb)
+        self.cache: LRUCache[int, Tuple[UserState, dict]] = LRUCache(max_size, ttl)
+
+    def set_state(
+        self,
+        user_id: int,
+        state: UserState,
+        metadata: Optional[dict] = None,
+    ) -> None:
+        self.cache.pop(user_id)
+        self.repo.set_state(user_id, state, metadata)
+        entry = (state, copy.deepcopy(metadata) if metadata else {})
+        self.db.after_commit(lambda: self.cache.set(user_id, entry))
+
+    def get_state(self, user_id: int) -> UserState:
+        return self.get_state_and_metadata(user_id)[0]
+
+    def get_state_and_metadata(self, user_id: int) -> Tuple[UserState, dict]:
+        entry = self.cache.get(user_id)
+        if entry is None:
+            entry = self.repo.get_state_and_metadata(user_id)
+            # uncommitted state may still be rolled back
+            if not self.db.in_unit_of_work():
+                self.cache.set(user_id, entry)
+        state, metadata = entry
+        return state, copy.deepcopy(metadata)
+
+
+class IAsyncUserStateRepo(ABC):
+    @abstractmethod
+    async def set_state(
+        self,
+        user_id: int,
+        state: UserState,
+        metadata: Optional[dict] = None,
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_state(self, user_id: int) -> UserState:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_state_and_metadata(self, user_id: int) -> Tuple[UserState, dict]:
+        raise NotImplementedError
+
+
+class AsyncUserStateRepo(IAsyncUserStateRepo):
+    def __init__(self, repo: IUserStateRepo, executor: DBExecutor):
+        self.repo = repo
+        self.executor = executor
+
+    async def set_state(
+        self,
+        user_id: int,
+        state: UserState,
+        metadata: Optional[dict] = None,
+    ) -> None:
+        await self.executor.run(self.repo.set_state, user_id, state, metadata)
+
+    async def get_state(self, user_id: int) -> UserState:
+        return await self.executor.run(self.repo.get_state, user_id)
+
+    async def get_state_and_metadata(self, user_id: int) -> Tuple[UserState, dict]:
+        return await self.executor.run(self.repo.get_state_and_metadata, user_id)
@@ -1,6 +1,17 @@
+import asyncio
 import sqlite3
+from typing import List, Tuple
 
-from .user_state_repo import UserState, UserStateRepo
+import pytest
+
+from .connection import ConnectionManager
+from .executor import DBExecutor
+from .user_state_repo import (
+    AsyncUserStateRepo,
+    CachedUserStateRepo,
+    UserState,
+    UserStateRepo,
+)
 
 
 def test_epic_repo() -> None:
@@ -21,3 +32,47 @@ def test_epic_repo() -> None:
     state, metadata = user_state_repo.get_state_and_metadata(user_id)
     assert state == UserState.CREATE_TASK
     assert metadata == {"foo": "bar"}
+
+
+def test_async_user_state_repo() -> None:
+    sqlitedb = sqlite3.connect(":memory:", check_same_thread=False)
+    executor = DBExecutor(max_workers=1)
+    repo = AsyncUserStateRepo(
+        UserStateRepo(sqlitedb=sqlitedb, do_migrate=True),
+        executor,
+    )
+
+    async def scenario() -> Tuple[UserState, dict]:
+        await repo.set_state(1, UserState.EDIT_TASK, {"task_id": 2})
+        return await repo.get_state_and_metadata(1)
+
+    assert asyncio.run(scenario()) == (UserState.EDIT_TASK, {"task_id": 2})
+    executor.shutdown()
+
+
+def test_cached_user_state_repo() -> None:
+    sqlitedb = sqlite3.connect(":memory:")
+    manager = ConnectionManager.wrap(sqlitedb)
+    repo = CachedUserStateRepo(
+        UserStateRepo(sqlitedb=manager, do_migrate=True),
+        manager,
+        max_size=10,
+        ttl=60,
+    )
+    repo.set_state(1, UserState.CREATE_TASK, {"epic_id": 3})
+
+    statements: List[str] = []
+    sqlitedb.set_trace_callback(statements.append)
+    assert repo.get_state(1) == UserState.CREATE_TASK
+    state, metadata = repo.get_state_and_metadata(1)
+    assert (state, metadata) == (UserState.CREATE_TASK, {"epic_id": 3})
+    metadata["epic_id"] = 4
+    assert repo.get_state_and_metadata(1)[1] == {"epic_id": 3}
+    assert statements == []
+
+    # a rolled back unit of work must not leave its state in the cache
+    with pytest.raises(ValueError):
+        with manager.transaction():
+            repo.set_state(1, UserState.NORMAL)
+            raise ValueError("rollback")
+    assert repo.get_state(1) == UserState.CREATE_TASK
@@ -1,4 +1,5 @@
 import sqlite3
+from datetime import date, datetime, time
 from typing import Any, Optional
 
 
@@ -23,7 +24,21 @@ def add_column_if_not_exists(
         else:
             cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}")
         cur.close()
-        sqlite_conn.commit()
 
     except Exception as e:
         raise e
+
+
+# Timestamps are stored as UTC epoch seconds and converted only here, at the
+# repository edge. Naive datetimes are local time, like datetime.now().
+def to_timestamp(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp)
+
+
+def day_timestamp(day: date) -> int:
+    # the local midnight the day starts at
+    return to_timestamp(datetime.combine(day, time()))
@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# handler arguments that don't come from callback data
+CHAT_ID = "chat_id"
+DATA = "data"
+
+
+@dataclass
+class HandlerStats:
+    calls: int = 0
+    errors: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def observe(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+
+@dataclass
+class Route:
+    name: str
+    func: Callable[..., Awaitable[None]]
+    # extra positional arguments after (update, context): CHAT_ID is the
+    # chat of the update, DATA the whole callback data, anything else the
+    # callback data field of that name
+    args: Tuple[str, ...]
+
+    def extract(self, chat_id: int, data: Dict[str, Any]) -> List[Any]:
+        values: List[Any] = []
+        for arg in self.args:
+            if arg == CHAT_ID:
+                values.append(chat_id)
+            elif arg == DATA:
+                values.append(data)
+            else:
+                values.append(data[arg])
+        return values
+
+
+# Maps callback action ids or command words to handler methods, filled in by
+# decorating the methods in the class body.
+class Router:
+    def __init__(self) -> None:
+        self.routes: Dict[Hashable, Route] = {}
+
+    def route(
+        self,
+        *keys: Hashable,
+        args: Tuple[str, ...] = (),
+    ) -> Callable[[Callable[..., Awaitable[None]]], Callable[..., Awaitable[None]]]:
+        def decorator(
+            func: Callable[..., Awaitable[None]],
+        ) -> Callable[..., Awaitable[None]]:
+            route = Route(name=func.__name__, func=func, args=args)
+            for key in keys:
+                if key in self.routes:
+                    raise ValueError(
+                        f"{key} is already routed to {self.routes[key].name}",
+                    )
+                self.routes[key] = route
+            return func
+
+        return decorator
+
+    def get(self, key: Hashable) -> Optional[Route]:
+        return self.routes.get(key)
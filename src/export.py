@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import BinaryIO, Iterable, Sequence, Tuple
+
+
+class ExportFormat(Enum):
+    CSV = "csv"
+    JSONL = "jsonl"
+
+
+def parse_export_args(text: str) -> Tuple[ExportFormat, bool]:
+    # "/export", "/export jsonl", "/export csv gz", in any order
+    fmt = ExportFormat.CSV
+    compress = False
+    for arg in text.lower().split()[1:]:
+        if arg in ("gz", "gzip"):
+            compress = True
+        elif arg == "json":
+            fmt = ExportFormat.JSONL
+        else:
+            fmt = ExportFormat(arg)
+    return fmt, compress
+
+
+def export_filename(fmt: ExportFormat, compress: bool, now: datetime) -> str:
+    name = f"timar-{now:%Y%m%d-%H%M%S}.{fmt.value}"
+    return name + ".gz" if compress else name
+
+
+# Writes rows to fileobj one at a time, so memory doesn't grow with the
+# number of rows. Returns how many rows were written.
+def write_export(
+    rows: Iterable[Sequence],
+    columns: Sequence[str],
+    fileobj: BinaryIO,
+    fmt: ExportFormat,
+    compress: bool = False,
+) -> int:
+    raw: BinaryIO = fileobj
+    if compress:
+        # mtime=0 keeps the output deterministic
+        raw = gzip.GzipFile(fileobj=fileobj, mode="wb", mtime=0)  # type: ignore
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    count = 0
+    try:
+        if fmt == ExportFormat.CSV:
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                text.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                text.write("\n")
+                count += 1
+    finally:
+        text.flush()
+        # leave fileobj open for the caller
+        text.detach()
+        if compress:
+            raw.close()
+    return count
@@ -0,0 +1,37 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from export import ExportFormat, parse_export_args, write_export
+
+COLUMNS = ("id", "name")
+ROWS = [(1, "کار"), (2, None)]
+
+
+def test_parse_export_args() -> None:
+    assert parse_export_args("/export") == (ExportFormat.CSV, False)
+    assert parse_export_args("/export jsonl gz") == (ExportFormat.JSONL, True)
+    assert parse_export_args("/export@timar_bot gzip CSV") == (ExportFormat.CSV, True)
+    with pytest.raises(ValueError):
+        parse_export_args("/export xml")
+
+
+def test_write_csv() -> None:
+    file = io.BytesIO()
+    assert write_export(iter(ROWS), COLUMNS, file, ExportFormat.CSV) == 2
+    assert not file.closed
+    rows = list(csv.reader(io.StringIO(file.getvalue().decode())))
+    assert rows == [["id", "name"], ["1", "کار"], ["2", ""]]
+
+
+def test_write_gzipped_jsonl() -> None:
+    file = io.BytesIO()
+    assert write_export(iter(ROWS), COLUMNS, file, ExportFormat.JSONL, True) == 2
+    lines = gzip.decompress(file.getvalue()).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"id": 1, "name": "کار"},
+        {"id": 2, "name": None},
+    ]
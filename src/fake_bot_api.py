@@ -0,0 +1,445 @@
+# A local stand-in for the Telegram/Bale Bot API, for load testing the real
+# Application stack without the network. It keeps sent messages in memory,
+# can add latency and answer with 429s, and drives thousands of virtual
+# users that read the bot's replies and press their buttons.
+#
+# In process, see benchmarks/load_test.py. As a subprocess, point the bot at
+# it with BOT_BASE_URL=http://127.0.0.1:8081/bot and run
+#
+#   cd src && python -m fake_bot_api --port 8081 --users 1000
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import statistics
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+Json = Dict[str, Any]
+
+
+class APIError(Exception):
+    def __init__(
+        self,
+        code: int,
+        description: str,
+        parameters: Optional[Json] = None,
+    ) -> None:
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+def parse_params(request: Request) -> Json:
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return json.loads(request.body or b"{}")
+    params: Json = {}
+    for key, value in parse_qsl(request.body.decode()):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def user_json(user_id: int) -> Json:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+@dataclass
+class APIStats:
+    calls: Counter = field(default_factory=Counter)
+    rate_limited: int = 0
+    errors: int = 0
+    # update pushed -> first reply in that chat, in seconds
+    latencies: List[float] = field(default_factory=list)
+
+    def summary(self, elapsed: float) -> Json:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            "replies": len(latencies),
+            "replies_per_second": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "calls": dict(self.calls),
+        }
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        # seconds added to every call but getUpdates, uniform in [min, max]
+        latency: Tuple[float, float] = (0.0, 0.0),
+        # chance of answering a call with 429
+        rate_limit_probability: float = 0.0,
+        # calls per second allowed per chat before answering 429, like the
+        # real API's flood control; None for no limit
+        chat_rate_limit: Optional[float] = None,
+        retry_after: int = 1,
+        # an API that ignores getUpdates' timeout answers every poll at once
+        long_poll: bool = True,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.chat_rate_limit = chat_rate_limit
+        self.retry_after = retry_after
+        self.long_poll = long_poll
+        self.random = random.Random(seed)
+        self.server = HTTPServer(host, port, self.handle)
+
+        self.updates: Deque[Json] = deque()
+        self.update_ids = itertools.count(1)
+        self.arrived = asyncio.Event()
+        # chat id -> message id -> message
+        self.messages: Dict[int, Dict[int, Json]] = {}
+        self.message_ids = itertools.count(1)
+        self.chat_calls: Dict[int, Deque[float]] = {}
+        # chat id -> when its last update was pushed, until the bot replies
+        self.waiting: Dict[int, float] = {}
+        self.reply_events: Dict[int, asyncio.Event] = {}
+        self.stats = APIStats()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}/bot"
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        # answer the long polls still waiting
+        self.arrived.set()
+        await self.server.stop()
+
+    def push(self, update: Json, chat_id: Optional[int] = None) -> None:
+        update["update_id"] = next(self.update_ids)
+        self.updates.append(update)
+        if chat_id is not None:
+            self.waiting[chat_id] = time.perf_counter()
+        self.arrived.set()
+
+    def reply_event(self, chat_id: int) -> asyncio.Event:
+        event = self.reply_events.get(chat_id)
+        if event is None:
+            event = self.reply_events[chat_id] = asyncio.Event()
+        return event
+
+    def last_message(self, chat_id: int) -> Optional[Json]:
+        messages = self.messages.get(chat_id)
+        if not messages:
+            return None
+        return messages[max(messages)]
+
+    async def handle(self, request: Request) -> Response:
+        method = request.path.rsplit("/", 1)[-1]
+        self.stats.calls[method] += 1
+        try:
+            params = parse_params(request)
+            if method != "getUpdates":
+                await self.delay()
+                self.check_rate_limit(params.get("chat_id"))
+            result = await self.call(method, params)
+        except APIError as error:
+            if error.code == 429:
+                self.stats.rate_limited += 1
+            else:
+                self.stats.errors += 1
+            body: Json = {
+                "ok": False,
+                "error_code": error.code,
+                "description": error.description,
+            }
+            if error.parameters:
+                body["parameters"] = error.parameters
+            return Response(
+                status=error.code,
+                body=json.dumps(body).encode(),
+                content_type="application/json",
+            )
+        body = {"ok": True, "result": result}
+        return Response(body=json.dumps(body).encode(), content_type="application/json")
+
+    async def delay(self) -> None:
+        low, high = self.latency
+        if high > 0:
+            await asyncio.sleep(self.random.uniform(low, high))
+
+    def check_rate_limit(self, chat_id: Any) -> None:
+        too_many = APIError(
+            429,
+            f"Too Many Requests: retry after {self.retry_after}",
+            {"retry_after": self.retry_after},
+        )
+        if self.random.random() < self.rate_limit_probability:
+            raise too_many
+        if self.chat_rate_limit is None or chat_id is None:
+            return
+        now = time.monotonic()
+        calls = self.chat_calls.setdefault(int(chat_id), deque())
+        while calls and calls[0] <= now - 1:
+            calls.popleft()
+        if len(calls) >= self.chat_rate_limit:
+            raise too_many
+        calls.append(now)
+
+    async def call(self, method: str, params: Json) -> Any:
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "timar", "username": "timar"}
+        if method in ("deleteWebhook", "setWebhook", "answerCallbackQuery"):
+            return True
+        if method == "getUpdates":
+            return await self.get_updates(params)
+        if method == "sendMessage":
+            return self.send_message(params)
+        if method == "editMessageText":
+            return self.edit_message_text(params)
+        if method == "deleteMessage":
+            return self.delete_message(params)
+        raise APIError(404, "Not Found: method not found")
+
+    async def get_updates(self, params: Json) -> List[Json]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and self.long_poll:
+            self.arrived.clear()
+            try:
+                timeout = float(params.get("timeout") or 0)
+                await asyncio.wait_for(self.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, limit))
+
+    def replied(self, chat_id: int) -> None:
+        pushed_at = self.waiting.pop(chat_id, None)
+        if pushed_at is not None:
+            self.stats.latencies.append(time.perf_counter() - pushed_at)
+        self.reply_event(chat_id).set()
+
+    def send_message(self, params: Json) -> Json:
+        chat_id = int(params["chat_id"])
+        message: Json = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "timar"},
+            "text": str(params.get("text", "")),
+        }
+        # like the real API, only inline keyboards are part of the message
+        if "inline_keyboard" in params.get("reply_markup", {}):
+            message["reply_markup"] = params["reply_markup"]
+        self.messages.setdefault(chat_id, {})[message["message_id"]] = message
+        self.replied(chat_id)
+        return message
+
+    def edit_message_text(self, params: Json) -> Json:
+        chat_id = int(params["chat_id"])
+        message = self.messages.get(chat_id, {}).get(int(params["message_id"]))
+        if message is None:
+            raise APIError(400, "Bad Request: message to edit not found")
+        text = str(params.get("text", ""))
+        # an edit without an inline keyboard removes the message's keyboard
+        reply_markup = params.get("reply_markup")
+        if "inline_keyboard" not in (reply_markup or {}):
+            reply_markup = None
+        if message["text"] == text and message.get("reply_markup") == reply_markup:
+            raise APIError(400, "Bad Request: message is not modified")
+        message["text"] = text
+        message["edit_date"] = int(time.time())
+        if reply_markup is None:
+            message.pop("reply_markup", None)
+        else:
+            message["reply_markup"] = reply_markup
+        self.replied(chat_id)
+        return message
+
+    def delete_message(self, params: Json) -> bool:
+        chat_id = int(params["chat_id"])
+        if self.messages.get(chat_id, {}).pop(int(params["message_id"]), None) is None:
+            raise APIError(400, "Bad Request: message to delete not found")
+        return True
+
+
+# A user in a closed loop: it sends a command, presses a button of the
+# bot's last message or answers its question, waits for the reply (or gives
+# up), thinks, and goes again.
+class VirtualUser:
+    COMMANDS = ("/start", "منوی اصلی", "/report 1", "/new_epic")
+
+    def __init__(
+        self,
+        api: FakeBotAPI,
+        user_id: int,
+        think_time: float,
+        button_probability: float,
+        reply_timeout: float,
+        rng: random.Random,
+    ):
+        self.api = api
+        self.user_id = user_id
+        self.think_time = think_time
+        self.button_probability = button_probability
+        self.reply_timeout = reply_timeout
+        self.random = rng
+        self.actions = 0
+        self.unanswered = 0
+
+    def message(self, text: str) -> Json:
+        return {
+            "message": {
+                "message_id": next(self.api.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": self.user_id, "type": "private"},
+                "from": user_json(self.user_id),
+                "text": text,
+            },
+        }
+
+    def next_update(self) -> Json:
+        message = self.api.last_message(self.user_id)
+        if message is None:
+            return self.message("/start")
+        buttons = [
+            button
+            for row in message.get("reply_markup", {}).get("inline_keyboard", [])
+            for button in row
+            if "callback_data" in button
+        ]
+        if self.random.random() >= self.button_probability:
+            return self.message(self.random.choice(self.COMMANDS))
+        if len(buttons) <= 1:
+            # only the return to menu button: the bot is asking for input
+            return self.message(f"{self.random.randint(1, 30)}")
+        button = self.random.choice(buttons)
+        return {
+            "callback_query": {
+                "id": str(self.random.getrandbits(64)),
+                "from": user_json(self.user_id),
+                "chat_instance": str(self.user_id),
+                "message": message,
+                "data": button["callback_data"],
+            },
+        }
+
+    async def run(self, until: float) -> None:
+        loop = asyncio.get_running_loop()
+        # spread the first actions out instead of starting in lockstep
+        await asyncio.sleep(self.random.uniform(0, self.think_time))
+        while loop.time() < until:
+            event = self.api.reply_event(self.user_id)
+            event.clear()
+            self.api.push(self.next_update(), chat_id=self.user_id)
+            self.actions += 1
+            try:
+                await asyncio.wait_for(event.wait(), self.reply_timeout)
+            except asyncio.TimeoutError:
+                self.unanswered += 1
+                self.api.waiting.pop(self.user_id, None)
+            await asyncio.sleep(self.random.expovariate(1 / self.think_time))
+
+
+async def run_users(
+    api: FakeBotAPI,
+    users: int,
+    duration: float,
+    think_time: float = 2.0,
+    button_probability: float = 0.7,
+    reply_timeout: float = 10.0,
+    first_user_id: int = 1000,
+    seed: Optional[int] = None,
+) -> List[VirtualUser]:
+    rng = random.Random(seed)
+    until = asyncio.get_running_loop().time() + duration
+    virtual_users = [
+        VirtualUser(
+            api,
+            first_user_id + i,
+            think_time,
+            button_probability,
+            reply_timeout,
+            random.Random(rng.getrandbits(32)),
+        )
+        for i in range(users)
+    ]
+    await asyncio.gather(*(user.run(until) for user in virtual_users))
+    return virtual_users
+
+
+async def main(args: argparse.Namespace) -> None:
+    api = FakeBotAPI(
+        args.host,
+        args.port,
+        latency=(args.min_latency, args.max_latency),
+        rate_limit_probability=args.rate_limit_probability,
+        chat_rate_limit=args.chat_rate_limit,
+        seed=args.seed,
+    )
+    await api.start()
+    print(f"fake bot api at {api.base_url}", flush=True)
+
+    async def report() -> None:
+        started_at = time.perf_counter()
+        while True:
+            await asyncio.sleep(args.report_interval)
+            summary = api.stats.summary(time.perf_counter() - started_at)
+            print(json.dumps(summary), flush=True)
+
+    reporter = asyncio.create_task(report())
+    try:
+        if args.users:
+            await run_users(
+                api,
+                args.users,
+                args.duration,
+                think_time=args.think_time,
+                seed=args.seed,
+            )
+        else:
+            await asyncio.Event().wait()
+    finally:
+        reporter.cancel()
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local stand-in for the Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--min-latency", type=float, default=0.0)
+    parser.add_argument("--max-latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--chat-rate-limit", type=float, default=None)
+    parser.add_argument("--users", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--think-time", type=float, default=2.0)
+    parser.add_argument("--report-interval", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=None)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,92 @@
+import asyncio
+import random
+
+import pytest
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter
+
+from fake_bot_api import FakeBotAPI, VirtualUser
+
+TOKEN = "1:test"
+
+
+def test_messages_round_trip() -> None:
+    async def run() -> None:
+        api = FakeBotAPI()
+        await api.start()
+        async with Bot(TOKEN, base_url=api.base_url) as bot:
+            message = await bot.send_message(
+                chat_id=5,
+                text="hi",
+                reply_markup=InlineKeyboardMarkup(
+                    [[InlineKeyboardButton("a", callback_data="x")]],
+                ),
+            )
+            assert message.chat.id == 5
+            edited = await bot.edit_message_text(
+                chat_id=5,
+                message_id=message.message_id,
+                text="hello",
+            )
+            assert isinstance(edited, Message) and edited.text == "hello"
+            with pytest.raises(BadRequest, match="not modified"):
+                await bot.edit_message_text(
+                    chat_id=5,
+                    message_id=message.message_id,
+                    text="hello",
+                )
+            assert await bot.delete_message(chat_id=5, message_id=message.message_id)
+            assert api.last_message(5) is None
+
+            api.push(
+                {
+                    "message": {
+                        "message_id": 1,
+                        "date": 0,
+                        "text": "x",
+                        "chat": {"id": 5, "type": "private"},
+                    }
+                }
+            )
+            updates = await bot.get_updates(timeout=1)
+            assert len(updates) == 1 and updates[0].message is not None
+            assert updates[0].message.text == "x"
+            assert await bot.get_updates(offset=updates[0].update_id + 1) == ()
+        await api.stop()
+        assert api.stats.calls["sendMessage"] == 1
+        assert api.stats.errors == 1
+
+    asyncio.run(run())
+
+
+def test_rate_limits() -> None:
+    async def run() -> None:
+        api = FakeBotAPI(chat_rate_limit=2, retry_after=3)
+        await api.start()
+        async with Bot(TOKEN, base_url=api.base_url) as bot:
+            await bot.send_message(chat_id=1, text="a")
+            await bot.send_message(chat_id=1, text="b")
+            await bot.send_message(chat_id=2, text="c")
+            with pytest.raises(RetryAfter) as error:
+                await bot.send_message(chat_id=1, text="d")
+            assert error.value.retry_after == 3
+        await api.stop()
+        assert api.stats.rate_limited == 1
+
+    asyncio.run(run())
+
+
+def test_virtual_user_presses_buttons() -> None:
+    api = FakeBotAPI()
+    user = VirtualUser(api, 7, 1, 1.0, 1, random.Random(0))
+    assert user.next_update()["message"]["text"] == "/start"
+
+    buttons = [
+        [{"text": "a", "callback_data": "x"}, {"text": "b", "callback_data": "y"}]
+    ]
+    api.send_message(
+        {"chat_id": 7, "text": "menu", "reply_markup": {"inline_keyboard": buttons}}
+    )
+    query = user.next_update()["callback_query"]
+    assert query["data"] in ("x", "y")
+    assert query["message"]["chat"]["id"] == 7
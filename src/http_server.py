@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: str
+    # lower cased names
+    headers: Dict[str, str]
+    body: bytes
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def text(cls, status: int, text: str = "") -> "Response":
+        return cls(status=status, body=(text or HTTPStatus(status).phrase).encode())
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class BadRequest(Exception):
+    pass
+
+
+# A small HTTP/1.1 server on top of asyncio streams, enough for webhooks and
+# internal endpoints without pulling in a web framework. Only requests with
+# a Content-Length body are supported; connections are kept alive.
+class HTTPServer:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        handler: Handler,
+        max_body_size: int = 1 << 20,
+        read_timeout: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.max_body_size = max_body_size
+        self.read_timeout = read_timeout
+        self.server: Optional[asyncio.Server] = None
+        self.connections: Set[asyncio.StreamWriter] = set()
+        self.busy: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self.handle_connection,
+            self.host,
+            self.port,
+        )
+        # the real port when started on port 0
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"http server listening on {self.host}:{self.port}")
+
+    async def stop(self, timeout: float = 5) -> None:
+        if self.server is None:
+            return
+        self.server.close()
+        # let requests in flight finish, drop idle keep-alive connections
+        for writer in self.connections - self.busy:
+            writer.close()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.busy and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        request_line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise BadRequest("malformed request line")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise BadRequest("invalid content-length")
+        if length < 0 or length > self.max_body_size:
+            raise BadRequest("body too large")
+        body = await asyncio.wait_for(reader.readexactly(length), self.read_timeout)
+
+        path, _, query = target.partition("?")
+        return Request(method.upper(), path, query, headers, body)
+
+    async def write_response(
+        self,
+        writer: asyncio.StreamWriter,
+        response: Response,
+        keep_alive: bool,
+    ) -> None:
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+        await writer.drain()
+
+    async def handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except BadRequest as error:
+                    await self.write_response(
+                        writer,
+                        Response.text(400, str(error)),
+                        keep_alive=False,
+                    )
+                    return
+                if request is None:
+                    return
+
+                self.busy.add(writer)
+                try:
+                    response = await self.handler(request)
+                except Exception:
+                    logger.exception(f"error handling {request.method} {request.path}")
+                    response = Response.text(500)
+                keep_alive = (
+                    request.headers.get("connection", "").lower() != "close"
+                    and self.server is not None
+                    and self.server.is_serving()
+                )
+                await self.write_response(writer, response, keep_alive)
+                self.busy.discard(writer)
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.busy.discard(writer)
+            self.connections.discard(writer)
+            writer.close()
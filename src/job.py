@@ -1,39 +1,197 @@
-import json
-from datetime import datetime
+import asyncio
+import heapq
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
 
+from telegram import Bot
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
 import callback_consts
 import db
 import message_consts
+import metrics
+from outbound import OutboundScheduler, Priority
 
+logger = logging.getLogger(__name__)
 
-async def update_in_progress_time_logs(context: ContextTypes.DEFAULT_TYPE) -> None:
-    pending_logs = db.timelog_repo.get_in_progress_logs()
-    for timelog in pending_logs:
-        task = db.task_repo.get_by_id(timelog.task_id)
-        message_text = message_consts.TASK_TIMER_STARTED.format(
-            name=task.name,
-            duration=timelog.eclapsed_time,
+# (age below, refresh interval) in seconds; the duration shown is rounded
+# down to the interval, so the text changes exactly when an edit is due
+PRECISION: Tuple[Tuple[float, int], ...] = (
+    (60, 5),
+    (3600, 60),
+    (math.inf, 300),
+)
+
+
+def refresh_interval(age: float) -> int:
+    for below, interval in PRECISION:
+        if age < below:
+            return interval
+    return PRECISION[-1][1]
+
+
+def next_due(start: float, now: float) -> float:
+    age = max(0.0, now - start)
+    interval = refresh_interval(age)
+    return start + (age // interval + 1) * interval
+
+
+def shown_duration(age: float) -> int:
+    interval = refresh_interval(age)
+    return int(age // interval * interval)
+
+
+@dataclass
+class RunningTimer:
+    timelog_id: int
+    chat_id: int
+    message_id: int
+    task_name: str
+    # epoch seconds
+    start: float
+
+
+@dataclass
+class RefreshStats:
+    due: int = 0
+    queued: int = 0
+    skipped: int = 0
+    wall_time: float = 0.0
+
+
+# Running timers sit in a heap keyed by when their message next needs an
+# edit, fed by start and stop events instead of scanning the timelog table.
+# A tick pops what is due and queues the edits on the outbound scheduler as
+# background work without awaiting them; an edit still queued from an
+# earlier tick is coalesced with the new one. Stopped timers are dropped
+# from the heap lazily, when their entry comes up.
+class TimerRefresher:
+    def __init__(
+        self,
+        outbound: OutboundScheduler,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.outbound = outbound
+        self.clock = clock
+        self.timers: Dict[int, RunningTimer] = {}
+        self.heap: List[Tuple[float, int]] = []
+        # timelog id -> text of the last successful edit
+        self.last_sent: Dict[int, str] = {}
+        self.edits = 0
+        self.failed = 0
+        self.last_stats = RefreshStats()
+
+    def start(self, timer: RunningTimer) -> None:
+        self.timers[timer.timelog_id] = timer
+        heapq.heappush(
+            self.heap,
+            (next_due(timer.start, self.clock()), timer.timelog_id),
         )
-        telegram_message = json.loads(timelog.metadata)["telegram_message"]
-        chat_id = telegram_message["chat"]["id"]
-        message_id = telegram_message["message_id"]
-        await context.bot.edit_message_text(
-            text=message_text,
-            chat_id=chat_id,
-            message_id=message_id,
-            reply_markup={
-                "inline_keyboard": callback_consts.CallbackButton.aggregate(
-                    [
-                        callback_consts.END_TASK_TIMER.copy().add_metadata(
-                            {"timelog_id": timelog.id},
-                        ),
-                        callback_consts.DELETE_TASK_TIMER.copy().add_metadata(
-                            {"timelog_id": timelog.id},
-                        ),
-                    ],
-                    chat_id=chat_id,
+
+    def stop(self, timelog_id: int) -> None:
+        self.timers.pop(timelog_id, None)
+        self.last_sent.pop(timelog_id, None)
+
+    async def load(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # timers left running by the previous process; once at startup
+        rows = await db.async_timelog_repo.get_in_progress_logs_with_task_names()
+        for timelog, task_name in rows:
+            if timelog.chat_id is None or timelog.message_id is None:
+                # the timer message was never sent
+                continue
+            self.start(
+                RunningTimer(
+                    timelog_id=timelog.id,
+                    chat_id=timelog.chat_id,
+                    message_id=timelog.message_id,
+                    task_name=task_name,
+                    start=timelog.start.timestamp(),
                 ),
-            },
+            )
+        logger.info(f"loaded {len(self.timers)} running timers")
+
+    def edit(self, bot: Bot, timer: RunningTimer, text: str) -> None:
+        timelog_id = timer.timelog_id
+        chat_id, message_id = timer.chat_id, timer.message_id
+        reply_markup = {
+            "inline_keyboard": callback_consts.CallbackButton.aggregate(
+                [
+                    callback_consts.END_TASK_TIMER.copy().add_metadata(
+                        {"timelog_id": timelog_id},
+                    ),
+                    callback_consts.DELETE_TASK_TIMER.copy().add_metadata(
+                        {"timelog_id": timelog_id},
+                    ),
+                ],
+                chat_id=chat_id,
+            ),
+        }
+
+        def done(future: asyncio.Future) -> None:
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                if timelog_id in self.timers:
+                    self.last_sent[timelog_id] = text
+            elif isinstance(error, TelegramError):
+                self.failed += 1
+                logger.warning(f"couldn't refresh timelog {timelog_id}: {error}")
+            else:
+                self.failed += 1
+                logger.error(f"couldn't refresh timelog {timelog_id}: {error!r}")
+
+        self.edits += 1
+        future = self.outbound.submit(
+            Priority.BACKGROUND,
+            chat_id,
+            lambda: bot.edit_message_text(
+                text=text,
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=reply_markup,
+            ),
+            coalesce_key=(chat_id, message_id),
         )
+        future.add_done_callback(done)
+
+    def tick(self, bot: Bot) -> RefreshStats:
+        started_at = time.perf_counter()
+        now = self.clock()
+        stats = RefreshStats()
+        while self.heap and self.heap[0][0] <= now:
+            _, timelog_id = heapq.heappop(self.heap)
+            timer = self.timers.get(timelog_id)
+            if timer is None:
+                continue
+            stats.due += 1
+            heapq.heappush(self.heap, (next_due(timer.start, now), timelog_id))
+
+            text = message_consts.TASK_TIMER_STARTED.format(
+                name=timer.task_name,
+                duration=db.format_duration(shown_duration(now - timer.start)),
+            )
+            if self.last_sent.get(timelog_id) == text:
+                stats.skipped += 1
+                continue
+            self.edit(bot, timer, text)
+            stats.queued += 1
+
+        stats.wall_time = time.perf_counter() - started_at
+        self.last_stats = stats
+        metrics.TIMER_TICK_DURATION.observe(stats.wall_time)
+        if stats.queued:
+            metrics.TIMER_EDITS.inc(stats.queued)
+        if stats.due:
+            logger.debug(
+                f"timer refresh: {stats}, {len(self.timers)} running, "
+                f"outbound depth {self.outbound.depth}, failed so far {self.failed}",
+            )
+        return stats
+
+    async def refresh(self, context: ContextTypes.DEFAULT_TYPE) -> RefreshStats:
+        return self.tick(context.bot)
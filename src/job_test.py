@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, List
+
+import db
+from db import Epic, Task
+from job import RunningTimer, TimerRefresher, next_due, shown_duration
+from outbound import OutboundScheduler
+
+START = 1_700_000_000.0
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.edits: List[dict] = []
+
+    async def edit_message_text(self, **kwargs: Any) -> None:
+        self.edits.append(kwargs)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = START
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def new_refresher(clock: FakeClock) -> TimerRefresher:
+    return TimerRefresher(OutboundScheduler(chat_rate=100, chat_burst=100), clock)
+
+
+def timer(timelog_id: int, start: float = START) -> RunningTimer:
+    return RunningTimer(timelog_id, timelog_id, timelog_id * 10, "t", start)
+
+
+def test_precision_drops_with_age() -> None:
+    assert next_due(START, START) == START + 5
+    assert next_due(START, START + 57) == START + 60
+    assert next_due(START, START + 60) == START + 120
+    assert next_due(START, START + 3599) == START + 3600
+    assert next_due(START, START + 3600) == START + 3900
+    assert shown_duration(37) == 35
+    assert shown_duration(59 * 60 + 30) == 59 * 60
+    assert shown_duration(5 * 3600 + 299) == 5 * 3600
+
+
+def test_tick_edits_due_timers_only() -> None:
+    clock = FakeClock()
+    bot = FakeBot()
+
+    async def run() -> None:
+        refresher = new_refresher(clock)
+        refresher.start(timer(1))
+        refresher.start(timer(2, start=START - 3600))
+
+        clock.now = START + 4
+        assert refresher.tick(bot).due == 0
+        clock.now = START + 5
+        stats = refresher.tick(bot)
+        assert (stats.due, stats.queued) == (1, 1)
+
+        # both due; a stopped timer is dropped when its entry comes up
+        refresher.stop(1)
+        clock.now = START + 300
+        stats = refresher.tick(bot)
+        assert (stats.due, stats.queued) == (1, 1)
+        assert refresher.heap == [(START + 600, 2)]
+        await refresher.outbound.join()
+        await refresher.outbound.stop()
+
+    asyncio.run(run())
+    assert [edit["message_id"] for edit in bot.edits] == [10, 20]
+    assert "1 ساعت 5 دقیقه" in bot.edits[1]["text"]
+
+
+def test_edits_per_hour_drop_by_an_order_of_magnitude() -> None:
+    clock = FakeClock()
+
+    async def run() -> int:
+        refresher = new_refresher(clock)
+        refresher.start(timer(1))
+        for second in range(5 * 3600):
+            clock.now = START + second
+            refresher.tick(FakeBot())  # type: ignore[arg-type]
+        await refresher.outbound.join()
+        await refresher.outbound.stop()
+        return refresher.edits
+
+    edits = asyncio.run(run())
+    # a five hour timer used to be edited every 10 seconds
+    assert edits <= 5 * 360 // 10
+    # but is still edited every 5 seconds in its first minute
+    assert edits >= 11
+
+
+def test_load_seeds_running_timers() -> None:
+    db.initialize_repos(":memory:", do_migration=True)
+    assert db.epic_repo is not None and db.task_repo is not None
+    assert db.timelog_repo is not None
+    epic_id = db.epic_repo.create(Epic(name="e", description="", chat_id=1))
+    task_id = db.task_repo.create(Task(name="t", description="", epic_id=epic_id))
+    start = datetime.now().replace(microsecond=0) - timedelta(minutes=3)
+    with_message = db.timelog_repo.create(task_id, start)
+    db.timelog_repo.set_message(with_message, chat_id=1, message_id=10)
+    db.timelog_repo.create(task_id, start)
+    done = db.timelog_repo.create(task_id, start)
+    db.timelog_repo.set_message(done, chat_id=1, message_id=11)
+    db.timelog_repo.set_end_if_not_exists(done, datetime.now())
+
+    refresher = TimerRefresher(OutboundScheduler())
+    asyncio.run(refresher.load(SimpleNamespace()))  # type: ignore[arg-type]
+    assert list(refresher.timers) == [with_message]
+    assert refresher.timers[with_message].start == start.timestamp()
@@ -1,19 +1,44 @@
-import asyncio
+import copy
 import json
 import logging
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 import requests
-import telegram
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry  # type: ignore
 
+# Bot API limit for the text of one message
+MAX_MESSAGE_LENGTH = 4096
 
+RecordKey = Tuple[str, str, str, int, str]
+
+
+# emit() only formats the message and puts the record on a queue, like
+# logging.handlers.QueueHandler; a background thread collects what
+# arrives within flush_window, merges identical records into one entry with
+# a repeat count and sends them as one admin message, at most one message
+# every min_interval seconds. Records are dropped when the queue is full.
 class TelegramLogger(logging.Handler):
-    def __init__(self, url: str, chat_id: int):
+    def __init__(
+        self,
+        url: str,
+        chat_id: int,
+        flush_window: float = 2,
+        min_interval: float = 3,
+        max_queue_size: int = 1000,
+        close_timeout: float = 5,
+    ):
 
         self.url = url
         self.chat_id = chat_id
+        self.flush_window = flush_window
+        self.min_interval = min_interval
+        self.close_timeout = close_timeout
 
         MAX_POOLSIZE = 100
         self.session = session = requests.Session()
@@ -36,30 +61,153 @@ class TelegramLogger(logging.Handler):
         )
         super().__init__()
 
-    def format(self, entry: logging.LogRecord) -> str:
-        message = json.dumps(
-            {
-                "time": datetime.fromtimestamp(entry.created).isoformat(),
-                "pathname": entry.pathname,
-                "lineno": entry.lineno,
-                "level": entry.levelname,
-                "message": entry.msg,
-                "name": entry.name,
-            },
-            indent=4,
-            sort_keys=True,
+        self.records: queue.Queue[Optional[logging.LogRecord]] = queue.Queue(
+            maxsize=max_queue_size,
         )
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        self.sent = 0
+        self.last_sent_at = 0.0
+        self.closed = False
+        self.worker = threading.Thread(
+            target=self.run,
+            name="telegram-logger",
+            daemon=True,
+        )
+        self.worker.start()
+
+    def format(self, entry: logging.LogRecord, repeated: int = 1) -> str:
+        fields = {
+            "time": datetime.fromtimestamp(entry.created).isoformat(),
+            "pathname": entry.pathname,
+            "lineno": entry.lineno,
+            "level": entry.levelname,
+            "message": entry.getMessage(),
+            "name": entry.name,
+        }
+        if repeated > 1:
+            fields["repeated"] = repeated
+        message = json.dumps(fields, indent=4, sort_keys=True, ensure_ascii=False)
         message = f"```\n{message}\n```".strip()
         return message
 
     def emit(self, record: logging.LogRecord) -> None:
         if record.name == "urllib3.connectionpool":
             return  # it cause infinite recursion
+        if threading.current_thread() is self.worker or self.closed:
+            # sending a batch must not log into the next one
+            return
+
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args may change before the worker gets to the record, and a bad
+        # format string should be reported where it was logged
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
 
-        body = json.dumps({"chat_id": self.chat_id, "text": self.format(record)})
+    def take_dropped(self) -> int:
+        with self.dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def collect(self, first: logging.LogRecord) -> Tuple[List[str], bool]:
+        # returns the formatted batch and whether the handler is closing
+        counts: Dict[RecordKey, int] = {}
+        records: Dict[RecordKey, logging.LogRecord] = {}
+        closing = False
+        record: Optional[logging.LogRecord] = first
+        deadline = time.monotonic() + self.flush_window
+        while record is not None:
+            key = (
+                record.name,
+                record.levelname,
+                record.pathname,
+                record.lineno,
+                record.getMessage(),
+            )
+            counts[key] = counts.get(key, 0) + 1
+            records.setdefault(key, record)
+
+            timeout = deadline - time.monotonic()
+            try:
+                record = (
+                    self.records.get(timeout=timeout)
+                    if timeout > 0
+                    else self.records.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if record is None:
+                closing = True
+
+        return [self.format(records[key], counts[key]) for key in records], closing
+
+    def split(self, entries: List[str]) -> List[str]:
+        messages: List[str] = []
+        current = ""
+        for entry in entries:
+            entry = entry[:MAX_MESSAGE_LENGTH]
+            if current and len(current) + len(entry) + 1 > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = ""
+            current = f"{current}\n{entry}" if current else entry
+        if current:
+            messages.append(current)
+        return messages
+
+    def send(self, text: str) -> None:
+        wait = self.last_sent_at + self.min_interval - time.monotonic()
+        if wait > 0 and not self.closed:
+            time.sleep(wait)
+        self.last_sent_at = time.monotonic()
+
+        body = json.dumps({"chat_id": self.chat_id, "text": text})
         res = self.session.post(
             url=self.url,
             data=body,
             headers={"Content-Type": "Application/Json"},
         )
         res.raise_for_status()
+        self.sent += 1
+
+    def run(self) -> None:
+        closing = False
+        while not closing:
+            first = self.records.get()
+            if first is None:
+                break
+            entries, closing = self.collect(first)
+            dropped = self.take_dropped()
+            if dropped:
+                entries.append(f"{dropped} log records dropped")
+            for text in self.split(entries):
+                try:
+                    self.send(text)
+                except Exception as error:
+                    # logging it would come back here; stderr is where
+                    # logging.Handler.handleError reports its own failures
+                    sys.stderr.write(f"couldn't send logs to telegram: {error!r}\n")
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            try:
+                self.records.put(None, timeout=self.close_timeout)
+            except queue.Full:
+                pass
+            self.worker.join(timeout=self.close_timeout)
+        super().close()
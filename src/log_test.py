@@ -0,0 +1,102 @@
+import json
+import logging
+import time
+from typing import Any, List
+
+from log import TelegramLogger
+
+
+class FakeResponse:
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeSession:
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.texts: List[str] = []
+
+    def post(self, data: str, **_: Any) -> FakeResponse:
+        time.sleep(self.delay)
+        self.texts.append(json.loads(data)["text"])
+        return FakeResponse()
+
+
+def new_logger(session: FakeSession, **kwargs: Any) -> logging.Logger:
+    handler = TelegramLogger(url="https://example.com", chat_id=1, **kwargs)
+    handler.session = session  # type: ignore[assignment]
+    logger = logging.getLogger(f"log_test.{id(handler)}")
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+
+def test_emit_does_not_wait_for_telegram() -> None:
+    session = FakeSession(delay=0.5)
+    logger = new_logger(session, flush_window=0.01)
+    started_at = time.perf_counter()
+    for i in range(20):
+        logger.warning("warning %d", i)
+    assert time.perf_counter() - started_at < 0.1
+    logger.handlers[0].close()
+
+
+def test_batches_and_deduplicates() -> None:
+    session = FakeSession()
+    logger = new_logger(session, flush_window=0.2)
+    for _ in range(5):
+        logger.warning("same")
+    logger.error("other")
+    logger.handlers[0].close()
+
+    assert len(session.texts) == 1
+    assert '"repeated": 5' in session.texts[0]
+    assert '"message": "other"' in session.texts[0]
+
+
+def test_close_is_bounded() -> None:
+    session = FakeSession(delay=1)
+    logger = new_logger(session, flush_window=0, close_timeout=0.1)
+    logger.warning("slow")
+    time.sleep(0.05)
+    started_at = time.perf_counter()
+    logger.handlers[0].close()
+    assert time.perf_counter() - started_at < 0.5
+
+
+def test_sends_are_rate_limited() -> None:
+    session = FakeSession()
+    sent_at: List[float] = []
+    post = session.post
+
+    def timed_post(data: str, **kwargs: Any) -> FakeResponse:
+        sent_at.append(time.monotonic())
+        return post(data, **kwargs)
+
+    session.post = timed_post  # type: ignore[method-assign]
+    logger = new_logger(session, flush_window=0, min_interval=0.2)
+    logger.warning("first")
+    time.sleep(0.05)
+    logger.warning("second")
+    time.sleep(0.3)
+    logger.handlers[0].close()
+
+    assert len(sent_at) == 2
+    assert sent_at[1] - sent_at[0] >= 0.2
+
+
+def test_message_is_formatted_when_logged() -> None:
+    session = FakeSession()
+    logger = new_logger(session, flush_window=0.1)
+    handler = logger.handlers[0]
+    errors: List[logging.LogRecord] = []
+    handler.handleError = errors.append  # type: ignore[method-assign, assignment]
+
+    items = ["before"]
+    logger.warning("items: %s", items)
+    items.append("after")
+    logger.warning("%d", "not a number")
+    handler.close()
+
+    assert '"message": "items: [\'before\']"' in session.texts[0]
+    assert [record.msg for record in errors] == ["%d"]
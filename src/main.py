@@ -5,9 +5,15 @@ import sqlite3
 from telegram.ext import Application
 
 import bot
+import callback_consts
+import db
+import metrics
 from config import ServiceConfig
-from db import initialize_repos
+from db import QueryTracer, initialize_repos
 from log import TelegramLogger
+from outbound import OutboundScheduler, Priority
+from update_processor import PerChatUpdateProcessor
+from webhook import WebhookServer
 
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -17,10 +23,41 @@ logging.getLogger("telegram.ext").setLevel(logging.INFO)
 logging.getLogger("apscheduler.scheduler").setLevel(logging.WARNING)
 logging.getLogger("apscheduler.executors.default").setLevel(logging.WARNING)
 logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
+metrics_server = None
+if ServiceConfig.METRICS_PORT:
+    metrics_server = metrics.MetricsServer(
+        ServiceConfig.METRICS_LISTEN,
+        ServiceConfig.METRICS_PORT,
+    )
+
+
+async def start_metrics(_: Application) -> None:
+    if metrics_server is not None:
+        await metrics_server.start()
+
+
+async def stop_metrics(_: Application) -> None:
+    if metrics_server is not None:
+        await metrics_server.stop()
+
+
+update_processor = PerChatUpdateProcessor(ServiceConfig.CONCURRENT_UPDATES)
 application = (
     Application.builder()
     .token(ServiceConfig.TOKEN)
     .base_url(ServiceConfig.BOT_BASE_URL)
+    # python-telegram-bot defaults to one connection, which would serialize
+    # the outbound scheduler's concurrent calls
+    .request(
+        metrics.InstrumentedRequest(
+            connection_pool_size=ServiceConfig.OUTBOUND_CONCURRENCY,
+        ),
+    )
+    .get_updates_request(metrics.InstrumentedRequest())
+    .update_queue(metrics.TimedUpdateQueue())
+    .concurrent_updates(update_processor)
+    .post_init(start_metrics)
+    .post_shutdown(stop_metrics)
     .build()
 )
 
@@ -31,7 +68,62 @@ logger = TelegramLogger(
 logger.setLevel(logging.WARNING)
 logging.basicConfig(level=logging.DEBUG, handlers=[logger, logging.StreamHandler()])
 
-initialize_repos(ServiceConfig.SQLITE_FILE, ServiceConfig.MIGRATION)
-bot.TimarBot(application, ServiceConfig.ADMIN_ID).run(
+tracer = None
+if ServiceConfig.SQL_TRACE:
+    tracer = QueryTracer(
+        slow_threshold=ServiceConfig.SQL_SLOW_QUERY_MS / 1000,
+        explain_every=ServiceConfig.SQL_EXPLAIN_EVERY,
+    )
+initialize_repos(
+    ServiceConfig.SQLITE_FILE,
+    ServiceConfig.MIGRATION,
+    readers=ServiceConfig.SQLITE_READERS,
+    synchronous=ServiceConfig.SQLITE_SYNCHRONOUS,
+    cache_size_kib=ServiceConfig.SQLITE_CACHE_SIZE_KIB,
+    group_commit_window=ServiceConfig.SQLITE_GROUP_COMMIT_MS / 1000,
+    user_state_cache_size=ServiceConfig.USER_STATE_CACHE_SIZE,
+    user_state_cache_ttl=ServiceConfig.USER_STATE_CACHE_TTL,
+    entity_cache=ServiceConfig.ENTITY_CACHE,
+    entity_cache_size=ServiceConfig.ENTITY_CACHE_SIZE,
+    observer=metrics.observe_db_call,
+    tracer=tracer,
+)
+callback_consts.payload_store.repo = db.async_callback_payload_repo
+webhook = None
+if ServiceConfig.UPDATE_MODE == "webhook":
+    webhook = WebhookServer(
+        application,
+        listen=ServiceConfig.WEBHOOK_LISTEN,
+        port=ServiceConfig.WEBHOOK_PORT,
+        path=ServiceConfig.WEBHOOK_PATH,
+        url=ServiceConfig.WEBHOOK_URL,
+        secret_token=ServiceConfig.WEBHOOK_SECRET,
+    )
+elif ServiceConfig.UPDATE_MODE != "polling":
+    raise ValueError(f"unknown update mode: {ServiceConfig.UPDATE_MODE}")
+
+timar = bot.TimarBot(
+    application,
+    ServiceConfig.ADMIN_ID,
+    outbound=OutboundScheduler(
+        global_rate=ServiceConfig.OUTBOUND_GLOBAL_RATE,
+        chat_rate=ServiceConfig.OUTBOUND_CHAT_RATE,
+        chat_burst=ServiceConfig.OUTBOUND_CHAT_BURST,
+        concurrency=ServiceConfig.OUTBOUND_CONCURRENCY,
+    ),
+    single_round_trip=ServiceConfig.SINGLE_ROUND_TRIP_REPLY,
+    keyboard_cache_size=ServiceConfig.KEYBOARD_CACHE_SIZE,
+)
+
+metrics.UPDATE_QUEUE_DEPTH.set_function(application.update_queue.qsize)
+metrics.UPDATE_CHATS.set_function(lambda: update_processor.active_chats)
+for priority in Priority:
+    metrics.OUTBOUND_DEPTH.labels(priority.name.lower()).set_function(
+        lambda priority=priority: timar.outbound.depth_of(priority),
+    )
+metrics.OUTBOUND_IN_FLIGHT.set_function(lambda: timar.outbound.stats.in_flight)
+metrics.RUNNING_TIMERS.set_function(lambda: len(timar.timer_refresher.timers))
+timar.run(
     poll_interval=ServiceConfig.POLL_INTERVAL,
+    webhook=webhook,
 )
@@ -90,6 +90,68 @@ REPORT_GET_DURATION = """
 مشخص کنید گزارش چند روز اخیر را میخواهید.
 """.strip()
 
+REPORT_INVALID_DURATION = """
+تعداد روز باید یک عدد مثبت باشد، دوباره وارد کنید.
+""".strip()
+
+REPORT_HEADER = """
+گزارش {days} روز اخیر
+مجموع: {duration}
+""".strip()
+
+REPORT_EPIC = "\n📁 {name}: {duration}"
+REPORT_TASK = "  • {name}: {duration}"
+REPORT_TASK_RUNNING = "  • {name}: {duration} (در حال اجرا)"
+
+REPORT_EMPTY = """
+در {days} روز اخیر زمانی ثبت نشده است.
+""".strip()
+
+EXPORT_USAGE = """
+فرمت خروجی نامعتبر است. مثال:
+/export
+/export jsonl
+/export csv gz
+""".strip()
+
+EXPORT_EMPTY = """
+هنوز اپیکی برای خروجی گرفتن ثبت نشده است.
+""".strip()
+
+EXPORT_CAPTION = "خروجی تاریخچه ({count} ردیف)"
+
+PROFILE_USAGE = """
+ورودی نامعتبر است. مثال:
+/profile
+/profile 60
+/profile 60 20
+""".strip()
+
+PROFILE_STARTED = """
+پروفایل گیری به مدت {seconds:g} ثانیه شروع شد.
+""".strip()
+
+PROFILE_RUNNING = """
+یک پروفایل گیری در حال اجراست.
+""".strip()
+
+PROFILE_CAPTION = "پشته ها به فرمت collapsed ({samples} نمونه)"
+
+SQL_USAGE = """
+ورودی نامعتبر است. مثال:
+/sql
+/sql 20
+/sql reset
+""".strip()
+
+SQL_TRACE_DISABLED = """
+ردیابی کوئری ها غیرفعال است (SQL_TRACE).
+""".strip()
+
+SQL_TRACE_RESET = """
+آمار کوئری ها پاک شد.
+""".strip()
+
 TIMELOG_DELETED = """
 تایمر این تسک حذف شد.
 """.strip()
@@ -102,3 +164,6 @@ EPIC_EDITED = """
 TASK_ENDED = """
 تسک اتمام پذیرفت
 """.strip()
+BUTTON_EXPIRED = """
+این دکمه منقضی شده است، لطفا دوباره از منوی اصلی شروع کنید.
+""".strip()
@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+# seconds, from a cached lookup to a slow Bot API call
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# A family of time series that differ only in their label values. A child is
+# created on first use of its label values and kept, so label values must
+# come from a small fixed set (handler names, API methods), never user input.
+class Metric:
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children: Dict[Tuple[str, ...], Any] = {}
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        child = self.children.get(values)
+        if child is not None:
+            return child
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}")
+        with self.lock:
+            return self.children.setdefault(values, self.new_child())
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class CounterChild:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, values)} "
+            f"{format_value(child.value)}"
+            for values, child in list(self.children.items())
+        ]
+
+
+class GaugeChild:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        # read when scraped, for values another object already keeps
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self.children.items()):
+            try:
+                value = child.get()
+            except Exception as error:
+                logger.warning(f"couldn't read gauge {self.name}: {error!r}")
+                continue
+            samples.append(
+                f"{self.name}{format_labels(self.label_names, values)} "
+                f"{format_value(value)}",
+            )
+        return samples
+
+
+class HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # per bucket, not cumulative; the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        if list(buckets) != sorted(buckets) or "le" in labels:
+            raise ValueError(f"invalid histogram {name}")
+        self.buckets = tuple(bucket for bucket in buckets if bucket != math.inf)
+        super().__init__(name, help, labels, registry)
+
+    def new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        samples = []
+        names = self.label_names + ("le",)
+        for values, child in list(self.children.items()):
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = format_labels(names, values + (format_value(bound),))
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, values)
+            samples.append(f"{self.name}_sum{labels} {format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+HANDLER_DURATION = Histogram(
+    "timar_handler_duration_seconds",
+    "Time to handle a command, callback action or conversation input.",
+    labels=("kind", "handler"),
+)
+HANDLER_ERRORS = Counter(
+    "timar_handler_errors_total",
+    "Handlers that raised.",
+    labels=("kind", "handler"),
+)
+DB_CALL_DURATION = Histogram(
+    "timar_db_call_duration_seconds",
+    "Time a repository method spent on a database thread.",
+    labels=("method",),
+)
+DB_CALL_WAIT = Histogram(
+    "timar_db_call_wait_seconds",
+    "Time a repository call waited for a free database thread.",
+)
+BOT_API_DURATION = Histogram(
+    "timar_bot_api_request_duration_seconds",
+    "Bot API request latency, including long polls of getUpdates.",
+    labels=("method",),
+    buckets=DEFAULT_BUCKETS + (30.0, 60.0),
+)
+BOT_API_REQUESTS = Counter(
+    "timar_bot_api_requests_total",
+    "Bot API requests by HTTP status, 0 when no response came back.",
+    labels=("method", "status"),
+)
+TIMER_TICK_DURATION = Histogram(
+    "timar_timer_tick_duration_seconds",
+    "Time to find the due timer messages and queue their edits.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1),
+)
+TIMER_EDITS = Counter(
+    "timar_timer_edits_total",
+    "Timer message edits queued.",
+)
+UPDATE_QUEUE_LAG = Histogram(
+    "timar_update_queue_lag_seconds",
+    "Time an update waited on the update queue before being handled.",
+)
+UPDATE_QUEUE_DEPTH = Gauge(
+    "timar_update_queue_depth",
+    "Updates waiting on the update queue.",
+)
+UPDATE_CHATS = Gauge(
+    "timar_update_chats",
+    "Chats with an update being handled or waiting for an earlier one.",
+)
+OUTBOUND_DEPTH = Gauge(
+    "timar_outbound_queue_depth",
+    "Bot API calls waiting in the outbound scheduler.",
+    labels=("priority",),
+)
+OUTBOUND_IN_FLIGHT = Gauge(
+    "timar_outbound_in_flight",
+    "Bot API calls started by the outbound scheduler and not finished yet.",
+)
+RUNNING_TIMERS = Gauge(
+    "timar_running_timers",
+    "Timer messages being refreshed.",
+)
+
+
+def observe_db_call(method: str, wait: float, elapsed: float) -> None:
+    DB_CALL_WAIT.observe(wait)
+    DB_CALL_DURATION.labels(method).observe(elapsed)
+
+
+# The update queue of the Application; records when each update was put on
+# it so the lag is known when the application takes it off.
+class TimedUpdateQueue(asyncio.Queue):
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)  # type: ignore[misc]
+        self.put_times: Deque[float] = deque()
+
+    def _put(self, item: Any) -> None:
+        self.put_times.append(time.perf_counter())
+        super()._put(item)  # type: ignore[misc]
+
+    def _get(self) -> Any:
+        UPDATE_QUEUE_LAG.observe(time.perf_counter() - self.put_times.popleft())
+        return super()._get()  # type: ignore[misc]
+
+
+# Times every Bot API request the Bot makes, whoever makes it, by method.
+class InstrumentedRequest(HTTPXRequest):
+    async def do_request(  # type: ignore[override]
+        self,
+        url: str,
+        method: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        started_at = time.perf_counter()
+        status = 0
+        try:
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+            return status, payload
+        finally:
+            BOT_API_DURATION.labels(api_method).observe(
+                time.perf_counter() - started_at,
+            )
+            BOT_API_REQUESTS.labels(api_method, str(status)).inc()
+
+
+# Serves the registry in the Prometheus text format on GET /metrics.
+class MetricsServer:
+    def __init__(
+        self,
+        listen: str,
+        port: int,
+        registry: Registry = REGISTRY,
+    ):
+        self.registry = registry
+        self.server = HTTPServer(listen, port, self.handle)
+
+    async def handle(self, request: Request) -> Response:
+        if request.path != "/metrics":
+            return Response.text(404)
+        if request.method != "GET":
+            return Response.text(405)
+        return Response(body=self.registry.render().encode(), content_type=CONTENT_TYPE)
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+import pytest
+from telegram import Bot
+
+import db
+import metrics
+from db import Epic
+from fake_bot_api import FakeBotAPI
+from metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    InstrumentedRequest,
+    MetricsServer,
+    Registry,
+    TimedUpdateQueue,
+)
+
+
+def test_render_text_format() -> None:
+    registry = Registry()
+    calls = Counter("calls_total", "Calls.", labels=("method",), registry=registry)
+    depth = Gauge("depth", "Depth.", registry=registry)
+    latency = Histogram(
+        "latency_seconds",
+        "Latency.",
+        labels=("method",),
+        buckets=(0.1, 1),
+        registry=registry,
+    )
+    calls.labels('say "hi"').inc()
+    calls.labels('say "hi"').inc(2)
+    depth.set_function(lambda: 7)
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.labels("get").observe(value)
+
+    assert registry.render() == (
+        "# HELP calls_total Calls.\n"
+        "# TYPE calls_total counter\n"
+        'calls_total{method="say \\"hi\\""} 3\n'
+        "# HELP depth Depth.\n"
+        "# TYPE depth gauge\n"
+        "depth 7\n"
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{method="get",le="0.1"} 2\n'
+        'latency_seconds_bucket{method="get",le="1"} 3\n'
+        'latency_seconds_bucket{method="get",le="+Inf"} 4\n'
+        'latency_seconds_sum{method="get"} 3.65\n'
+        'latency_seconds_count{method="get"} 4\n'
+    )
+    with pytest.raises(ValueError):
+        calls.labels("a", "b")
+    with pytest.raises(ValueError):
+        Counter("depth", "Again.", registry=registry)
+
+
+def test_update_queue_lag() -> None:
+    async def run() -> None:
+        queue = TimedUpdateQueue()
+        before = metrics.UPDATE_QUEUE_LAG.labels().count
+        await queue.put("update")
+        await asyncio.sleep(0.01)
+        assert await queue.get() == "update"
+        assert metrics.UPDATE_QUEUE_LAG.labels().count == before + 1
+
+    asyncio.run(run())
+
+
+def test_bot_api_requests_are_counted_by_method() -> None:
+    async def run() -> None:
+        api = FakeBotAPI()
+        await api.start()
+        sent = metrics.BOT_API_REQUESTS.labels("sendMessage", "200")
+        before = sent.value
+        async with Bot(
+            "1:test",
+            base_url=api.base_url,
+            request=InstrumentedRequest(),
+        ) as bot:
+            await bot.send_message(chat_id=1, text="hi")
+        await api.stop()
+        assert sent.value == before + 1
+        assert metrics.BOT_API_DURATION.labels("sendMessage").count >= 1
+
+    asyncio.run(run())
+
+
+def test_db_calls_are_observed_by_method() -> None:
+    observed = []
+    db.initialize_repos(
+        ":memory:",
+        do_migration=True,
+        observer=lambda method, wait, elapsed: observed.append(method),
+    )
+    assert db.async_epic_repo is not None
+
+    async def run() -> None:
+        assert db.async_epic_repo is not None and db.epic_repo is not None
+        epic_repo = db.epic_repo
+
+        def create() -> None:
+            epic_repo.create(Epic(name="e", description="", chat_id=1))
+
+        await db.run_in_transaction(create)
+        await db.async_epic_repo.get_by_chat_id(1)
+
+    asyncio.run(run())
+    assert observed == [
+        "test_db_calls_are_observed_by_method.run.create",
+        f"{type(db.epic_repo).__name__}.get_by_chat_id",
+    ]
+
+
+def test_metrics_endpoint() -> None:
+    async def run() -> None:
+        registry = Registry()
+        Counter("up_total", "Up.", registry=registry).inc()
+        server = MetricsServer("127.0.0.1", 0, registry)
+        await server.start()
+        url = f"http://127.0.0.1:{server.server.port}"
+        async with httpx.AsyncClient(base_url=url) as client:
+            response = await client.get("/metrics")
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/plain")
+            assert "up_total 1\n" in response.text
+            assert (await client.get("/other")).status_code == 404
+            assert (await client.post("/metrics")).status_code == 405
+        await server.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import timedelta
+from enum import IntEnum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+Call = Callable[[], Awaitable[Any]]
+
+MAX_IDLE_BUCKETS = 4096
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, now: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError(f"invalid token bucket: {rate = }, {capacity = }")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self.refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class OutboundStats:
+    sent: int = 0
+    failed: int = 0
+    coalesced: int = 0
+    retried: int = 0
+    depth: int = 0
+    in_flight: int = 0
+
+
+class Request:
+    def __init__(
+        self,
+        priority: Priority,
+        chat_id: int,
+        call: Call,
+        coalesce_key: Optional[Hashable],
+    ):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.call = call
+        self.coalesce_key = coalesce_key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.attempts = 0
+
+
+# Every Bot API call goes through one worker that hands out a global token
+# and a per chat token before starting it. Interactive replies are always
+# picked before background work, and chats of the same priority are served
+# round robin so one busy chat can't starve the others. A pending request
+# with the same coalesce key as a new one is updated in place, so e.g. only
+# the latest text of a timer message is sent, unless the new one is less
+# urgent, then the pending one is kept as is.
+class OutboundScheduler:
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        concurrency: int = 8,
+        max_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be positive, got {concurrency}")
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock())
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+        self.queues: Dict[Priority, OrderedDict[int, Deque[Request]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self.pending: Dict[Hashable, Request] = {}
+        self.paused_until = 0.0
+        self.stats = OutboundStats()
+
+        self.worker: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    @property
+    def depth(self) -> int:
+        return self.stats.depth
+
+    def depth_of(self, priority: Priority) -> int:
+        return sum(len(requests) for requests in self.queues[priority].values())
+
+    def submit(
+        self,
+        priority: Priority,
+        chat_id: int,
+        call: Call,
+        coalesce_key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        if coalesce_key is not None and coalesce_key in self.pending:
+            request = self.pending[coalesce_key]
+            if priority > request.priority:
+                # a timer edit must not replace a queued reply to the user
+                self.stats.coalesced += 1
+                return request.future
+            request.call = call
+            if priority < request.priority:
+                # keep its place in line but let it jump to the faster queue
+                self.remove(request)
+                request.priority = priority
+                self.enqueue(request)
+            self.stats.coalesced += 1
+            return request.future
+
+        request = Request(priority, chat_id, call, coalesce_key)
+        if coalesce_key is not None:
+            self.pending[coalesce_key] = request
+        self.enqueue(request)
+        self.start()
+        return request.future
+
+    async def call(
+        self,
+        priority: Priority,
+        chat_id: int,
+        call: Call,
+        coalesce_key: Optional[Hashable] = None,
+    ) -> Any:
+        return await self.submit(priority, chat_id, call, coalesce_key)
+
+    def enqueue(self, request: Request, first: bool = False) -> None:
+        requests = self.queues[request.priority].setdefault(request.chat_id, deque())
+        if first:
+            requests.appendleft(request)
+        else:
+            requests.append(request)
+        self.stats.depth += 1
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def remove(self, request: Request) -> None:
+        chats = self.queues[request.priority]
+        chats[request.chat_id].remove(request)
+        self.stats.depth -= 1
+        if not chats[request.chat_id]:
+            del chats[request.chat_id]
+
+    def chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def prune_buckets(self, now: float) -> None:
+        # a full bucket is the same as a new one
+        queued = set().union(*self.queues.values())
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            if chat_id not in queued and bucket.is_full(now):
+                del self.chat_buckets[chat_id]
+
+    def next_request(self, now: float) -> Tuple[Optional[Request], Optional[float]]:
+        # returns the request to start now, or how long to wait for one
+        if now < self.paused_until:
+            return None, self.paused_until - now
+        if self.depth == 0:
+            return None, None
+        if len(self.chat_buckets) > MAX_IDLE_BUCKETS:
+            self.prune_buckets(now)
+        wait = self.global_bucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+
+        shortest: Optional[float] = None
+        for priority in Priority:
+            chats = self.queues[priority]
+            for chat_id in list(chats):
+                bucket = self.chat_bucket(chat_id, now)
+                wait = bucket.wait_time(now)
+                if wait > 0:
+                    shortest = wait if shortest is None else min(shortest, wait)
+                    continue
+                request = chats[chat_id].popleft()
+                self.stats.depth -= 1
+                if chats[chat_id]:
+                    chats.move_to_end(chat_id)
+                else:
+                    del chats[chat_id]
+                if self.pending.get(request.coalesce_key) is request:
+                    del self.pending[request.coalesce_key]
+                bucket.take(now)
+                self.global_bucket.take(now)
+                return request, None
+        return None, shortest
+
+    def start(self) -> None:
+        if self.worker is None or self.worker.done():
+            self.wakeup = asyncio.Event()
+            self.slots = asyncio.Semaphore(self.concurrency)
+            self.worker = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def join(self) -> None:
+        # waits until everything submitted so far is done
+        while self.depth or self.tasks:
+            await asyncio.sleep(0.01)
+
+    async def run(self) -> None:
+        assert self.wakeup is not None and self.slots is not None
+        while True:
+            await self.slots.acquire()
+            request, wait = self.next_request(self.clock())
+            if request is None:
+                self.slots.release()
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self.execute(request))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def execute(self, request: Request) -> None:
+        assert self.slots is not None
+        self.stats.in_flight += 1
+        try:
+            result = await request.call()
+        except RetryAfter as error:
+            self.retry(request, error)
+        except Exception as error:
+            self.stats.failed += 1
+            if not request.future.done():
+                request.future.set_exception(error)
+        else:
+            self.stats.sent += 1
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self.stats.in_flight -= 1
+            self.slots.release()
+
+    def retry(self, request: Request, error: RetryAfter) -> None:
+        retry_after = error.retry_after
+        if isinstance(retry_after, timedelta):
+            retry_after = retry_after.total_seconds()
+        # flood control may cover the whole bot, so every chat waits
+        self.paused_until = max(self.paused_until, self.clock() + retry_after)
+        logger.warning(f"flood control, pausing outbound calls for {retry_after}s")
+
+        request.attempts += 1
+        if request.attempts > self.max_retries:
+            self.stats.failed += 1
+            if not request.future.done():
+                request.future.set_exception(error)
+            return
+
+        self.stats.retried += 1
+        newer = self.pending.get(request.coalesce_key)
+        if newer is not None and newer is not request:
+            # a newer call replaced this one while it was in flight
+            newer.future.add_done_callback(
+                lambda future: copy_result(future, request.future),
+            )
+            return
+        if request.coalesce_key is not None:
+            self.pending[request.coalesce_key] = request
+        self.enqueue(request, first=True)
+
+
+def copy_result(source: asyncio.Future, target: asyncio.Future) -> None:
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())  # type: ignore[arg-type]
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,136 @@
+import asyncio
+from typing import Any, List
+
+import pytest
+from telegram.error import RetryAfter
+
+from outbound import OutboundScheduler, Priority, Request
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def recorder(calls: List[str], name: str) -> Any:
+    async def call() -> str:
+        calls.append(name)
+        return name
+
+    return call
+
+
+def test_interactive_goes_first() -> None:
+    async def run() -> None:
+        scheduler = OutboundScheduler(concurrency=1)
+        calls: List[str] = []
+        scheduler.submit(Priority.BACKGROUND, 1, recorder(calls, "edit"))
+        scheduler.submit(Priority.INTERACTIVE, 2, recorder(calls, "reply"))
+        await scheduler.join()
+        await scheduler.stop()
+        assert calls == ["reply", "edit"]
+
+    asyncio.run(run())
+
+
+def test_pending_edits_coalesce() -> None:
+    async def run() -> None:
+        scheduler = OutboundScheduler()
+        calls: List[str] = []
+        first = scheduler.submit(Priority.BACKGROUND, 1, recorder(calls, "a"), (1, 10))
+        second = scheduler.submit(Priority.BACKGROUND, 1, recorder(calls, "b"), (1, 10))
+        assert first is second
+        assert scheduler.depth == 1
+        assert await first == "b"
+        await scheduler.stop()
+        assert calls == ["b"]
+        assert scheduler.stats.coalesced == 1
+
+    asyncio.run(run())
+
+
+def test_background_edit_keeps_pending_interactive_one() -> None:
+    async def run() -> None:
+        scheduler = OutboundScheduler()
+        calls: List[str] = []
+        reply = scheduler.submit(
+            Priority.INTERACTIVE,
+            1,
+            recorder(calls, "reply"),
+            (1, 10),
+        )
+        timer = scheduler.submit(
+            Priority.BACKGROUND,
+            1,
+            recorder(calls, "timer"),
+            (1, 10),
+        )
+        assert timer is reply
+        assert scheduler.depth_of(Priority.BACKGROUND) == 0
+        assert await reply == "reply"
+        await scheduler.stop()
+        assert calls == ["reply"]
+
+    asyncio.run(run())
+
+
+def test_chat_and_global_buckets() -> None:
+    async def run() -> None:
+        clock = FakeClock()
+        scheduler = OutboundScheduler(
+            global_rate=2,
+            chat_rate=1,
+            chat_burst=1,
+            clock=clock,
+        )
+        calls: List[str] = []
+        # queued without starting the worker, to pick requests by hand
+        for chat_id in (1, 1, 2, 3):
+            call = recorder(calls, str(chat_id))
+            scheduler.enqueue(Request(Priority.INTERACTIVE, chat_id, call, None))
+
+        request, wait = scheduler.next_request(clock())
+        assert request is not None and request.chat_id == 1
+        request, wait = scheduler.next_request(clock())
+        # chat 1 is out of tokens, chat 2 isn't
+        assert request is not None and request.chat_id == 2
+        # the global bucket is empty now
+        request, wait = scheduler.next_request(clock())
+        assert request is None and wait == pytest.approx(0.5)
+
+        clock.now = 0.5
+        request, wait = scheduler.next_request(clock())
+        assert request is not None and request.chat_id == 3
+        clock.now = 1
+        request, wait = scheduler.next_request(clock())
+        assert request is not None and request.chat_id == 1
+
+    asyncio.run(run())
+
+
+def test_retry_after_pauses_and_retries() -> None:
+    async def run() -> None:
+        scheduler = OutboundScheduler(chat_burst=10)
+        attempts: List[int] = []
+
+        async def flaky() -> str:
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RetryAfter(0)
+            return "ok"
+
+        assert await scheduler.call(Priority.INTERACTIVE, 1, flaky) == "ok"
+        assert len(attempts) == 2
+        assert scheduler.stats.retried == 1
+
+        async def always() -> None:
+            raise RetryAfter(0)
+
+        with pytest.raises(RetryAfter):
+            await scheduler.call(Priority.INTERACTIVE, 1, always)
+        await scheduler.stop()
+
+    asyncio.run(run())
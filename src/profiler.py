@@ -0,0 +1,153 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+
+# (file name, function) of the frames a thread sits in while it waits for
+# work; samples of idle threads are dropped
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+NO_HANDLER = "(no handler)"
+MAX_DEPTH = 64
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+@dataclass
+class Profile:
+    duration: float = 0.0
+    # every sample taken, busy or idle
+    samples: int = 0
+    # "thread name;outermost;...;innermost" -> samples, the collapsed stack
+    # format flame graph tools read
+    stacks: Counter[str] = field(default_factory=Counter)
+    # handler -> innermost frame -> samples
+    handlers: Dict[str, Counter[str]] = field(default_factory=dict)
+
+    @property
+    def busy(self) -> int:
+        return sum(self.stacks.values())
+
+    def add(self, thread: str, handler: str, stack: List[str]) -> None:
+        self.stacks[";".join([thread] + stack)] += 1
+        self.handlers.setdefault(handler, Counter())[stack[-1]] += 1
+
+    def summary(self, top: int = 10) -> str:
+        lines = [
+            f"profiled {self.duration:.1f}s, {self.busy} busy of "
+            f"{self.samples} samples",
+        ]
+        if not self.busy:
+            return lines[0]
+        handlers = sorted(
+            self.handlers.items(),
+            key=lambda item: sum(item[1].values()),
+            reverse=True,
+        )
+        for handler, frames in handlers[:top]:
+            samples = sum(frames.values())
+            lines.append("")
+            lines.append(f"{handler}: {samples} ({samples / self.busy:.0%})")
+            for frame, count in frames.most_common(top):
+                lines.append(f"  {count / self.busy:6.1%}  {frame}")
+        return "\n".join(lines)
+
+    def collapsed(self) -> bytes:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        ).encode()
+
+
+# Samples the stacks of the thread that started it (the event loop) and of
+# the database threads from a thread of its own, so nothing runs in the
+# profiled code and there is no cost at all while it is off. A sample of the
+# event loop is charged to the handler whose frame is on its stack,
+# identified by code object; samples of database threads are charged to "db".
+class SamplingProfiler:
+    def __init__(
+        self,
+        handlers: Dict[CodeType, str],
+        interval: float = 0.005,
+    ):
+        self.handlers = handlers
+        self.interval = interval
+        self.profile = Profile()
+        self.thread: Optional[threading.Thread] = None
+        self.target = threading.get_ident()
+        self.stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            raise RuntimeError("profiler is already running")
+        self.profile = Profile()
+        self.target = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run,
+            name="profiler",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self) -> Profile:
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        return self.profile
+
+    def run(self) -> None:
+        started_at = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, "")
+                if ident == self.target or name.startswith("db"):
+                    self.sample(name, frame)
+        self.profile.duration = time.perf_counter() - started_at
+
+    def sample(self, thread: str, frame: FrameType) -> None:
+        self.profile.samples += 1
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return
+
+        stack: List[str] = []
+        handler = "db" if thread.startswith("db") else NO_HANDLER
+        current: Optional[FrameType] = frame
+        while current is not None:
+            name = self.handlers.get(current.f_code)
+            if name is not None and handler == NO_HANDLER:
+                handler = name
+            if len(stack) < MAX_DEPTH:
+                stack.append(frame_name(current))
+            current = current.f_back
+        stack.reverse()
+        self.profile.add(thread, handler, stack)
+
+
+def parse_profile_args(text: str) -> Tuple[float, int]:
+    # "/profile [seconds] [top]"
+    args = text.split()[1:]
+    if len(args) > 2:
+        raise ValueError(f"too many arguments: {text}")
+    seconds = float(args[0]) if args else 30.0
+    top = int(args[1]) if len(args) > 1 else 10
+    if not 0 < seconds <= 600 or not 0 < top <= 50:
+        raise ValueError(f"out of range: {text}")
+    return seconds, top
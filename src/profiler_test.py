@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from profiler import SamplingProfiler, parse_profile_args
+
+
+def spin(seconds: float) -> None:
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def handler(seconds: float) -> None:
+    spin(seconds)
+
+
+def test_samples_are_charged_to_handlers() -> None:
+    profiler = SamplingProfiler({handler.__code__: "handler"}, interval=0.001)
+    profiler.start()
+    with pytest.raises(RuntimeError):
+        profiler.start()
+    handler(0.2)
+    profile = profiler.stop()
+    assert not profiler.running
+
+    assert profile.busy > 10
+    assert sum(profile.handlers["handler"].values()) > profile.busy / 2
+    top_frame = profile.handlers["handler"].most_common(1)[0][0]
+    assert top_frame.startswith("spin (profiler_test.py:")
+
+    summary = profile.summary(top=3)
+    assert summary.splitlines()[2].startswith("handler: ")
+    stack, count = profile.collapsed().decode().splitlines()[0].rsplit(" ", 1)
+    assert stack.startswith("MainThread;")
+    assert ";handler (profiler_test.py:" in stack
+    assert ";spin (profiler_test.py:" in stack
+    assert int(count) > 0
+
+
+def test_parse_profile_args() -> None:
+    assert parse_profile_args("/profile") == (30.0, 10)
+    assert parse_profile_args("/profile 5") == (5.0, 10)
+    assert parse_profile_args("/profile 0.5 20") == (0.5, 20)
+    for text in (
+        "/profile x",
+        "/profile 0",
+        "/profile 601",
+        "/profile 5 0",
+        "/profile 1 2 3",
+    ):
+        with pytest.raises(ValueError):
+            parse_profile_args(text)
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def chat_key(update: object) -> Optional[Hashable]:
+    # the conversation state is kept per chat
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return None
+
+
+class ChatLock:
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        # updates of the chat being handled or waiting for the lock
+        self.users = 0
+
+
+# Handles updates of different chats concurrently and updates of one chat
+# one at a time, in the order they arrived, so a chat's conversation state
+# never sees two of its messages at once. A lock exists only while its chat
+# has updates in flight, so memory follows the active chats, not all chats.
+#
+# BaseUpdateProcessor takes its semaphore before do_process_update is
+# called, so an update waiting behind an earlier one of its chat would hold
+# a slot and a busy chat could fill them all. Its semaphore is therefore
+# only a cap on the updates in flight, max_pending_updates, and
+# max_concurrent_updates is enforced here, after the chat lock is taken.
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(
+        self,
+        max_concurrent_updates: int = 64,
+        max_pending_updates: int = 10000,
+    ):
+        if max_concurrent_updates < 1 or max_pending_updates < max_concurrent_updates:
+            raise ValueError(
+                f"invalid limits: {max_concurrent_updates = }, {max_pending_updates = }",
+            )
+        super().__init__(max_pending_updates)
+        self.running = asyncio.Semaphore(max_concurrent_updates)
+        self.locks: Dict[Hashable, ChatLock] = {}
+        self.handled = 0
+        # updates that had to wait for an earlier update of their chat
+        self.serialized = 0
+
+    @property
+    def active_chats(self) -> int:
+        return len(self.locks)
+
+    async def do_process_update(
+        self,
+        update: object,
+        coroutine: Awaitable[Any],
+    ) -> None:
+        key = chat_key(update)
+        if key is None:
+            async with self.running:
+                await coroutine
+            self.handled += 1
+            return
+
+        chat = self.locks.get(key)
+        if chat is None:
+            chat = self.locks[key] = ChatLock()
+        chat.users += 1
+        try:
+            if chat.lock.locked():
+                self.serialized += 1
+            async with chat.lock:
+                async with self.running:
+                    await coroutine
+            self.handled += 1
+        finally:
+            chat.users -= 1
+            if chat.users == 0:
+                del self.locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,102 @@
+import asyncio
+from typing import Any, List, Tuple
+
+import pytest
+from telegram import Update
+
+from update_processor import PerChatUpdateProcessor, chat_key
+
+
+def message(update_id: int, chat_id: int) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": str(update_id),
+            },
+        },
+        None,  # type: ignore[arg-type]
+    )
+
+
+def test_chat_key() -> None:
+    assert chat_key(message(1, 5)) == 5
+    assert chat_key(Update(1)) is None
+    assert chat_key(object()) is None
+
+
+def test_chats_run_concurrently_and_in_order() -> None:
+    events: List[Tuple[str, int, int]] = []
+
+    async def handle(update: Update, delay: float) -> None:
+        assert update.effective_chat is not None
+        chat_id = update.effective_chat.id
+        events.append(("start", chat_id, update.update_id))
+        await asyncio.sleep(delay)
+        events.append(("end", chat_id, update.update_id))
+
+    async def run() -> PerChatUpdateProcessor:
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+        # the first update of chat 1 is the slowest, later ones must wait
+        work: List[Any] = [
+            (message(1, 1), 0.05),
+            (message(2, 1), 0.0),
+            (message(3, 2), 0.01),
+            (message(4, 1), 0.0),
+            (message(5, 2), 0.0),
+        ]
+        await asyncio.gather(
+            *(
+                processor.process_update(update, handle(update, delay))
+                for update, delay in work
+            ),
+        )
+        return processor
+
+    processor = asyncio.run(run())
+    for chat_id in (1, 2):
+        starts = [u for kind, c, u in events if kind == "start" and c == chat_id]
+        assert starts == sorted(starts)
+        running = 0
+        for kind, c, _ in events:
+            if c == chat_id:
+                running += 1 if kind == "start" else -1
+                assert running <= 1
+    # chat 2 was done before the slow first update of chat 1
+    assert events.index(("end", 2, 5)) < events.index(("end", 1, 1))
+    assert (processor.handled, processor.active_chats) == (5, 0)
+    assert processor.serialized >= 2
+
+
+def test_a_busy_chat_doesnt_take_every_slot() -> None:
+    async def run() -> List[int]:
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+        release = asyncio.Event()
+        done: List[int] = []
+
+        async def handle(update_id: int) -> None:
+            if update_id < 10:
+                await release.wait()
+            done.append(update_id)
+
+        busy = [
+            asyncio.create_task(processor.process_update(message(i, 1), handle(i)))
+            for i in range(5)
+        ]
+        await processor.process_update(message(10, 2), handle(10))
+        await processor.process_update(message(11, 3), handle(11))
+        release.set()
+        await asyncio.gather(*busy)
+        return done
+
+    assert asyncio.run(run()) == [10, 11, 0, 1, 2, 3, 4]
+
+
+def test_limits_are_validated() -> None:
+    with pytest.raises(ValueError):
+        PerChatUpdateProcessor(max_concurrent_updates=0)
+    with pytest.raises(ValueError):
+        PerChatUpdateProcessor(max_concurrent_updates=10, max_pending_updates=5)
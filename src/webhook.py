@@ -0,0 +1,111 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+
+# Receives updates pushed by the Bot API and puts them on the application's
+# update queue, where run_polling's updater would have put them. Every
+# request must carry the secret token, so nobody else can push updates; with
+# no secret given, a random one is registered along with url.
+class WebhookServer:
+    def __init__(
+        self,
+        application: Application,
+        listen: str,
+        port: int,
+        path: str = "/webhook",
+        url: Optional[str] = None,
+        secret_token: Optional[str] = None,
+    ):
+        self.application = application
+        self.path = path
+        # the public url registered with setWebhook, None to keep the current one
+        self.url = url
+        if not secret_token:
+            if not url:
+                raise ValueError(
+                    "a webhook needs a secret token, or a url to register a new one",
+                )
+            secret_token = secrets.token_urlsafe(32)
+        self.secret_token = secret_token
+        self.server = HTTPServer(listen, port, self.handle)
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, request: Request) -> Response:
+        if request.path != self.path:
+            return Response.text(404)
+        if request.method != "POST":
+            return Response.text(405)
+        token = request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            logger.warning("webhook request with a wrong secret token")
+            return Response.text(403)
+
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as error:
+            self.rejected += 1
+            logger.warning(f"invalid webhook update: {error}")
+            return Response.text(400)
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return Response.text(200)
+
+    async def start(self) -> None:
+        await self.server.start()
+        if self.url:
+            await self.application.bot.set_webhook(
+                url=self.url,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"webhook set to {self.url}")
+
+    async def stop(self) -> None:
+        # the webhook stays registered, the Bot API keeps updates until we're back
+        await self.server.stop()
+
+    def run(self) -> None:
+        # mirrors Application.run_polling, so stop_running() works the same
+        loop = asyncio.get_event_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, loop.stop)
+
+        application = self.application
+        try:
+            loop.run_until_complete(application.initialize())
+            if application.post_init:
+                loop.run_until_complete(application.post_init(application))
+            loop.run_until_complete(application.start())
+            loop.run_until_complete(self.start())
+            loop.run_forever()
+        except (KeyboardInterrupt, SystemExit):
+            logger.debug("webhook server received stop signal")
+        finally:
+            try:
+                loop.run_until_complete(self.stop())
+                if application.running:
+                    loop.run_until_complete(application.stop())
+                    if application.post_stop:
+                        loop.run_until_complete(application.post_stop(application))
+                loop.run_until_complete(application.shutdown())
+                if application.post_shutdown:
+                    loop.run_until_complete(application.post_shutdown(application))
+            finally:
+                loop.close()
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from telegram import Update
+from telegram.ext import Application
+
+from webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "text": "/start",
+    },
+}
+
+
+def test_webhook_validates_and_queues_updates() -> None:
+    async def run() -> None:
+        application = Application.builder().token("1:token").build()
+        webhook = WebhookServer(application, "127.0.0.1", 0, secret_token="secret")
+        await webhook.start()
+        url = f"http://127.0.0.1:{webhook.server.port}"
+        body = json.dumps(UPDATE)
+        async with httpx.AsyncClient(base_url=url) as client:
+            response = await client.post("/webhook", content=body)
+            assert response.status_code == 403
+            response = await client.post(
+                "/webhook",
+                content=body,
+                headers={SECRET_TOKEN_HEADER: "wrong"},
+            )
+            assert response.status_code == 403
+            response = await client.post(
+                "/other",
+                content=body,
+                headers={SECRET_TOKEN_HEADER: "secret"},
+            )
+            assert response.status_code == 404
+            response = await client.post(
+                "/webhook",
+                content="not json",
+                headers={SECRET_TOKEN_HEADER: "secret"},
+            )
+            assert response.status_code == 400
+            response = await client.post(
+                "/webhook",
+                content=body,
+                headers={SECRET_TOKEN_HEADER: "secret"},
+            )
+            assert response.status_code == 200
+        await webhook.stop()
+
+        update = application.update_queue.get_nowait()
+        assert isinstance(update, Update) and update.message is not None
+        assert update.message.text == "/start"
+        assert application.update_queue.empty()
+        assert (webhook.received, webhook.rejected) == (1, 3)
+
+    asyncio.run(run())
+
+
+def test_webhook_requires_a_secret_token() -> None:
+    application = Application.builder().token("1:token").build()
+    with pytest.raises(ValueError):
+        WebhookServer(application, "127.0.0.1", 0)
+    webhook = WebhookServer(
+        application,
+        "127.0.0.1",
+        0,
+        url="https://example.com/webhook",
+    )
+    assert len(webhook.secret_token) >= 32